@@ -0,0 +1,115 @@
+# Pre-aggregated cubes, built once per data load.
+# A cube is a nested dict following the key columns, e.g. cube[state][year]
+# or cube[state][crop][year], whose leaves are (sum, count, min, max) tuples.
+# Means over any subset of years are then exact: sum of sums / sum of counts.
+#
+# Each dataset is rolled up district -> state -> national. Only the district
+# level is aggregated from raw rows; every parent level is merged from its
+# children's (sum, count, min, max), never recomputed from the rows. Appended
+# rows are rolled up on their own and merged in the same way.
+
+from metrics import metrics
+
+LEVELS = ('district', 'state', 'national')
+ROLLUP_AGGREGATES = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+
+def aggregate(df, keys, measure):
+    # Measures may be stored as float32; accumulate in float64. Grouping on the
+    # categorical key columns works on their integer codes.
+    values = df[measure].astype('float64')
+    return values.groupby([df[key] for key in keys], observed=True).agg(['sum', 'count', 'min', 'max'])
+
+def roll_up(frame, keys):
+    return frame.groupby(level=keys, observed=True).agg(ROLLUP_AGGREGATES)
+
+def nest(frame):
+    cube = {}
+    single = frame.index.nlevels == 1
+    for key, total, count, low, high in zip(frame.index, frame['sum'], frame['count'], frame['min'], frame['max']):
+        if single:
+            key = (key,)
+        node = cube
+        for part in key[:-1]:
+            node = node.setdefault(part, {})
+        node[key[-1]] = (float(total), int(count), float(low), float(high))
+    return cube
+
+def build_rollup(df, measure, by=()):
+    return rollup_from(aggregate(df, ['state', 'district'] + list(by) + ['year'], measure), by)
+
+def rollup_from(district, by=()):
+    # The rollup of a district-level aggregate, however that was computed.
+    by = list(by)
+    state = roll_up(district, ['state'] + by + ['year'])
+    national = roll_up(state, by + ['year'])
+    return {'district': nest(district), 'state': nest(state), 'national': nest(national)}
+
+def build_rollups(crop_df, rainfall_df, temp_df):
+    return {
+        'crop': build_rollup(crop_df, 'production volume', by=['crop type']),
+        'rainfall': build_rollup(rainfall_df, 'rainfall mm'),
+        'temperature': build_rollup(temp_df, 'avg temperature'),
+    }
+
+def merge_stats(a, b):
+    return (a[0] + b[0], a[1] + b[1], min(a[2], b[2]), max(a[3], b[3]))
+
+def merge_cube(cube, delta):
+    # A new cube holding both. `cube` is left as it is and shares every
+    # subtree `delta` does not reach, so only the touched paths are copied.
+    merged = dict(cube)
+    for key, node in delta.items():
+        old = cube.get(key)
+        if old is None:
+            merged[key] = node
+        elif isinstance(node, tuple):
+            merged[key] = merge_stats(old, node)
+        else:
+            merged[key] = merge_cube(old, node)
+    return merged
+
+def merge_rollups(rollups, delta):
+    # Folds the rollups of appended rows into existing ones, level by level.
+    return {name: {level: merge_cube(rollup[level], delta[name][level]) for level in LEVELS}
+            for name, rollup in rollups.items()}
+
+def cube_stats(node, years=None):
+    if not node:
+        return 0.0, 0, None, None
+    # years=None means every year; an empty tuple (a range outside the data)
+    # matches nothing.
+    if years is not None:
+        cells = [node[year] for year in years if year in node]
+    else:
+        cells = node.values()
+    total = 0.0
+    count = 0
+    low = None
+    high = None
+    for cell_sum, cell_count, cell_min, cell_max in cells:
+        total += cell_sum
+        count += cell_count
+        if low is None or cell_min < low:
+            low = cell_min
+        if high is None or cell_max > high:
+            high = cell_max
+    metrics.count('rows_aggregated', count)
+    return total, count, low, high
+
+def cube_totals(node, years=None):
+    total, count, _, _ = cube_stats(node, years)
+    return total, count
+
+def cube_mean(node, years=None):
+    total, count = cube_totals(node, years)
+    return total / count if count else None
+
+def rank_crops(crop_nodes, years=None, k=3, bottom=False):
+    # Highest mean first; with `bottom`, the k lowest, lowest first.
+    means = []
+    for crop in sorted(crop_nodes):
+        avg = cube_mean(crop_nodes[crop], years)
+        if avg is not None:
+            means.append((crop, avg))
+    means.sort(key=lambda item: -item[1])
+    return means[::-1][:k] if bottom else means[:k]
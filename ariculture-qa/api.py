@@ -0,0 +1,474 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from engine import DISTRIBUTION_HANDLERS, RANKED_HANDLERS, TABLES, Intent, QAEngine, json_ready
+from explorer import MAX_PAGE_ROWS, PAGE_ROWS, pa
+from metrics import metrics
+
+# JSON HTTP API for the Q&A engine.
+#
+# `app` is a plain ASGI application (serve it with any ASGI server, e.g.
+# `uvicorn api:app`), and `python api.py` runs it on a small built-in asyncio
+# HTTP/1.1 server so no extra dependency is needed. One engine is loaded per
+# process and shared by all requests; answers are computed in a bounded
+# thread pool so the event loop only does I/O.
+#
+#   GET  /health
+#   GET  /metrics                      Prometheus text
+#   POST /answer         {"question": "..."}
+#   POST /answer_many    {"questions": ["...", ...]}
+#   GET  /rainfall?states=Karnataka,Tamil Nadu&years=2015,2018-2021
+#   GET  /temperature?states=...&years=...
+#   GET  /crops?states=...&crops=Rice,Wheat&years=...
+#   GET  /crops?states=...&k=5&order=bottom      (no states: national ranking)
+#   GET  /analysis?states=...&crops=...&years=...
+#   GET  /trends?measure=rainfall|temperature|crops&years=...   every series' trend
+#   GET  /distribution?measure=rainfall|temperature|crops&states=...&crops=...&years=...&percentiles=10,50,90
+#   GET  /rows?dataset=crop&states=...&crops=...&years=...&districts=...&offset=0&limit=50
+#   GET  /rows?dataset=rainfall&question=...     filters taken from a question
+#   GET  /rows.csv?...   /rows.arrow?...         the whole selection, streamed
+#
+# /rows pages the raw rows matching the filters and reports the rows behind
+# each aggregate (see explorer.py). The exports are sent chunk by chunk
+# (chunked transfer encoding on the built-in server), each chunk produced in
+# the thread pool.
+
+log = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get('AGRI_QA_API_WORKERS', os.cpu_count() or 4))
+# Requests beyond this many in flight are rejected with 503 rather than
+# queueing without bound.
+MAX_PENDING = int(os.environ.get('AGRI_QA_API_MAX_PENDING', WORKERS * 16))
+# How often requests check for new data (appended fragments, changed CSVs or
+# a newer shared snapshot); the check itself is a few stat calls.
+REFRESH_SECONDS = float(os.environ.get('AGRI_QA_REFRESH_SECONDS', 5))
+
+ENDPOINT_HANDLERS = {
+    '/rainfall': 'compare_rainfall',
+    '/temperature': 'analyze_temperature',
+    '/crops': 'analyze_crop_production',
+    '/analysis': 'complex_analysis',
+}
+
+# /trends and /distribution measure -> dataset
+TREND_MEASURES = {'rainfall': 'rainfall', 'temperature': 'temperature', 'crops': 'crop'}
+
+# export path -> content type
+EXPORTS = {'/rows.csv': 'text/csv; charset=utf-8', '/rows.arrow': 'application/vnd.apache.arrow.stream'}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class Streamed:
+    # A response body sent piece by piece as `pieces` (an iterator of str or
+    # bytes) produces it, without a Content-Length. `release` is called by
+    # close(), once, whether or not the body was sent in full; whoever
+    # writes the response closes it.
+    def __init__(self, content_type, pieces, release=None):
+        self.content_type = content_type
+        self.pieces = pieces
+        self.release = release
+
+    def close(self):
+        release, self.release = self.release, None
+        if release is not None:
+            release()
+
+def _split(query, name):
+    values = []
+    for raw in query.get(name, []):
+        values.extend(part.strip() for part in raw.split(',') if part.strip())
+    return values
+
+class QAService:
+    def __init__(self, engine=None, workers=WORKERS, max_pending=MAX_PENDING):
+        self.engine = engine
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='qa-worker')
+        self.max_pending = max_pending
+        self.pending = 0
+        self.next_refresh = 0.0
+
+    async def startup(self):
+        if self.engine is None:
+            loop = asyncio.get_running_loop()
+            self.engine = await loop.run_in_executor(self.executor, QAEngine)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def _admit(self):
+        # Takes one of the `max_pending` slots, or turns the request away.
+        if self.pending >= self.max_pending:
+            raise HTTPError(503, 'server busy')
+        self.pending += 1
+
+    def _release(self):
+        self.pending -= 1
+
+    async def run(self, fn, *args):
+        self._admit()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self._release()
+
+    def _intent_from_query(self, handler, query):
+        known_states = set(self.engine.all_states)
+        known_crops = set(self.engine.all_crops)
+        states = _split(query, 'states')
+        crops = _split(query, 'crops')
+        unknown = [s for s in states if s not in known_states] + [c for c in crops if c not in known_crops]
+        if unknown:
+            raise HTTPError(400, f"unknown names: {', '.join(unknown)}")
+        years = _years(self.engine, query)
+        rank = Intent._field_defaults['rank']
+        if handler in RANKED_HANDLERS and ('k' in query or 'order' in query):
+            order = query.get('order', ['top'])[0]
+            try:
+                k = int(query.get('k', [rank[0]])[0])
+            except ValueError:
+                k = 0
+            if k < 1 or order not in ('top', 'bottom'):
+                raise HTTPError(400, 'k must be a positive integer and order top or bottom')
+            rank = (k, order == 'bottom')
+        percentiles = ()
+        if handler in DISTRIBUTION_HANDLERS and 'percentiles' in query:
+            try:
+                percentiles = tuple(sorted({int(p) for p in _split(query, 'percentiles')}))
+            except ValueError:
+                percentiles = (0,)
+            if not percentiles or not all(0 < p < 100 for p in percentiles):
+                raise HTTPError(400, 'percentiles must be integers between 1 and 99')
+        return Intent(handler, tuple(sorted(states)), tuple(sorted(crops)), years, (), rank, percentiles)
+
+    def _stream(self, content_type, pieces):
+        # A streamed body holds a pending slot from here, before any header
+        # is sent, until the response is closed.
+        self._admit()
+        return Streamed(content_type, pieces, self._release)
+
+    async def iterate(self, streamed):
+        # The pieces of a streamed body as bytes, each produced in the pool
+        # under the slot the stream took. Empty pieces are dropped (an empty
+        # chunk ends a chunked body).
+        loop = asyncio.get_running_loop()
+        pieces = iter(streamed.pieces)
+        while True:
+            piece = await loop.run_in_executor(self.executor, next, pieces, None)
+            if piece is None:
+                return
+            if piece:
+                yield piece.encode() if isinstance(piece, str) else piece
+
+    def _selection(self, query):
+        dataset = query.get('dataset', ['crop'])[0]
+        if dataset not in TABLES:
+            raise HTTPError(400, f"dataset must be one of {', '.join(TABLES)}")
+        if 'question' in query:
+            return self.engine.explore_question(query['question'][0], dataset)
+        states, crops, districts = _split(query, 'states'), _split(query, 'crops'), _split(query, 'districts')
+        unknown = [s for s in states if s not in set(self.engine.all_states)] + \
+            [c for c in crops if c not in set(self.engine.all_crops)] + \
+            [d for d in districts if d not in set(self.engine.all_districts)]
+        if unknown:
+            raise HTTPError(400, f"unknown names: {', '.join(unknown)}")
+        years = _years(self.engine, query)
+        return self.engine.explore(dataset, sorted(states), sorted(crops), years, sorted(districts))
+
+    async def rows(self, path, query):
+        query = parse_qs(query)
+        selection = await self.run(self._selection, query)
+        if not selection.rows_kept:
+            raise HTTPError(501, 'raw rows are not kept when the data is aggregated within a memory budget')
+        if path == '/rows.csv':
+            return 200, self._stream(EXPORTS[path], selection.csv_chunks())
+        if path == '/rows.arrow':
+            if pa is None:
+                raise HTTPError(501, 'Arrow export needs pyarrow')
+            return 200, self._stream(EXPORTS[path], selection.arrow_chunks())
+        try:
+            offset = int(query.get('offset', [0])[0])
+            limit = int(query.get('limit', [PAGE_ROWS])[0])
+        except ValueError:
+            offset = limit = -1
+        if offset < 0 or limit < 0:
+            raise HTTPError(400, 'offset and limit must be non-negative integers')
+        page = await self.run(selection.page, offset, limit)
+        groups = await self.run(selection.groups)
+        return 200, json_ready({
+            'dataset': selection.dataset,
+            'states': list(selection.states),
+            'crops': list(selection.crops),
+            'years': list(selection.years) if selection.years is not None else None,
+            'districts': list(selection.districts),
+            'total': selection.total,
+            'offset': offset,
+            'limit': min(limit, MAX_PAGE_ROWS),
+            'columns': [str(column) for column in page.columns],
+            'rows': page.to_dict('records'),
+            'groups': groups,
+        })
+
+    async def refresh(self):
+        # Runs in the pool; requests already computing keep the state they
+        # started with, later ones see the new data.
+        if time.monotonic() < self.next_refresh:
+            return
+        self.next_refresh = time.monotonic() + REFRESH_SECONDS
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.engine.refresh)
+
+    async def handle(self, method, path, query, body):
+        await self.refresh()
+        if path == '/health':
+            return 200, {'status': 'ok', 'generation': self.engine.generation}
+        if path == '/metrics':
+            return 200, metrics.render()
+        if path == '/answer':
+            if method != 'POST':
+                raise HTTPError(405, 'use POST')
+            question = _json_body(body).get('question')
+            if not isinstance(question, str) or not question.strip():
+                raise HTTPError(400, '"question" must be a non-empty string')
+            return 200, json_ready(await self.run(self.engine.answer_result, question))
+        if path == '/answer_many':
+            if method != 'POST':
+                raise HTTPError(405, 'use POST')
+            questions = _json_body(body).get('questions')
+            if not isinstance(questions, list) or not all(isinstance(q, str) for q in questions):
+                raise HTTPError(400, '"questions" must be a list of strings')
+            return 200, {'answers': json_ready(await self.run(self.engine.answer_many_results, questions))}
+        if path in ENDPOINT_HANDLERS:
+            if method != 'GET':
+                raise HTTPError(405, 'use GET')
+            intent = self._intent_from_query(ENDPOINT_HANDLERS[path], parse_qs(query))
+            return 200, json_ready(await self.run(self.engine.answer_intent, intent))
+        if path == '/trends':
+            if method != 'GET':
+                raise HTTPError(405, 'use GET')
+            query = parse_qs(query)
+            measure = query.get('measure', ['rainfall'])[0]
+            if measure not in TREND_MEASURES:
+                raise HTTPError(400, f"measure must be one of {', '.join(TREND_MEASURES)}")
+            years = _years(self.engine, query)
+            trends = await self.run(self.engine.trend_dashboard, TREND_MEASURES[measure], years)
+            return 200, json_ready({'measure': measure, 'trends': trends})
+        if path == '/distribution':
+            if method != 'GET':
+                raise HTTPError(405, 'use GET')
+            query = parse_qs(query)
+            measure = query.get('measure', ['rainfall'])[0]
+            if measure not in TREND_MEASURES:
+                raise HTTPError(400, f"measure must be one of {', '.join(TREND_MEASURES)}")
+            intent = self._intent_from_query(f'{TREND_MEASURES[measure]}_distribution', query)
+            return 200, json_ready(await self.run(self.engine.answer_intent, intent))
+        if path == '/rows' or path in EXPORTS:
+            if method != 'GET':
+                raise HTTPError(405, 'use GET')
+            return await self.rows(path, query)
+        raise HTTPError(404, 'not found')
+
+def _years(engine, query):
+    # Years and ranges like 2018-2021, read as in questions: a reversed range
+    # is swapped and ranges are clamped to the years in the data.
+    if 'years' not in query:
+        return None
+    years, ranges = [], []
+    try:
+        for part in _split(query, 'years'):
+            start, _, end = part.partition('-')
+            if end:
+                ranges.append(tuple(sorted((int(start), int(end)))))
+            else:
+                years.append(int(start))
+    except ValueError:
+        raise HTTPError(400, 'years must be integers or ranges like 2018-2021')
+    return engine.span_years(years, ranges)
+
+def _json_body(body):
+    try:
+        payload = json.loads(body or b'{}')
+    except ValueError:
+        raise HTTPError(400, 'body must be JSON')
+    if not isinstance(payload, dict):
+        raise HTTPError(400, 'body must be a JSON object')
+    return payload
+
+def _encode(status, payload):
+    if isinstance(payload, Streamed):
+        return status, payload.content_type, payload
+    if isinstance(payload, str):
+        return status, 'text/plain; version=0.0.4', payload.encode()
+    return status, 'application/json', json.dumps(payload, ensure_ascii=False).encode()
+
+async def respond(service, method, path, query, body):
+    try:
+        status, payload = await service.handle(method, path, query, body)
+    except HTTPError as exc:
+        status, payload = exc.status, {'error': exc.message}
+    except Exception:
+        log.exception("%s %s failed", method, path)
+        metrics.count('requests_failed')
+        status, payload = 500, {'error': 'internal error'}
+    return _encode(status, payload)
+
+def create_app(service=None):
+    service = service or QAService()
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await service.startup()
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    service.shutdown()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        if service.engine is None:
+            await service.startup()
+        status, content_type, payload = await respond(
+            service, scope['method'], scope['path'], scope.get('query_string', b'').decode(), body)
+        if isinstance(payload, Streamed):
+            try:
+                await send({'type': 'http.response.start', 'status': status,
+                            'headers': [(b'content-type', content_type.encode())]})
+                async for piece in service.iterate(payload):
+                    await send({'type': 'http.response.body', 'body': piece, 'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+            finally:
+                payload.close()
+            return
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', content_type.encode()), (b'content-length', str(len(payload)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+
+    app.service = service
+    return app
+
+app = create_app()
+
+# Built-in HTTP/1.1 server (keep-alive, Content-Length bodies only).
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 501: 'Not Implemented',
+           503: 'Service Unavailable'}
+MAX_BODY = 1 << 20
+
+async def _serve_connection(service, reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, target, version = request_line.decode('latin-1').split()
+            except ValueError:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            try:
+                length = int(headers.get('content-length') or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                # The body's end is unknown, so the connection cannot go on.
+                status, content_type, payload = _encode(400, {'error': 'invalid Content-Length'})
+                keep_alive = False
+            elif length > MAX_BODY:
+                status, content_type, payload = _encode(413, {'error': 'body too large'})
+                keep_alive = False
+            else:
+                body = await reader.readexactly(length) if length else b''
+                path, _, query = target.partition('?')
+                status, content_type, payload = await respond(service, method, path, query, body)
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+
+            if isinstance(payload, Streamed):
+                # Chunked for HTTP/1.1; older clients read to the close.
+                chunked = version == 'HTTP/1.1'
+                keep_alive = keep_alive and chunked
+                encoding = "Transfer-Encoding: chunked\r\n" if chunked else ""
+                try:
+                    writer.write(
+                        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                        f"Content-Type: {content_type}\r\n{encoding}"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1'))
+                    async for piece in service.iterate(payload):
+                        writer.write(b'%x\r\n%s\r\n' % (len(piece), piece) if chunked else piece)
+                        await writer.drain()
+                    if chunked:
+                        writer.write(b'0\r\n\r\n')
+                    await writer.drain()
+                finally:
+                    payload.close()
+                if not keep_alive:
+                    break
+                continue
+
+            writer.write(
+                f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + payload)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def start_server(host='127.0.0.1', port=8000, service=None):
+    service = service or app.service
+    await service.startup()
+    return await asyncio.start_server(lambda r, w: _serve_connection(service, r, w), host, port)
+
+async def serve(host='127.0.0.1', port=8000):
+    server = await start_server(host, port)
+    print(f"Serving on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Q&A engine as a JSON HTTP API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
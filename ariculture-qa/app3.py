@@ -1,7 +1,11 @@
+import time
+
 import streamlit as st
-import pandas as pd
-import numpy as np
-import re
+
+from manifest import read_manifest
+from metrics import metrics
+
+run_start = time.perf_counter()
 
 # Page config with theme
 st.set_page_config(
@@ -74,171 +78,30 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Load data
-@st.cache_data
-def load_data():
-    crop_df = pd.read_csv('crop_production.csv')
-    rainfall_df = pd.read_csv('rainfall_data.csv')
-    temp_df = pd.read_csv('temperature_data.csv')
-    
-    # Clean column names
-    crop_df.columns = [col.lower().replace('_', ' ') for col in crop_df.columns]
-    rainfall_df.columns = [col.lower().replace('_', ' ') for col in rainfall_df.columns]
-    temp_df.columns = [col.lower().replace('_', ' ') for col in temp_df.columns]
-    
-    return crop_df, rainfall_df, temp_df
-
-crop_df, rainfall_df, temp_df = load_data()
+@st.cache_resource
+def get_engine():
+    # Imported here: pandas and the data are only loaded once a question
+    # needs them, the page shell renders from the manifest.
+    from engine import QAEngine
+    return QAEngine()
+
+def loaded_engine():
+    engine = get_engine()
+    # Picks up appended fragments or a newer shared snapshot, if any.
+    engine.refresh()
+    st.session_state.engine_loaded = True
+    return engine
+
+manifest = read_manifest()
+if manifest is None:
+    # No manifest yet, or the CSVs changed since it was written: loading the
+    # engine rebuilds it.
+    manifest = loaded_engine().manifest
 
 # Get all available states dynamically
-all_states = sorted(list(set(crop_df['state'].unique()) | set(rainfall_df['state'].unique()) | set(temp_df['state'].unique())))
-all_crops = sorted(crop_df['crop type'].unique())
-
-# Question processing functions (same as before)
-def extract_states(question):
-    found_states = []
-    for state in all_states:
-        if state.lower() in question.lower():
-            found_states.append(state)
-    return found_states
-
-def extract_crops(question):
-    found_crops = []
-    for crop in all_crops:
-        if crop.lower() in question.lower():
-            found_crops.append(crop)
-    return found_crops
-
-def extract_years(question):
-    years = re.findall(r'\b(20\d{2})\b', question)
-    return [int(year) for year in years] if years else []
-
-def compare_rainfall(question):
-    states = extract_states(question)
-    years = extract_years(question)
-    
-    if not states:
-        return "Please specify states to compare."
-    
-    result = "## 🌧️ Rainfall Comparison\n\n"
-    for state in states:
-        state_data = rainfall_df[rainfall_df['state'] == state]
-        if years:
-            state_data = state_data[state_data['year'].isin(years)]
-        
-        if not state_data.empty:
-            avg_rainfall = state_data['rainfall mm'].mean()
-            result += f"**{state}**: Average rainfall = {avg_rainfall:.2f} mm\n\n"
-        else:
-            result += f"**{state}**: No rainfall data available\n\n"
-    
-    result += f"*Source: {rainfall_df.shape[0]} records from India Meteorological Department*"
-    return result
-
-def analyze_crop_production(question):
-    states = extract_states(question)
-    crops = extract_crops(question)
-    years = extract_years(question)
-    
-    if not states:
-        return "Please specify states to analyze."
-    
-    result = "## 🌾 Crop Production Analysis\n\n"
-    for state in states:
-        state_data = crop_df[crop_df['state'] == state]
-        if years:
-            state_data = state_data[state_data['year'].isin(years)]
-        
-        if not state_data.empty:
-            if crops:
-                crop_data = state_data[state_data['crop type'].isin(crops)]
-                result += f"**{state}** - Production for specified crops:\n"
-                for crop in crops:
-                    crop_prod = crop_data[crop_data['crop type'] == crop]['production volume']
-                    if not crop_prod.empty:
-                        avg_prod = crop_prod.mean()
-                        result += f"  - {crop}: {avg_prod:.2f} tons\n"
-            else:
-                top_crops = state_data.groupby('crop type')['production volume'].mean().nlargest(3)
-                result += f"**{state}** - Top 3 crops by production:\n"
-                for crop, production in top_crops.items():
-                    result += f"  - {crop}: {production:.2f} tons\n"
-            result += "\n"
-        else:
-            result += f"**{state}**: No crop data available\n\n"
-    
-    result += f"*Source: {crop_df.shape[0]} records from Ministry of Agriculture*"
-    return result
-
-def analyze_temperature(question):
-    states = extract_states(question)
-    years = extract_years(question)
-    
-    if not states:
-        return "Please specify states to analyze."
-    
-    result = "## 🌡️ Temperature Analysis\n\n"
-    for state in states:
-        state_data = temp_df[temp_df['state'] == state]
-        if years:
-            state_data = state_data[state_data['year'].isin(years)]
-        
-        if not state_data.empty:
-            avg_temp = state_data['avg temperature'].mean()
-            result += f"**{state}**: Average temperature = {avg_temp:.2f}°C\n\n"
-        else:
-            result += f"**{state}**: No temperature data available\n\n"
-    
-    result += f"*Source: {temp_df.shape[0]} records from India Meteorological Department*"
-    return result
-
-def complex_analysis(question):
-    states = extract_states(question)
-    crops = extract_crops(question)
-    years = extract_years(question)
-    
-    if len(states) < 2:
-        return "Please specify at least 2 states for comparison."
-    
-    result = "## 📊 Cross-Domain Analysis\n\n"
-    
-    # Rainfall comparison
-    result += "### Rainfall Comparison\n"
-    for state in states:
-        rain_data = rainfall_df[rainfall_df['state'] == state]
-        if years:
-            rain_data = rain_data[rain_data['year'].isin(years)]
-        if not rain_data.empty:
-            avg_rain = rain_data['rainfall mm'].mean()
-            result += f"- **{state}**: {avg_rain:.2f} mm\n"
-    result += "\n"
-    
-    # Temperature comparison
-    result += "### Temperature Comparison\n"
-    for state in states:
-        temp_data = temp_df[temp_df['state'] == state]
-        if years:
-            temp_data = temp_data[temp_data['year'].isin(years)]
-        if not temp_data.empty:
-            avg_temp = temp_data['avg temperature'].mean()
-            result += f"- **{state}**: {avg_temp:.2f}°C\n"
-    result += "\n"
-    
-    # Crop production
-    if crops:
-        result += "### Crop Production\n"
-        for crop in crops:
-            result += f"**{crop}**:\n"
-            for state in states:
-                crop_data = crop_df[(crop_df['state'] == state) & (crop_df['crop type'] == crop)]
-                if years:
-                    crop_data = crop_data[crop_data['year'].isin(years)]
-                if not crop_data.empty:
-                    avg_prod = crop_data['production volume'].mean()
-                    result += f"  - {state}: {avg_prod:.2f} tons\n"
-            result += "\n"
-    
-    result += "*Sources: Integrated data from Ministry of Agriculture & IMD*"
-    return result
+all_states = manifest['states']
+all_crops = manifest['crops']
+records = manifest['records']
 
 # Main app with enhanced UI
 st.markdown('<div class="main-header">🌾 Agriculture & Climate Q&A System</div>', unsafe_allow_html=True)
@@ -248,11 +111,11 @@ st.markdown('<div class="sub-header">Ask natural language questions about crops,
 st.sidebar.markdown("### 📈 Data Overview")
 col1, col2, col3 = st.sidebar.columns(3)
 with col1:
-    st.markdown(f'<div class="metric-card"><h4>🌧️ Rainfall</h4><h3>{rainfall_df.shape[0]}</h3><small>Records</small></div>', unsafe_allow_html=True)
+    st.markdown(f'<div class="metric-card"><h4>🌧️ Rainfall</h4><h3>{records["rainfall"]}</h3><small>Records</small></div>', unsafe_allow_html=True)
 with col2:
-    st.markdown(f'<div class="metric-card"><h4>🌾 Crops</h4><h3>{crop_df.shape[0]}</h3><small>Records</small></div>', unsafe_allow_html=True)
+    st.markdown(f'<div class="metric-card"><h4>🌾 Crops</h4><h3>{records["crop"]}</h3><small>Records</small></div>', unsafe_allow_html=True)
 with col3:
-    st.markdown(f'<div class="metric-card"><h4>🌡️ Temperature</h4><h3>{temp_df.shape[0]}</h3><small>Records</small></div>', unsafe_allow_html=True)
+    st.markdown(f'<div class="metric-card"><h4>🌡️ Temperature</h4><h3>{records["temperature"]}</h3><small>Records</small></div>', unsafe_allow_html=True)
 
 # Sample questions with better design
 st.sidebar.markdown("### 💡 Try These Questions")
@@ -260,7 +123,11 @@ sample_questions = [
     "Compare rainfall in Karnataka and Tamil Nadu",
     "Show top crops in Maharashtra and Punjab", 
     "Analyze temperature in Uttar Pradesh and Bihar",
-    "Compare everything for Karnataka and West Bengal with Rice and Wheat"
+    "Compare everything for Karnataka and West Bengal with Rice and Wheat",
+    "How does rainfall affect Rice in West Bengal and Punjab",
+    "Is rainfall in Punjab increasing?",
+    "Forecast Rice production in West Bengal for the next 3 years",
+    "Median and P90 rainfall in Punjab, with drought years"
 ]
 
 for i, q in enumerate(sample_questions):
@@ -271,7 +138,12 @@ for i, q in enumerate(sample_questions):
 st.sidebar.markdown("### 📁 Available Data")
 st.sidebar.markdown(f'<div class="card"><strong>States</strong><br>{", ".join(all_states)}</div>', unsafe_allow_html=True)
 st.sidebar.markdown(f'<div class="card"><strong>Crops</strong><br>{", ".join(all_crops)}</div>', unsafe_allow_html=True)
-st.sidebar.markdown(f'<div class="card"><strong>Years Available</strong><br>2015 - 2024</div>', unsafe_allow_html=True)
+st.sidebar.markdown(f'<div class="card"><strong>Years Available</strong><br>{manifest["first_year"]} - {manifest["last_year"]}</div>', unsafe_allow_html=True)
+debug_timings = st.sidebar.checkbox("⏱️ Show debug timings")
+first_paint = time.perf_counter() - run_start
+metrics.observe('first_paint', first_paint)
+if debug_timings:
+    st.sidebar.caption(f"First paint: {first_paint * 1000:.1f} ms")
 
 # Main content area
 col1, col2 = st.columns([2, 1])
@@ -300,44 +172,48 @@ if question:
     st.markdown('<div class="answer-section">', unsafe_allow_html=True)
     st.subheader("🔍 Analysis Results")
     
-    question_lower = question.lower()
-    
-    if any(word in question_lower for word in ['compare', 'comparison']):
-        if 'rainfall' in question_lower and 'temperature' in question_lower:
-            answer = complex_analysis(question)
-        elif 'rainfall' in question_lower:
-            answer = compare_rainfall(question)
-        elif 'temperature' in question_lower:
-            answer = analyze_temperature(question)
-        else:
-            answer = complex_analysis(question)
-    elif 'crop' in question_lower or 'production' in question_lower:
-        answer = analyze_crop_production(question)
-    elif 'temperature' in question_lower:
-        answer = analyze_temperature(question)
-    elif 'rainfall' in question_lower:
-        answer = compare_rainfall(question)
-    else:
-        answer = complex_analysis(question)
-    
-    st.markdown(answer)
+    with metrics.trace(debug_timings) as trace:
+        engine = loaded_engine()
+        # Sections are written as the engine produces them, so the first
+        # part of a long analysis shows before the rest is computed.
+        answer = st.write_stream(engine.stream(question))
     st.markdown('</div>', unsafe_allow_html=True)
+    metrics.export()
+    
+    if trace is not None:
+        with st.expander("⏱️ Debug timings", expanded=True):
+            st.markdown(f'<span class="source-badge">Total: {trace.total() * 1000:.3f} ms</span>', unsafe_allow_html=True)
+            import pandas as pd
+            st.dataframe(pd.DataFrame([(name, seconds * 1000) for name, seconds in trace.stages], columns=['stage', 'ms']), use_container_width=True)
+            st.json(trace.counters)
 
-# Data preview with better design
+# Data preview: the rows behind the current question (all rows without one),
+# paged on the server.
 with st.expander("📊 Explore Raw Data", expanded=False):
-    tab1, tab2, tab3 = st.tabs(["🌾 Crop Data", "🌧️ Rainfall Data", "🌡️ Temperature Data"])
-    
-    with tab1:
-        st.markdown(f'<span class="source-badge">Records: {crop_df.shape[0]}</span>', unsafe_allow_html=True)
-        st.dataframe(crop_df.head(10), use_container_width=True)
-    
-    with tab2:
-        st.markdown(f'<span class="source-badge">Records: {rainfall_df.shape[0]}</span>', unsafe_allow_html=True)
-        st.dataframe(rainfall_df.head(10), use_container_width=True)
-    
-    with tab3:
-        st.markdown(f'<span class="source-badge">Records: {temp_df.shape[0]}</span>', unsafe_allow_html=True)
-        st.dataframe(temp_df.head(10), use_container_width=True)
+    if st.session_state.get('engine_loaded') or st.button("Load data"):
+        engine = loaded_engine()
+        from explorer import PAGE_ROWS
+        memory = engine.memory_footprint()
+        tabs = st.tabs(["🌾 Crop Data", "🌧️ Rainfall Data", "🌡️ Temperature Data"])
+        for tab, name in zip(tabs, ['crop', 'rainfall', 'temperature']):
+            with tab:
+                selection = engine.explore_question(question, name) if question else engine.explore(name)
+                st.markdown(f'<span class="source-badge">Records: {engine.records[name]}</span><span class="source-badge">Matching: {selection.total}</span><span class="source-badge">Memory: {memory[name] / 1024:.1f} KB</span>', unsafe_allow_html=True)
+                st.markdown("**Rows behind each aggregate**")
+                st.dataframe(selection.groups(), use_container_width=True)
+                if not selection.rows_kept:
+                    st.info("Raw rows are not kept: the data was aggregated within a memory budget.")
+                    continue
+                pages = max(-(-selection.total // PAGE_ROWS), 1)
+                page = st.number_input("Page", min_value=1, max_value=pages, value=1, key=f"page_{name}")
+                st.dataframe(selection.page((page - 1) * PAGE_ROWS, PAGE_ROWS), use_container_width=True)
+                st.caption(f"Page {page} of {pages}")
+                # A callable is only called when the button is clicked
+                # (Streamlit 1.52+), so no CSV is built on every rerun.
+                st.download_button("📥 Export CSV", selection.csv_bytes, file_name=f"{name}.csv", mime='text/csv',
+                                   key=f"download_{name}")
+    else:
+        st.markdown(f'<span class="source-badge">Crop Records: {records["crop"]}</span><span class="source-badge">Rainfall Records: {records["rainfall"]}</span><span class="source-badge">Temperature Records: {records["temperature"]}</span>', unsafe_allow_html=True)
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,155 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import DATA_DIR, QAEngine, json_ready
+
+# Offline batch answering. Reads questions from a JSONL or CSV file, answers
+# them with the same routing and handlers as the apps, and writes one JSON
+# result per line in input order. Questions are sent to a process pool in
+# chunks. Where processes can fork, the engine is loaded once before the pool
+# starts and every worker inherits it; elsewhere each worker loads its own
+# (or attaches to the shared dataset when AGRI_QA_SHARED_DIR is set). Each
+# chunk is answered with answer_many_results, so repeated intents within a
+# chunk are computed once. A throughput summary is printed to stderr as JSON.
+#
+#   python batch.py questions.jsonl -o answers.jsonl --workers 8
+#   python batch.py questions.csv -o answers.jsonl --baseline last_night.jsonl
+#
+# JSONL input lines are {"question": "...", "id": ...} objects or bare JSON
+# strings; CSV input needs a `question` column (or uses the first column) and
+# may have an `id` column. Without an id, the line number is used.
+
+_engine = None
+# (pid that loaded _engine, seconds it took)
+_load = None
+
+def read_questions(path):
+    records = []
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            column = 'question' if 'question' in (reader.fieldnames or []) else (reader.fieldnames or [None])[0]
+            for line, row in enumerate(reader, start=1):
+                records.append({'id': row.get('id') or line, 'question': row.get(column) or ''})
+        return records
+    with open(path, encoding='utf-8') as f:
+        for line, text in enumerate(f, start=1):
+            if not text.strip():
+                continue
+            value = json.loads(text)
+            if isinstance(value, str):
+                value = {'question': value}
+            records.append({'id': value.get('id', line), 'question': value.get('question') or ''})
+    return records
+
+def _init_worker(data_dir):
+    global _engine, _load
+    start = time.perf_counter()
+    _engine = QAEngine(data_dir)
+    _load = (os.getpid(), time.perf_counter() - start)
+
+def answer_chunk(records):
+    # Runs in a worker. A failing question is answered on its own so it
+    # cannot take the rest of its chunk down with it.
+    questions = [record['question'] for record in records]
+    try:
+        results = _engine.answer_many_results(questions)
+    except Exception:
+        results = []
+        for question in questions:
+            try:
+                results.append(_engine.answer_result(question))
+            except Exception as exc:
+                results.append({'error': f"{type(exc).__name__}: {exc}"})
+    answers = [json_ready(dict(result, id=record['id'], question=record['question']))
+               for record, result in zip(records, results)]
+    return _load, answers
+
+def chunked(records, size):
+    for start in range(0, len(records), size):
+        yield records[start:start + size]
+
+def answer_all(records, data_dir, workers, chunk_size):
+    # Yields ((loading pid, load seconds), answers) per chunk, in input order.
+    if workers <= 1:
+        _init_worker(data_dir)
+        for chunk in chunked(records, chunk_size):
+            yield answer_chunk(chunk)
+        return
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # Loaded once here; forked workers inherit the engine copy-on-write.
+        _init_worker(data_dir)
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+    else:
+        pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(data_dir,))
+    with pool:
+        yield from pool.map(answer_chunk, chunked(records, chunk_size))
+
+def _fingerprint(answer):
+    return json.dumps({key: answer.get(key) for key in ('handler', 'data', 'markdown', 'error')}, sort_keys=True)
+
+def read_baseline(path):
+    baseline = {}
+    with open(path, encoding='utf-8') as f:
+        for text in f:
+            if text.strip():
+                answer = json.loads(text)
+                baseline[str(answer.get('id'))] = _fingerprint(answer)
+    return baseline
+
+def run(input_path, output, data_dir, workers, chunk_size, baseline=None):
+    start = time.perf_counter()
+    records = read_questions(input_path)
+    loads = set()
+    errors = 0
+    changed = []
+    for load, answers in answer_all(records, data_dir, workers, chunk_size):
+        # Forked workers report the parent's single load.
+        loads.add(load)
+        for answer in answers:
+            errors += 'error' in answer
+            if baseline is not None and baseline.get(str(answer['id'])) != _fingerprint(answer):
+                changed.append(answer['id'])
+            output.write(json.dumps(answer, ensure_ascii=False) + '\n')
+    elapsed = time.perf_counter() - start
+    summary = {
+        'questions': len(records),
+        'errors': errors,
+        'workers': workers,
+        'chunk_size': chunk_size,
+        'elapsed_s': elapsed,
+        'questions_per_second': len(records) / elapsed if elapsed else None,
+        'engine_loads': len(loads),
+        'engine_load_s_max': max((seconds for _, seconds in loads), default=0.0),
+    }
+    if baseline is not None:
+        summary['changed'] = len(changed)
+        summary['changed_ids'] = changed[:50]
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a file of questions across all cores.")
+    parser.add_argument('input', help="questions as .jsonl or .csv")
+    parser.add_argument('-o', '--output', default='-', help="JSONL results (default: stdout)")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--baseline', help="earlier results to report changed answers against")
+    args = parser.parse_args(argv)
+
+    baseline = read_baseline(args.baseline) if args.baseline else None
+    if args.output == '-':
+        summary = run(args.input, sys.stdout, args.data_dir, args.workers, args.chunk_size, baseline)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            summary = run(args.input, output, args.data_dir, args.workers, args.chunk_size, baseline)
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
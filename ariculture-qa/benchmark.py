@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import columnar
+import synth_data
+from engine import QAEngine
+
+# Benchmark harness. Times data loading, entity extraction, every handler and
+# end-to-end answers over a fixed question corpus, and prints one JSON
+# document (p50/p95/p99 per stage plus peak RSS) that can be diffed between
+# runs.
+#
+#   python benchmark.py --rows 1000000 --output before.json
+#   python benchmark.py --data-dir /data/extracts --output after.json
+
+HANDLERS = ['compare_rainfall', 'analyze_temperature', 'analyze_crop_production', 'complex_analysis',
+            'analyze_rainfall_impact', 'rainfall_trend', 'crop_trend', 'crop_forecast', 'rainfall_distribution',
+            'crop_distribution']
+
+QUESTION_TEMPLATES = [
+    "Compare rainfall in {s1} and {s2}",
+    "Compare rainfall in {s1} and {s2} for {y1} {y2}",
+    "Analyze temperature in {s1} and {s2}",
+    "Show top crops in {s1} and {s2}",
+    "Crop production of {c1} in {s1} in {y1}",
+    "Compare everything for {s1} and {s2} with {c1} and {c2}",
+    "Compare rainfall and temperature in {s1}, {s2} and {s3}",
+    "What was the rainfall in {s1} in {y1}",
+    "Compare temperature in {s1} and {s2} for {y1}-{y2}",
+    "Crop production in {s1} since {y1}",
+    "How does rainfall affect {c1} in {s1} and {s2}",
+    "Rainfall in {d1} since {y1}",
+    "Top crops in {d1} district",
+]
+
+def _pick(rng, pool, k):
+    if len(pool) >= k:
+        return rng.sample(pool, k)
+    return [rng.choice(pool) for _ in range(k)]
+
+def question_corpus(engine, size=200, seed=0):
+    rng = random.Random(seed)
+    years = sorted(engine.cubes['rainfall'].get(engine.all_states[0], {})) or [2020]
+    questions = []
+    for i in range(size):
+        s1, s2, s3 = _pick(rng, engine.all_states, 3)
+        c1, c2 = _pick(rng, engine.all_crops, 2)
+        d1, = _pick(rng, engine.all_districts, 1)
+        template = QUESTION_TEMPLATES[i % len(QUESTION_TEMPLATES)]
+        questions.append(template.format(s1=s1, s2=s2, s3=s3, c1=c1, c2=c2, d1=d1,
+                                         y1=rng.choice(years), y2=rng.choice(years)))
+    return questions
+
+def summarise(samples):
+    values = np.asarray(samples) * 1000.0
+    return {
+        'count': len(samples),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max()),
+    }
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+def run_handler(engine, intent):
+    # Handlers are generators; draining one is the full computation.
+    return ''.join(getattr(engine, intent.handler)(intent, {}))
+
+def first_section(engine, question):
+    # Time until a streamed answer has something to show.
+    start = time.perf_counter()
+    sections = engine.stream(question)
+    next(sections)
+    elapsed = time.perf_counter() - start
+    sections.close()
+    return elapsed
+
+# Budget for timing the out-of-core load (see streaming.py).
+STREAMING_BUDGET = 64 * 1024 * 1024
+
+# What a fresh process needs before the apps can draw their sidebar: the
+# manifest alone, or (without one) the whole engine.
+STARTUP_SCRIPTS = {
+    'startup_manifest': "import sys; from manifest import read_manifest; assert read_manifest(sys.argv[1])",
+    'startup_engine': "import sys; from engine import QAEngine; QAEngine(sys.argv[1])",
+}
+
+def startup(script, data_dir):
+    here = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', script, data_dir], cwd=here, check=True)
+    return time.perf_counter() - start
+
+def ingest_fragments(engine, count, fraction=0.01):
+    # Times refresh() picking up fragments of next-season crop rows, each
+    # `fraction` of the crop table, dropped one at a time.
+    drop = tempfile.mkdtemp(prefix='agri-drop-')
+    previous = os.environ.get('AGRI_QA_DROP_DIR')
+    os.environ['AGRI_QA_DROP_DIR'] = drop
+    samples = []
+    try:
+        rows = engine.crop_df.sample(max(int(len(engine.crop_df) * fraction), 1), random_state=0)
+        for i in range(count):
+            rows.assign(year=engine.last_year + 1).to_csv(os.path.join(drop, f"{i:04d}.csv"), index=False)
+            samples.append(timed(engine.refresh))
+    finally:
+        if previous is None:
+            os.environ.pop('AGRI_QA_DROP_DIR', None)
+        else:
+            os.environ['AGRI_QA_DROP_DIR'] = previous
+        shutil.rmtree(drop, ignore_errors=True)
+    return summarise(samples)
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def clear_columnar_cache(data_dir):
+    shutil.rmtree(os.path.join(data_dir, columnar.CACHE_DIRNAME), ignore_errors=True)
+
+def run(data_dir, corpus_size=200, repeat=5, load_repeat=3):
+    results = {}
+
+    cold = []
+    for _ in range(load_repeat):
+        clear_columnar_cache(data_dir)
+        cold.append(timed(QAEngine, data_dir))
+    results['load_cold'] = summarise(cold)
+    results['load_cached'] = summarise([timed(QAEngine, data_dir) for _ in range(load_repeat)])
+    results['load_streaming'] = summarise([timed(lambda: QAEngine(data_dir, memory_budget=STREAMING_BUDGET))
+                                           for _ in range(load_repeat)])
+    for name, script in STARTUP_SCRIPTS.items():
+        results[name] = summarise([startup(script, data_dir) for _ in range(load_repeat)])
+
+    engine = QAEngine(data_dir, cache_size=0)
+    questions = question_corpus(engine, corpus_size)
+
+    parse_times = []
+    intents = []
+    for _ in range(repeat):
+        intents = []
+        for question in questions:
+            start = time.perf_counter()
+            parsed = engine.parse(question)
+            parse_times.append(time.perf_counter() - start)
+            intents.append(engine.intent(parsed))
+    results['extract'] = summarise(parse_times)
+
+    # Every vocabulary name with one inner character dropped.
+    misspelled = [name[:len(name) // 2] + name[len(name) // 2 + 1:]
+                  for name in engine.all_states + engine.all_crops + engine.all_districts]
+    results['fuzzy_lookup'] = summarise(
+        [timed(engine.extractor.fuzzy.lookup, name) for _ in range(repeat) for name in misspelled])
+
+    for handler in HANDLERS:
+        samples = []
+        for _ in range(repeat):
+            for intent in intents:
+                samples.append(timed(run_handler, engine, intent._replace(handler=handler)))
+        results[f'handler.{handler}'] = summarise(samples)
+
+    samples = []
+    for _ in range(repeat):
+        for intent in intents:
+            for state in intent.states:
+                start = min(intent.years) if intent.years else None
+                end = max(intent.years) if intent.years else None
+                samples.append(timed(engine.rows, 'rainfall', state, start, end))
+    results['index.rows'] = summarise(samples)
+
+    samples = []
+    for _ in range(repeat):
+        samples.extend(timed(engine.answer, question) for question in questions)
+    results['answer_uncached'] = summarise(samples)
+    results['stream_first_section'] = summarise(
+        [first_section(engine, question) for _ in range(repeat) for question in questions])
+
+    cached_engine = QAEngine(data_dir)
+    samples = []
+    for _ in range(repeat):
+        samples.extend(timed(cached_engine.answer, question) for question in questions)
+    results['answer_cached'] = summarise(samples)
+    results['answer_cached']['cache'] = cached_engine.cache.stats()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        engine.answer_many(questions)
+    elapsed = time.perf_counter() - start
+    results['answer_many'] = {'questions_per_second': repeat * len(questions) / elapsed}
+    # Last, as it grows the engine's data.
+    results['ingest'] = ingest_fragments(cached_engine, repeat)
+
+    return {
+        'data_dir': os.path.abspath(data_dir),
+        'rows': dict(engine.records),
+        'memory_bytes': engine.memory_footprint(),
+        'corpus_size': len(questions),
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'stages': results,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Q&A engine.")
+    parser.add_argument('--data-dir', help="directory with the three CSVs; generated when omitted")
+    parser.add_argument('--rows', type=int, default=10_000, help="rows per dataset when generating")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--corpus-size', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--load-repeat', type=int, default=3)
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir
+    tmp_dir = None
+    if data_dir is None:
+        tmp_dir = tempfile.mkdtemp(prefix='agri-bench-')
+        synth_data.generate(tmp_dir, args.rows, seed=args.seed)
+        data_dir = tmp_dir
+    try:
+        report = run(data_dir, args.corpus_size, args.repeat, args.load_repeat)
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Binary columnar cache for the CSV sources.
+# On first use each CSV is parsed once, its column names normalised, and every
+# column written as a .npy file under .columnar/<csv name>/ next to the
+# source. String columns are stored as int32 codes plus a sorted dictionary in
+# meta.json. Numeric columns are narrowed at conversion time: integers to the
+# smallest type that holds them (year becomes int16) and floats to float32 when
+# that keeps every value within FLOAT32_TOLERANCE. Rows without a state or a
+# year are dropped: they belong to no (state, year), every grouping of the
+# answers already ignored them, and they would sort after all the others.
+# The rest are stored sorted by (state, year) so SortedIndex can slice them
+# without a scan. Later loads memory-map the arrays instead of parsing text.
+# The cache is keyed on the source's size and mtime, so editing or replacing
+# the CSV invalidates it.
+
+CACHE_DIRNAME = '.columnar'
+FORMAT_VERSION = 4
+# Answers print measures to two decimals, so float32 is used when it moves no
+# value by more than half of the last printed digit.
+FLOAT32_TOLERANCE = 0.005
+
+def normalise_columns(df):
+    df.columns = [col.lower().replace('_', ' ') for col in df.columns]
+    return df
+
+def drop_unkeyed(df):
+    # A year column read as float because of its blanks is made integral
+    # again once they are gone.
+    keys = [col for col in ('state', 'year') if col in df.columns]
+    if keys and df[keys].isna().any().any():
+        df = df.dropna(subset=keys).reset_index(drop=True)
+    if 'year' in df.columns and df['year'].dtype.kind == 'f':
+        df['year'] = df['year'].astype(np.int64)
+    return df
+
+def sort_rows(df):
+    keys = [col for col in ('state', 'year') if col in df.columns]
+    if not keys:
+        return df
+    return df.sort_values(keys, kind='stable', ignore_index=True)
+
+def cache_dir_for(path):
+    return os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIRNAME, os.path.basename(path))
+
+def _source_key(stat):
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def narrow_numeric(values):
+    if values.dtype.kind in 'biu':
+        return pd.to_numeric(values, downcast='integer').to_numpy()
+    values = values.to_numpy()
+    if values.dtype == np.float64:
+        narrowed = values.astype(np.float32)
+        if np.nanmax(np.abs(narrowed.astype(np.float64) - values), initial=0.0) <= FLOAT32_TOLERANCE:
+            return narrowed
+    return values
+
+def encode_frame(df):
+    arrays = {}
+    columns = []
+    for col in df.columns:
+        values = df[col]
+        if values.dtype.kind in 'biuf':
+            arrays[col] = narrow_numeric(values)
+            columns.append({'name': col, 'kind': 'numeric'})
+        else:
+            codes, categories = pd.factorize(values, sort=True)
+            arrays[col] = codes.astype(np.int32)
+            columns.append({'name': col, 'kind': 'category', 'categories': [str(c) for c in categories]})
+    return arrays, columns
+
+def decode_frame(arrays, columns, validate=True):
+    data = {}
+    for column in columns:
+        values = arrays[column['name']]
+        if column['kind'] == 'category':
+            values = pd.Categorical.from_codes(values, column['categories'], validate=validate)
+        data[column['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+def write_cache(df, cache_dir, stat):
+    arrays, columns = encode_frame(df)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Arrays are versioned by the source key and swapped in with os.replace,
+    # so processes still mapping an older generation keep a valid file.
+    token = f"{stat.st_size}-{stat.st_mtime_ns}"
+    files = {}
+    for i, column in enumerate(columns):
+        filename = f"{i}.{token}.npy"
+        tmp_path = os.path.join(cache_dir, f"{filename}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, arrays[column['name']])
+        os.replace(tmp_path, os.path.join(cache_dir, filename))
+        files[column['name']] = filename
+
+    meta = {
+        'version': FORMAT_VERSION,
+        'source': _source_key(stat),
+        'rows': len(df),
+        'columns': columns,
+        'files': files,
+    }
+    tmp_meta = os.path.join(cache_dir, f"meta.json.{os.getpid()}.tmp")
+    with open(tmp_meta, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, os.path.join(cache_dir, 'meta.json'))
+
+    for name in os.listdir(cache_dir):
+        if name.endswith('.npy') and name not in files.values():
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+    return meta
+
+def read_cache(cache_dir, meta):
+    arrays = {}
+    for column in meta['columns']:
+        path = os.path.join(cache_dir, meta['files'][column['name']])
+        arrays[column['name']] = np.load(path, mmap_mode='r')
+    return decode_frame(arrays, meta['columns'])
+
+def share_categories(frames, column):
+    # One global dictionary per column across all datasets, so the same name
+    # has the same integer code everywhere.
+    categories = sorted(set().union(*(df[column].cat.categories for df in frames)))
+    for df in frames:
+        df[column] = df[column].cat.set_categories(categories)
+    return categories
+
+def memory_footprint(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def read_table(path):
+    stat = os.stat(path)
+    cache_dir = cache_dir_for(path)
+    meta = _read_meta(cache_dir)
+    if meta and meta.get('version') == FORMAT_VERSION and meta.get('source') == _source_key(stat):
+        try:
+            return read_cache(cache_dir, meta)
+        except (OSError, KeyError, ValueError):
+            pass
+
+    df = sort_rows(drop_unkeyed(normalise_columns(pd.read_csv(path))))
+    try:
+        meta = write_cache(df, cache_dir, stat)
+    except OSError:
+        # Read-only deployments still work, they just parse the CSV each time.
+        arrays, columns = encode_frame(df)
+        return decode_frame(arrays, columns)
+    return read_cache(cache_dir, meta)
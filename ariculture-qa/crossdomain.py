@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+# Materialized cross-domain view. The three datasets are reduced to one row
+# per (state, district, year) holding mean rainfall, mean temperature and the
+# mean production of every crop (one column per crop), built once at load.
+# The sums and counts behind the means are kept, so appended rows are added
+# in without going back to the rows already loaded.
+#
+# Correlations and least-squares slopes between a climate measure and crop
+# production are computed for every state and every crop at once: the view
+# is sorted by state, so per-state sums of x, y, x², y² and xy are a single
+# np.add.reduceat over a (rows × crops) matrix.
+
+KEYS = ['state', 'district', 'year']
+MIN_POINTS = 3
+
+def _totals_by_keys(df, measure, keys):
+    values = df[measure].astype('float64')
+    return values.groupby([df[key] for key in keys], observed=True).agg(['sum', 'count'])
+
+class CorrelationTable:
+    def __init__(self, states, crops, n, r, slope, intercept):
+        self.states = states
+        self.crops = crops
+        self.state_pos = {state: i for i, state in enumerate(states)}
+        self.crop_pos = {crop: j for j, crop in enumerate(crops)}
+        self.n = n
+        self.r = r
+        self.slope = slope
+        self.intercept = intercept
+
+    def get(self, state, crop):
+        i = self.state_pos.get(state)
+        j = self.crop_pos.get(crop)
+        if i is None or j is None or self.n[i, j] < MIN_POINTS:
+            return None
+        return {
+            'points': int(self.n[i, j]),
+            'correlation': None if np.isnan(self.r[i, j]) else float(self.r[i, j]),
+            'slope': None if np.isnan(self.slope[i, j]) else float(self.slope[i, j]),
+            'intercept': None if np.isnan(self.intercept[i, j]) else float(self.intercept[i, j]),
+        }
+
+def correlate_by_state(frame, driver, crops):
+    if frame.empty or not crops:
+        return CorrelationTable([], list(crops), np.zeros((0, len(crops))), *(np.zeros((0, len(crops))),) * 3)
+
+    state_codes = frame.index.codes[0]
+    starts = np.flatnonzero(np.r_[True, state_codes[1:] != state_codes[:-1]])
+    states = [str(state) for state in frame.index.levels[0][state_codes[starts]]]
+
+    x = frame[driver].to_numpy(dtype=np.float64)
+    y = frame[crops].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(x)[:, None] & ~np.isnan(y)
+    xs = np.where(valid, x[:, None], 0.0)
+    ys = np.where(valid, y, 0.0)
+
+    n = np.add.reduceat(valid.astype(np.float64), starts, axis=0)
+    sx = np.add.reduceat(xs, starts, axis=0)
+    sy = np.add.reduceat(ys, starts, axis=0)
+    sxx = np.add.reduceat(xs * xs, starts, axis=0)
+    syy = np.add.reduceat(ys * ys, starts, axis=0)
+    sxy = np.add.reduceat(xs * ys, starts, axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        slope = cov / var_x
+        r = cov / np.sqrt(var_x * var_y)
+        intercept = (sy - slope * sx) / n
+    # Constant series have no defined correlation or slope.
+    slope[~np.isfinite(slope)] = np.nan
+    r[~np.isfinite(r)] = np.nan
+    intercept[~np.isfinite(intercept)] = np.nan
+    return CorrelationTable(states, list(crops), n.astype(np.int64), np.clip(r, -1.0, 1.0), slope, intercept)
+
+def join_totals(crop_df, rainfall_df, temp_df):
+    # (sums, counts) per (state, district, year), with one column per climate
+    # measure and per crop.
+    return combine_totals(_totals_by_keys(rainfall_df, 'rainfall mm', KEYS),
+                          _totals_by_keys(temp_df, 'avg temperature', KEYS),
+                          _totals_by_keys(crop_df, 'production volume', KEYS + ['crop type']))
+
+def combine_totals(rainfall, temperature, production):
+    # The same from per-key sums and counts already aggregated: rainfall and
+    # temperature by (state, district, year), production by those and crop.
+    production = production[['sum', 'count']].unstack('crop type')
+    tables = []
+    for stat in ('sum', 'count'):
+        # No production rows (a fragment without any) leave no columns.
+        crops = production[stat] if len(production.columns) else pd.DataFrame(index=production.index)
+        crops.columns = [str(crop) for crop in crops.columns]
+        climate = rainfall[stat].to_frame('rainfall mm').join(temperature[stat].rename('avg temperature'), how='outer')
+        tables.append(climate.join(crops, how='outer').fillna(0.0))
+    return tuple(tables)
+
+class JoinedView:
+    def __init__(self, crop_df, rainfall_df, temp_df, totals=None):
+        # `totals` are (sums, counts) to build from instead of the datasets.
+        sums, counts = join_totals(crop_df, rainfall_df, temp_df) if totals is None else totals
+        measures = ['rainfall mm', 'avg temperature']
+        self.crops = sorted(column for column in sums.columns if column not in measures)
+        self.sums = sums[measures + self.crops].sort_index()
+        self.counts = counts[measures + self.crops].sort_index()
+        self.frame = self.sums / self.counts.where(self.counts > 0)
+        self.rainfall = correlate_by_state(self.frame, 'rainfall mm', self.crops)
+        self.temperature = correlate_by_state(self.frame, 'avg temperature', self.crops)
+
+    def updated(self, crop_df, rainfall_df, temp_df):
+        # The view with appended rows added in. Only the new rows are
+        # grouped; correlations are recomputed, which only touches the view.
+        sums, counts = join_totals(crop_df, rainfall_df, temp_df)
+        return JoinedView(None, None, None, (self.sums.add(sums, fill_value=0.0),
+                                             self.counts.add(counts, fill_value=0.0)))
+
+def describe_correlation(r):
+    if r is None:
+        return "not enough variation"
+    strength = abs(r)
+    if strength < 0.1:
+        return "no clear relationship"
+    label = 'weak' if strength < 0.3 else 'moderate' if strength < 0.6 else 'strong'
+    return f"{label} {'positive' if r > 0 else 'negative'}"
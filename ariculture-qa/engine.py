@@ -0,0 +1,1125 @@
+import copy
+import os
+import threading
+import time
+from collections import namedtuple
+
+import pandas as pd
+
+from aggregates import build_rollups, cube_mean, cube_stats, merge_rollups, rank_crops, rollup_from
+from answer_cache import AnswerCache
+from columnar import memory_footprint, read_table, share_categories
+from crossdomain import JoinedView, combine_totals, describe_correlation
+from entities import EntityExtractor
+from explorer import NOT_KEPT, RowSelection
+from ingest import COLUMNS, apply_fragments, merge_tables, read_fragments
+from manifest import (DATA_DIR, SOURCE_FILES, build_manifest, extend_manifest, fragment_stamps, read_manifest,
+                      source_stamps, write_manifest)
+from metrics import metrics
+from rankings import CropRankings
+from shared_dataset import DATASETS, SharedDataset
+from sketches import POINTS, build_sketches, update_sketches
+from sorted_index import SortedIndex
+from streaming import memory_budget as streaming_budget, stream_aggregates
+from trends import ALPHA, BETA, MAX_HORIZON, build_trends
+
+# Headless Q&A engine shared by the Streamlit apps, batch jobs and services.
+# Nothing in here imports streamlit.
+
+# A question reduced to what the handlers compute from. Entity lists are
+# sorted, so questions naming the same things in any order or wording share
+# one intent (and one cached answer). `years` is None when the question puts
+# no constraint on years, otherwise the sorted tuple of years it covers, with
+# ranges expanded against the years present in the data. `rank` is the (k,
+# bottom) of crop rankings; it only varies for the handlers that rank.
+Intent = namedtuple('Intent', ['handler', 'states', 'crops', 'years', 'districts', 'rank', 'percentiles'],
+                    defaults=((), (3, False), ()))
+RANKED_HANDLERS = {'analyze_crop_production', 'district_crops'}
+# Trend and forecast handlers, by the dataset whose series they fit.
+TREND_HANDLERS = {'rainfall_trend': 'rainfall', 'temperature_trend': 'temperature', 'crop_trend': 'crop'}
+FORECAST_HANDLERS = {'rainfall_forecast': 'rainfall', 'temperature_forecast': 'temperature',
+                     'crop_forecast': 'crop'}
+# Percentile handlers, by the dataset whose sketches they read. `percentiles`
+# only varies for these; empty means DEFAULT_PERCENTILES.
+DISTRIBUTION_HANDLERS = {'rainfall_distribution': 'rainfall', 'temperature_distribution': 'temperature',
+                         'crop_distribution': 'crop'}
+DEFAULT_PERCENTILES = (10, 50, 90)
+# A year is a drought year for a state when its mean rainfall falls short of
+# the state's mean over all years by more than this (IMD calls a 20% shortfall
+# deficient).
+DROUGHT_SHORTFALL = 0.2
+
+# With AGRI_QA_SHARED_DIR set, engines attach to the dataset a loader
+# published there (see shared_dataset.py) instead of loading their own copy.
+SHARED_DIR = os.environ.get('AGRI_QA_SHARED_DIR') or None
+
+# dataset -> the engine attribute holding its table
+TABLES = {'crop': 'crop_df', 'rainfall': 'rainfall_df', 'temperature': 'temp_df'}
+
+def load_data(data_dir=DATA_DIR):
+    # Column names are normalised once, when the CSV is converted to the
+    # columnar cache; later loads memory-map the cached arrays.
+    crop_df = read_table(os.path.join(data_dir, SOURCE_FILES['crop']))
+    rainfall_df = read_table(os.path.join(data_dir, SOURCE_FILES['rainfall']))
+    temp_df = read_table(os.path.join(data_dir, SOURCE_FILES['temperature']))
+
+    frames = [crop_df, rainfall_df, temp_df]
+    share_categories(frames, 'state')
+    share_categories(frames, 'district')
+
+    return crop_df, rainfall_df, temp_df
+
+def describe_corrections(parsed):
+    names = ', '.join(f'"{c.text}" as {c.name}' for c in parsed.corrections)
+    return f"*Interpreting {names}.*\n\n"
+
+IMPACT_WORDS = ['affect', 'impact', 'influence', 'correlat', 'relationship', 'depend']
+FORECAST_WORDS = ['forecast', 'predict', 'project', 'outlook', 'expected', 'next year']
+TREND_WORDS = ['trend', 'increas', 'decreas', 'rising', 'falling', 'declin', 'changing', 'growth']
+DISTRIBUTION_WORDS = ['median', 'percentile', 'quantile', 'quartile', 'distribution', 'drought', 'spread']
+
+# dataset -> (title, unit, icon, source) in trend and forecast answers
+SERIES_LABELS = {
+    'rainfall': ('Rainfall', ' mm', '🌧️', 'India Meteorological Department'),
+    'temperature': ('Temperature', '°C', '🌡️', 'India Meteorological Department'),
+    'crop': ('Crop Production', ' tons', '🌾', 'Ministry of Agriculture'),
+}
+
+# Questions that name districts are answered at district level; states named
+# alongside them pick which state's district is meant.
+DISTRICT_HANDLERS = {
+    'compare_rainfall': 'district_rainfall',
+    'analyze_temperature': 'district_temperature',
+    'analyze_crop_production': 'district_crops',
+    'complex_analysis': 'district_overview',
+}
+
+def route_question(parsed):
+    handler = route_by_keywords(parsed)
+    if parsed.districts:
+        return DISTRICT_HANDLERS.get(handler, handler)
+    return handler
+
+def route_by_keywords(parsed):
+    question_lower = parsed.lower
+
+    if 'rainfall' in question_lower and any(word in question_lower for word in IMPACT_WORDS):
+        return 'analyze_rainfall_impact'
+    elif parsed.next_years or any(word in question_lower for word in FORECAST_WORDS):
+        return f'{series_dataset(question_lower)}_forecast'
+    elif any(word in question_lower for word in TREND_WORDS):
+        return f'{series_dataset(question_lower)}_trend'
+    elif parsed.percentiles or any(word in question_lower for word in DISTRIBUTION_WORDS):
+        if 'drought' in question_lower and 'temperature' not in question_lower:
+            return 'rainfall_distribution'
+        return f'{series_dataset(question_lower)}_distribution'
+    elif any(word in question_lower for word in ['compare', 'comparison']):
+        if 'rainfall' in question_lower and 'temperature' in question_lower:
+            return 'complex_analysis'
+        elif 'rainfall' in question_lower:
+            return 'compare_rainfall'
+        elif 'temperature' in question_lower:
+            return 'analyze_temperature'
+        else:
+            return 'complex_analysis'
+    elif 'crop' in question_lower or 'production' in question_lower:
+        return 'analyze_crop_production'
+    elif 'temperature' in question_lower:
+        return 'analyze_temperature'
+    elif 'rainfall' in question_lower:
+        return 'compare_rainfall'
+    else:
+        return 'complex_analysis'
+
+def series_dataset(question_lower):
+    if 'rainfall' in question_lower:
+        return 'rainfall'
+    elif 'temperature' in question_lower:
+        return 'temperature'
+    else:
+        return 'crop'
+
+class EngineState:
+    # Everything answers are computed from: the three tables and all that is
+    # derived from them. A state is never modified once built. Reloads and
+    # appends build a new one off to the side and the engine swaps it in
+    # with a single assignment, so readers see the old data or the new, never
+    # a mix of the two.
+
+    @classmethod
+    def build(cls, frames, generation, sources=None, shared=None, ingested=()):
+        # frames: dataset -> table. `sources` are the source_stamps() the
+        # tables were loaded from (None for a shared-memory snapshot);
+        # `ingested` reports the fragments merged into them.
+        state = cls()
+        state.crop_df, state.rainfall_df, state.temp_df = (frames[name] for name in DATASETS)
+        with metrics.stage('build_rollups'):
+            state.rollups = build_rollups(state.crop_df, state.rainfall_df, state.temp_df)
+        with metrics.stage('build_rankings'):
+            state.rankings = CropRankings(state.crop_df)
+        with metrics.stage('build_trends'):
+            state.trends = build_trends(state.rollups)
+        with metrics.stage('build_joined_view'):
+            state.joined = JoinedView(state.crop_df, state.rainfall_df, state.temp_df)
+        with metrics.stage('build_sketches'):
+            state.sketches = build_sketches(state.crop_df, state.rainfall_df, state.temp_df)
+        state.indexes = {name: SortedIndex(frames[name]) for name in DATASETS}
+        state.load_report = None
+        state._finish(generation, build_manifest(*(frames[name] for name in DATASETS), sources), shared, ingested)
+        return state
+
+    @classmethod
+    def aggregated(cls, districts, sketches, manifest, generation, sources, ingested=(), report=None):
+        # A state built from district-level aggregates and the sketches
+        # merged chunk by chunk (see streaming.py) instead of tables. It
+        # answers the same questions; there are no raw rows to show or to
+        # index.
+        state = cls()
+        state.crop_df = state.rainfall_df = state.temp_df = None
+        with metrics.stage('build_rollups'):
+            state.rollups = {
+                'crop': rollup_from(districts['crop'], ['crop type']),
+                'rainfall': rollup_from(districts['rainfall']),
+                'temperature': rollup_from(districts['temperature']),
+            }
+        with metrics.stage('build_rankings'):
+            cells = districts['crop'][['sum', 'count']].groupby(level=['state', 'year', 'crop type'],
+                                                                observed=True).sum()
+            state.rankings = CropRankings(None, cells)
+        with metrics.stage('build_trends'):
+            state.trends = build_trends(state.rollups)
+        with metrics.stage('build_joined_view'):
+            state.joined = JoinedView(None, None, None, combine_totals(districts['rainfall'],
+                                                                       districts['temperature'], districts['crop']))
+        state.indexes = {}
+        state.sketches = sketches
+        state.load_report = report
+        state._finish(generation, dict(manifest, sources=sources), None, ingested)
+        return state
+
+    def appended(self, rows, sources, reports):
+        # A new state with appended rows merged in. Only the rows are
+        # aggregated, and merged copy-on-write into the rollups, rankings and
+        # joined view. This state is left as it is.
+        new = EngineState()
+        if self.indexes:
+            frames, rows = merge_tables(self.frames(), rows)
+            appended = [rows.get(name, frames[name].iloc[:0]) for name in DATASETS]
+            manifest = build_manifest(*(frames[name] for name in DATASETS), sources)
+        else:
+            # Built from aggregates: the rows are only aggregated.
+            frames = self.frames()
+            appended = [rows.get(name, pd.DataFrame(columns=COLUMNS[name])) for name in DATASETS]
+            manifest = extend_manifest(self.manifest, rows, sources)
+        new.crop_df, new.rainfall_df, new.temp_df = (frames[name] for name in DATASETS)
+        delta = build_rollups(*appended)
+        new.rollups = merge_rollups(self.rollups, delta)
+        new.rankings = self.rankings.updated(rows['crop']) if 'crop' in rows else self.rankings
+        # Refitted from the merged rollups; the fit is over yearly means, not
+        # rows, so it costs the same however many rows came in.
+        new.trends = build_trends(new.rollups)
+        # Tables that came through unchanged (no new rows, no new names) keep
+        # their index.
+        new.indexes = {name: index if frames[name] is getattr(self, TABLES[name]) else SortedIndex(frames[name])
+                       for name, index in self.indexes.items()}
+        new.joined = self.joined.updated(*appended) if rows else self.joined
+        new.sketches = update_sketches(self.sketches, rows)
+        new.load_report = self.load_report
+        new._finish(self.generation + 1, manifest, self.shared, self.ingested + tuple(reports), self)
+        return new
+
+    def _finish(self, generation, manifest, shared, ingested, previous=None):
+        self.generation = generation
+        self.sources = manifest['sources']
+        self.shared = shared
+        self.ingested = tuple(ingested)
+        # The state level of each rollup is what the state handlers query.
+        self.cubes = {name: rollup['state'] for name, rollup in self.rollups.items()}
+        # dataset -> district -> states it appears under in that dataset
+        self.district_states = {}
+        for name, rollup in self.rollups.items():
+            index = self.district_states[name] = {}
+            for state, districts in rollup['district'].items():
+                for district in districts:
+                    index.setdefault(district, []).append(state)
+        # The manifest holds the vocabularies and record counts. It is also
+        # written out for the apps to start from on their next cold start.
+        self.manifest = manifest
+        # dataset -> rows behind the answers, raw tables or not
+        self.records = manifest['records']
+        self.first_year = self.manifest['first_year']
+        self.last_year = self.manifest['last_year']
+        self.all_states = self.manifest['states']
+        self.all_crops = self.manifest['crops']
+        self.all_districts = self.manifest['districts']
+        if previous is not None and all(self.manifest[key] == previous.manifest[key]
+                                        for key in ('states', 'crops', 'districts')):
+            self.extractor = previous.extractor
+        else:
+            self.extractor = EntityExtractor(self.all_states, self.all_crops, self.all_districts)
+
+    def frames(self):
+        return {name: getattr(self, TABLES[name]) for name in DATASETS}
+
+class QAEngine:
+    def __init__(self, data_dir=DATA_DIR, cache_size=256, cache_ttl=None, shared_dir=SHARED_DIR,
+                 memory_budget=None):
+        self.data_dir = data_dir
+        self.shared_dir = shared_dir
+        # With a budget (bytes), the CSVs are aggregated in chunks within it
+        # instead of loaded as tables (see streaming.py). A shared dataset is
+        # already in memory and ignores it. None reads AGRI_QA_MEMORY_BUDGET
+        # as the engine is built; 0 loads the tables whatever it says.
+        self.memory_budget = streaming_budget() if memory_budget is None else memory_budget
+        self.cache = AnswerCache(cache_size, cache_ttl)
+        # Held while a new state is built, so concurrent refreshes do the
+        # work once.
+        self.lock = threading.RLock()
+        self.state = None
+        self.reload()
+
+    def __getattr__(self, name):
+        # Data attributes (crop_df, cubes, all_states, generation, ...) are
+        # read from the current state.
+        state = self.__dict__.get('state')
+        if state is None:
+            raise AttributeError(name)
+        return getattr(state, name)
+
+    def pinned(self):
+        # The engine bound to its current state. Everything computed through
+        # the returned view reads one version of the data, even if a refresh
+        # swaps in a new state meanwhile.
+        return copy.copy(self)
+
+    def reload(self):
+        with self.lock:
+            previous = self.state
+            generation = previous.generation + 1 if previous is not None else 1
+            with metrics.stage('load_data'):
+                if self.shared_dir:
+                    shared = SharedDataset(self.shared_dir)
+                    frames, sources, ingested = shared.frames, None, ()
+                elif self.memory_budget:
+                    sources = source_stamps(self.data_dir)
+                    districts, sketches, manifest, ingested, report = stream_aggregates(
+                        self.data_dir, self.memory_budget, sources['fragments'])
+                    state = EngineState.aggregated(districts, sketches, manifest, generation, sources, ingested,
+                                                   report)
+                    self._install(state, previous)
+                    return
+                else:
+                    shared = None
+                    sources = source_stamps(self.data_dir)
+                    frames = dict(zip(DATASETS, load_data(self.data_dir)))
+                    frames, ingested = apply_fragments(frames, self.data_dir, sources['fragments'])
+            self._install(EngineState.build(frames, generation, sources, shared, ingested), previous)
+
+    def ingest(self):
+        # Merges fragments that appeared in the drop directory since the
+        # state was built. Returns their reports.
+        with self.lock:
+            previous = self.state
+            if previous.sources is None:
+                return []
+            applied = previous.sources['fragments']
+            found = fragment_stamps(self.data_dir)
+            new = {name: stamp for name, stamp in found.items() if name not in applied}
+            if not new:
+                return []
+            with metrics.stage('ingest'):
+                manifest = previous.manifest
+                known = {'state': manifest['states'], 'district': manifest['districts'],
+                         'crop type': manifest['crops']}
+                rows, reports = read_fragments(self.data_dir, new, known)
+                sources = dict(previous.sources, fragments={**applied, **new})
+                self._install(previous.appended(rows, sources, reports), previous)
+            return reports
+
+    def _install(self, state, previous):
+        # The assignment is the switch-over; everything after it is cleanup.
+        self.state = state
+        if state.sources is not None and read_manifest(self.data_dir) != state.manifest:
+            write_manifest(self.data_dir, state.manifest)
+        # Cached answers describe the previous data; the generation is part of
+        # every key so a computation that straddles the swap is not reused.
+        self.cache.clear()
+        if previous is not None and previous.shared is not None and previous.shared is not state.shared:
+            previous.shared.close()
+
+    def refresh(self):
+        # Picks up new data. With a shared dataset, re-attaches when the
+        # loader has published a newer snapshot. Otherwise merges fragments
+        # added to the drop directory, or reloads when a source CSV or an
+        # already applied fragment changed. A few stat calls when nothing did.
+        # Returns whether the data changed.
+        if self.shared is not None:
+            if not self.shared.is_current():
+                self.reload()
+                return True
+            return False
+        try:
+            sources = source_stamps(self.data_dir)
+        except OSError:
+            # A source is being replaced; try again next time.
+            return False
+        current = self.sources
+        if sources == current:
+            return False
+        if not self.lock.acquire(blocking=False):
+            # Another thread is already bringing the data up to date.
+            return False
+        try:
+            applied = current['fragments']
+            replaced = any(sources[name] != current[name] for name in SOURCE_FILES) or \
+                any(sources['fragments'].get(name) != stamp for name, stamp in applied.items())
+            if replaced:
+                self.reload()
+                return True
+            return bool(self.ingest())
+        finally:
+            self.lock.release()
+
+    def memory_footprint(self):
+        # Bytes held by each raw table; 0 when built from aggregates.
+        return {name: memory_footprint(df) if df is not None else 0 for name, df in self.frames().items()}
+
+    def parse(self, question):
+        with metrics.stage('extract'):
+            return self.extractor.extract(question)
+
+    def intent(self, parsed):
+        with metrics.stage('route'):
+            handler = route_question(parsed)
+            return Intent(
+                handler,
+                tuple(sorted(parsed.states)),
+                tuple(sorted(parsed.crops)),
+                self.resolve_years(parsed, MAX_HORIZON if handler in FORECAST_HANDLERS else 0),
+                tuple(sorted(parsed.districts)),
+                parsed.rank if parsed.rank and handler in RANKED_HANDLERS else Intent._field_defaults['rank'],
+                tuple(sorted(parsed.percentiles)) if handler in DISTRIBUTION_HANDLERS else (),
+            )
+
+    def resolve_years(self, parsed, horizon=0):
+        # Ranges may run `horizon` years past the data (for forecasts).
+        if not parsed.has_years():
+            return None
+        years = set(self.span_years(parsed.years, parsed.year_ranges, horizon))
+        if parsed.last_years:
+            years.update(range(self.last_year - parsed.last_years + 1, self.last_year + 1))
+        if parsed.next_years:
+            years.update(range(self.last_year + 1, self.last_year + parsed.next_years + 1))
+        return tuple(sorted(years))
+
+    def span_years(self, years=(), year_ranges=(), horizon=0):
+        # `years` plus every (start, end) range, clamped to the data's years
+        # (an open end, None, runs to the first or last of them).
+        years = set(years)
+        for start, end in year_ranges:
+            start = self.first_year if start is None else max(start, self.first_year)
+            end = self.last_year if end is None else min(end, self.last_year + horizon)
+            years.update(range(start, end + 1))
+        return tuple(sorted(years))
+
+    def rank_crops(self, state=None, years=None, k=3, bottom=False):
+        # (crop, mean production) pairs for a state, or nationally with no
+        # state. All-years and single-year rankings are precomputed; other
+        # year sets are merged from the cubes.
+        if years is None or len(years) == 1:
+            year = years[0] if years else None
+            if bottom:
+                return self.rankings.bottom(state, year, k)
+            return self.rankings.top(state, year, k)
+        crop_nodes = self.cubes['crop'].get(state, {}) if state else self.rollups['crop']['national']
+        return rank_crops(crop_nodes, years, k, bottom)
+
+    def rows(self, dataset, state, start=None, end=None):
+        # Contiguous view of one state's rows, optionally within [start, end].
+        if dataset not in self.indexes:
+            raise LookupError(NOT_KEPT)
+        return self.indexes[dataset].rows(state, start, end)
+
+    def explore(self, dataset, states=(), crops=(), years=None, districts=()):
+        # The raw rows of a dataset matching the filters, for paging and
+        # export (see explorer.py).
+        engine = self.pinned()
+        return RowSelection(dataset, engine.indexes.get(dataset), engine.rollups[dataset], states, crops, years,
+                            districts)
+
+    def explore_question(self, question, dataset):
+        # The rows of `dataset` behind a question: its states, crops, years
+        # and districts as filters.
+        engine = self.pinned()
+        intent = engine.intent(engine.parse(question))
+        return engine.explore(dataset, intent.states, intent.crops, intent.years, intent.districts)
+
+    def _sections(self, intent, data):
+        # Runs the handler, yielding its markdown sections as they are
+        # produced. Time inside the handler is recorded under its name; time
+        # the consumer spends between sections (writing them to the page or
+        # a socket) is recorded as 'render'.
+        sections = getattr(self, intent.handler)(intent, data)
+        compute = render = 0.0
+        while True:
+            start = time.perf_counter()
+            section = next(sections, None)
+            compute += time.perf_counter() - start
+            if section is None:
+                break
+            start = time.perf_counter()
+            yield section
+            render += time.perf_counter() - start
+        metrics.observe(intent.handler, compute)
+        metrics.observe('render', render)
+
+    def _store(self, key, intent, data, markdown):
+        result = {
+            'handler': intent.handler,
+            'states': list(intent.states),
+            'crops': list(intent.crops),
+            'years': list(intent.years) if intent.years is not None else None,
+            'districts': list(intent.districts),
+            'data': data,
+            'markdown': markdown,
+        }
+        metrics.count('answer_bytes', len(markdown))
+        self.cache.put(key, result)
+        return result
+
+    def answer_intent(self, intent):
+        # Handlers are generators: they fill `data` with the structured
+        # numbers behind the answer and yield its markdown section by
+        # section. Both are cached together once the handler finishes.
+        engine = self.pinned()
+        key = (engine.generation, intent)
+        result = self.cache.get(key)
+        if result is not None:
+            metrics.count('cache_hits')
+            return result
+        metrics.count('cache_misses')
+        data = {}
+        with metrics.stage(intent.handler):
+            markdown = ''.join(getattr(engine, intent.handler)(intent, data))
+        return self._store(key, intent, data, markdown)
+
+    def stream_intent(self, intent):
+        # Same answer as answer_intent, handed out section by section so a
+        # long analysis can be shown while the rest is still computed. A
+        # cached answer comes back as one section; an answer whose consumer
+        # stops early is not cached.
+        engine = self.pinned()
+        key = (engine.generation, intent)
+        result = self.cache.get(key)
+        if result is not None:
+            metrics.count('cache_hits')
+            yield result['markdown']
+            return
+        metrics.count('cache_misses')
+        data = {}
+        sections = []
+        for section in engine._sections(intent, data):
+            sections.append(section)
+            yield section
+        self._store(key, intent, data, ''.join(sections))
+
+    def _with_corrections(self, result, parsed):
+        # Cached results are shared by every wording of an intent; the
+        # corrections belong to this question, so they go on a copy.
+        corrections = [{'text': c.text, 'kind': c.kind, 'name': c.name, 'distance': c.distance}
+                       for c in parsed.corrections]
+        if not corrections:
+            return dict(result, corrections=corrections)
+        return dict(result, corrections=corrections, markdown=describe_corrections(parsed) + result['markdown'])
+
+    def answer_result(self, question):
+        # Parsed, routed and answered against one state.
+        engine = self.pinned()
+        parsed = engine.parse(question)
+        return engine._with_corrections(engine.answer_intent(engine.intent(parsed)), parsed)
+
+    def answer(self, question):
+        return self.answer_result(question)['markdown']
+
+    def stream(self, question):
+        engine = self.pinned()
+        parsed = engine.parse(question)
+        if parsed.corrections:
+            yield describe_corrections(parsed)
+        yield from engine.stream_intent(engine.intent(parsed))
+
+    def answer_many_results(self, questions):
+        # Questions that resolve to the same intent are computed once; every
+        # aggregate comes from the cubes built in one groupby per dataset.
+        engine = self.pinned()
+        parsed = [engine.parse(question) for question in questions]
+        intents = [engine.intent(p) for p in parsed]
+        answers = {}
+        for intent in intents:
+            if intent not in answers:
+                answers[intent] = engine.answer_intent(intent)
+        return [self._with_corrections(answers[intent], p) for intent, p in zip(intents, parsed)]
+
+    def answer_many(self, questions):
+        return [result['markdown'] for result in self.answer_many_results(questions)]
+
+    def compare_rainfall(self, intent, data):
+        states = intent.states
+        years = intent.years
+
+        if not states:
+            data['error'] = 'no_states'
+            yield "Please specify states to compare."
+            return
+
+        data.update(rainfall_mm={}, records=self.records['rainfall'])
+        yield "## 🌧️ Rainfall Comparison\n\n"
+        for state in states:
+            avg_rainfall = cube_mean(self.cubes['rainfall'].get(state), years)
+            data['rainfall_mm'][state] = avg_rainfall
+            if avg_rainfall is not None:
+                yield f"**{state}**: Average rainfall = {avg_rainfall:.2f} mm\n\n"
+            else:
+                yield f"**{state}**: No rainfall data available\n\n"
+
+        yield f"*Source: {self.records['rainfall']} records from India Meteorological Department*"
+
+    def analyze_crop_production(self, intent, data):
+        states = intent.states
+        crops = intent.crops
+        years = intent.years
+
+        k, bottom = intent.rank
+        heading = _rank_heading(k, bottom)
+
+        if not states:
+            if crops:
+                data['error'] = 'no_states'
+                yield "Please specify states to analyze."
+                return
+            # No state and no crop: rank crops across the whole country.
+            ranked = self.rank_crops(None, years, k, bottom)
+            data.update(production_tons={'India': dict(ranked) if ranked else None}, top_crops=True,
+                        records=self.records['crop'])
+            yield "## 🌾 Crop Production Analysis\n\n"
+            if ranked:
+                lines = [f"**India** - {heading}:\n"]
+                lines.extend(f"  - {crop}: {avg_prod:.2f} tons\n" for crop, avg_prod in ranked)
+                yield ''.join(lines) + "\n"
+            else:
+                yield "**India**: No crop data available\n\n"
+            yield f"*Source: {self.records['crop']} records from Ministry of Agriculture*"
+            return
+
+        data.update(production_tons={}, top_crops=not crops, records=self.records['crop'])
+        yield "## 🌾 Crop Production Analysis\n\n"
+        for state in states:
+            state_crops = self.cubes['crop'].get(state, {})
+            if any(cube_mean(node, years) is not None for node in state_crops.values()):
+                production = data['production_tons'][state] = {}
+                if crops:
+                    lines = [f"**{state}** - Production for specified crops:\n"]
+                    for crop in crops:
+                        avg_prod = cube_mean(state_crops.get(crop), years)
+                        if avg_prod is not None:
+                            production[crop] = avg_prod
+                            lines.append(f"  - {crop}: {avg_prod:.2f} tons\n")
+                else:
+                    lines = [f"**{state}** - {heading}:\n"]
+                    for crop, avg_prod in self.rank_crops(state, years, k, bottom):
+                        production[crop] = avg_prod
+                        lines.append(f"  - {crop}: {avg_prod:.2f} tons\n")
+                lines.append("\n")
+                yield ''.join(lines)
+            else:
+                data['production_tons'][state] = None
+                yield f"**{state}**: No crop data available\n\n"
+
+        yield f"*Source: {self.records['crop']} records from Ministry of Agriculture*"
+
+    def analyze_temperature(self, intent, data):
+        states = intent.states
+        years = intent.years
+
+        if not states:
+            data['error'] = 'no_states'
+            yield "Please specify states to analyze."
+            return
+
+        data.update(avg_temperature_c={}, records=self.records['temperature'])
+        yield "## 🌡️ Temperature Analysis\n\n"
+        for state in states:
+            avg_temp = cube_mean(self.cubes['temperature'].get(state), years)
+            data['avg_temperature_c'][state] = avg_temp
+            if avg_temp is not None:
+                yield f"**{state}**: Average temperature = {avg_temp:.2f}°C\n\n"
+            else:
+                yield f"**{state}**: No temperature data available\n\n"
+
+        yield f"*Source: {self.records['temperature']} records from India Meteorological Department*"
+
+    def complex_analysis(self, intent, data):
+        states = intent.states
+        crops = intent.crops
+        years = intent.years
+
+        if len(states) < 2:
+            data['error'] = 'too_few_states'
+            yield "Please specify at least 2 states for comparison."
+            return
+
+        data.update(rainfall_mm={}, avg_temperature_c={}, production_tons={})
+        yield "## 📊 Cross-Domain Analysis\n\n"
+
+        # Rainfall comparison
+        lines = ["### Rainfall Comparison\n"]
+        for state in states:
+            avg_rain = cube_mean(self.cubes['rainfall'].get(state), years)
+            data['rainfall_mm'][state] = avg_rain
+            if avg_rain is not None:
+                lines.append(f"- **{state}**: {avg_rain:.2f} mm\n")
+        lines.append("\n")
+        yield ''.join(lines)
+
+        # Temperature comparison
+        lines = ["### Temperature Comparison\n"]
+        for state in states:
+            avg_temp = cube_mean(self.cubes['temperature'].get(state), years)
+            data['avg_temperature_c'][state] = avg_temp
+            if avg_temp is not None:
+                lines.append(f"- **{state}**: {avg_temp:.2f}°C\n")
+        lines.append("\n")
+        yield ''.join(lines)
+
+        # Crop production, one section per crop
+        if crops:
+            yield "### Crop Production\n"
+            for crop in crops:
+                production = data['production_tons'][crop] = {}
+                lines = [f"**{crop}**:\n"]
+                for state in states:
+                    avg_prod = cube_mean(self.cubes['crop'].get(state, {}).get(crop), years)
+                    production[state] = avg_prod
+                    if avg_prod is not None:
+                        lines.append(f"  - {state}: {avg_prod:.2f} tons\n")
+                lines.append("\n")
+                yield ''.join(lines)
+
+        yield "*Sources: Integrated data from Ministry of Agriculture & IMD*"
+
+    def analyze_rainfall_impact(self, intent, data):
+        # Correlations come precomputed for every (state, crop) pair from the
+        # joined (state, district, year) view; this only looks them up.
+        crops = intent.crops
+        if not crops:
+            data['error'] = 'no_crops'
+            yield "Please specify a crop, e.g. \"How does rainfall affect Rice in Punjab?\""
+            return
+        table = self.joined.rainfall
+        states = intent.states or tuple(table.states)
+
+        data.update(rainfall_impact={}, points=int(len(self.joined.frame)))
+        yield "## 🌧️ Rainfall Impact on Crop Production\n\n"
+        for crop in crops:
+            impact = data['rainfall_impact'][crop] = {}
+            rows = []
+            for state in states:
+                stats = table.get(state, crop)
+                impact[state] = stats
+                if stats is not None:
+                    slope = f"{stats['slope']:.2f}" if stats['slope'] is not None else "-"
+                    correlation = f"{stats['correlation']:.2f}" if stats['correlation'] is not None else "-"
+                    rows.append(f"| {state} | {stats['points']} | {correlation} | {slope} | "
+                                f"{describe_correlation(stats['correlation'])} |\n")
+            if rows:
+                header = ("| State | District-years | Correlation | Tons per extra mm | Relationship |\n"
+                          "|---|---|---|---|---|\n")
+                yield f"### {crop}\n" + header + ''.join(rows) + "\n"
+            else:
+                yield f"### {crop}\nNot enough overlapping rainfall and production data.\n\n"
+
+        yield (f"*Source: {len(self.joined.frame)} district-years joining rainfall records with "
+               f"Ministry of Agriculture production data*")
+
+    def _district_places(self, dataset, intent):
+        # (district, state) pairs present in the dataset; state is None when
+        # the district has no rows there at all. A district found under
+        # several states is narrowed to those the question names, if any.
+        places = []
+        for district in intent.districts:
+            states = sorted(self.district_states[dataset].get(district, []))
+            states = [state for state in states if state in intent.states] or states
+            places.extend((district, state) for state in states or [None])
+        return places
+
+    def _district_measure(self, dataset, intent, label, unit):
+        # District, state and national figures all come from the rollup:
+        # constant-time lookups, nothing recomputed from rows.
+        rollup = self.rollups[dataset]
+        years = intent.years
+        national_total, national_count, _, _ = cube_stats(rollup['national'], years)
+        national = national_total / national_count if national_count else None
+
+        data = {'national': national, 'districts': []}
+        lines = []
+        for district, state in self._district_places(dataset, intent):
+            if state is None:
+                lines.append(f"**{district}**: No {label} data available\n\n")
+                continue
+            total, count, low, high = cube_stats(rollup['district'].get(state, {}).get(district), years)
+            state_mean = cube_mean(rollup['state'].get(state), years)
+            entry = {'district': district, 'state': state, 'mean': None, 'min': low, 'max': high,
+                     'records': count, 'state_mean': state_mean}
+            data['districts'].append(entry)
+            if not count:
+                lines.append(f"**{district}** ({state}): No {label} data available\n\n")
+                continue
+            entry['mean'] = total / count
+            line = (f"**{district}** ({state}): Average {label} = {entry['mean']:.2f}{unit} "
+                    f"(range {low:.2f}–{high:.2f}{unit} over {count} record{'s' if count != 1 else ''})")
+            if state_mean is not None:
+                line += f"; {state} average {state_mean:.2f}{unit}"
+            if national is not None:
+                line += f"; national average {national:.2f}{unit}"
+            lines.append(line + "\n\n")
+        return data, lines
+
+    def _district_crop_lines(self, intent):
+        rollup = self.rollups['crop']
+        crops = intent.crops
+        years = intent.years
+
+        data = {}
+        lines = []
+        for district, state in self._district_places('crop', intent):
+            if state is None:
+                lines.append(f"**{district}**: No crop data available\n\n")
+                continue
+            crop_nodes = rollup['district'].get(state, {}).get(district, {})
+            if crops:
+                ranked = [(crop, cube_mean(crop_nodes.get(crop), years)) for crop in crops]
+                ranked = [(crop, avg) for crop, avg in ranked if avg is not None]
+                heading = "Production for specified crops"
+            else:
+                k, bottom = intent.rank
+                ranked = rank_crops(crop_nodes, years, k, bottom)
+                heading = _rank_heading(k, bottom)
+            data[f"{district} ({state})"] = dict(ranked)
+            if not ranked:
+                lines.append(f"**{district}** ({state}): No crop data available\n\n")
+                continue
+            lines.append(f"**{district}** ({state}) - {heading}:\n")
+            for crop, avg_prod in ranked:
+                state_avg = cube_mean(rollup['state'].get(state, {}).get(crop), years)
+                suffix = f" ({state} average {state_avg:.2f} tons)" if state_avg is not None else ""
+                lines.append(f"  - {crop}: {avg_prod:.2f} tons{suffix}\n")
+            lines.append("\n")
+        return data, lines
+
+    def district_rainfall(self, intent, data):
+        rainfall, lines = self._district_measure('rainfall', intent, 'rainfall', ' mm')
+        data['rainfall_mm'] = rainfall
+        yield "## 🌧️ District Rainfall\n\n"
+        yield from lines
+        yield f"*Source: {self.records['rainfall']} records from India Meteorological Department*"
+
+    def district_temperature(self, intent, data):
+        temperature, lines = self._district_measure('temperature', intent, 'temperature', '°C')
+        data['avg_temperature_c'] = temperature
+        yield "## 🌡️ District Temperature\n\n"
+        yield from lines
+        yield f"*Source: {self.records['temperature']} records from India Meteorological Department*"
+
+    def district_crops(self, intent, data):
+        production, lines = self._district_crop_lines(intent)
+        data['production_tons'] = production
+        yield "## 🌾 District Crop Production\n\n"
+        yield ''.join(lines)
+        yield f"*Source: {self.records['crop']} records from Ministry of Agriculture*"
+
+    def district_overview(self, intent, data):
+        # Each section is computed only once the previous one has been taken.
+        yield "## 📊 District Overview\n\n"
+        data['rainfall_mm'], lines = self._district_measure('rainfall', intent, 'rainfall', ' mm')
+        yield "### Rainfall\n" + ''.join(lines)
+        data['avg_temperature_c'], lines = self._district_measure('temperature', intent, 'temperature', '°C')
+        yield "### Temperature\n" + ''.join(lines)
+        data['production_tons'], lines = self._district_crop_lines(intent)
+        yield "### Crop Production\n" + ''.join(lines)
+        yield "*Sources: Integrated data from Ministry of Agriculture & IMD*"
+
+    def _trend_places(self, intent, data):
+        # States whose series are fitted, None standing for India as a whole
+        # when the question names no state. An empty list when it names only
+        # districts, which have no series of their own.
+        if intent.districts and not intent.states:
+            data['error'] = 'no_states'
+            return []
+        return list(intent.states) or [None]
+
+    def _trend_crops(self, state, intent):
+        # The crops asked about, or every crop grown in the state (or India).
+        if intent.crops:
+            return list(intent.crops)
+        return sorted(self.cubes['crop'].get(state, {}) if state else self.rollups['crop']['national'])
+
+    def _trend(self, dataset, intent, data):
+        title, unit, icon, source = SERIES_LABELS[dataset]
+        places = self._trend_places(intent, data)
+        if not places:
+            yield "Trends are fitted for states and for India as a whole; please specify a state."
+            return
+        series = self.trends[dataset]
+        data['trend'] = {}
+        yield f"## {icon} {title} Trend\n\n"
+        if dataset != 'crop':
+            stats = series.trends([(state, None) for state in places], intent.years)
+            rows = []
+            for state, entry in zip(places, stats):
+                data['trend'][state or 'India'] = entry
+                rows.append(_trend_row(state or 'India', entry, unit))
+            yield "| State | Years | Change per year | 95% range | First → last | Trend |\n" \
+                  "|---|---|---|---|---|---|\n" + ''.join(rows) + "\n"
+        else:
+            # Every (state, crop) series is fitted in one call.
+            keys = [(state, crop) for state in places for crop in self._trend_crops(state, intent)]
+            stats = dict(zip(keys, series.trends(keys, intent.years)))
+            for state in places:
+                label = state or 'India'
+                entries = data['trend'][label] = {crop: stats[(s, crop)] for s, crop in keys if s == state}
+                if not intent.crops and not any(entries.values()):
+                    yield f"**{label}**: Not enough years of crop data\n\n"
+                    continue
+                # Fastest growing first when listing every crop.
+                crops = list(entries) if intent.crops else sorted(
+                    (crop for crop in entries if entries[crop]),
+                    key=lambda crop: -(entries[crop]['change_pct'] or 0.0))
+                yield f"### {label}\n| Crop | Years | Change per year | 95% range | First → last | Trend |\n" \
+                      "|---|---|---|---|---|---|\n" + \
+                      ''.join(_trend_row(crop, entries[crop], unit) for crop in crops) + "\n"
+        yield ("*Least-squares line through the yearly means. A trend is called increasing or decreasing "
+               "when the whole 95% range of its yearly change is above or below zero.*\n\n")
+        yield f"*Source: {self.records[dataset]} records from {source}*"
+
+    def _forecast_years(self, intent):
+        # The future years asked for, within the horizon; the next year when
+        # none are.
+        limit = self.last_year + MAX_HORIZON
+        targets = [year for year in intent.years or () if self.last_year < year <= limit]
+        return targets or [self.last_year + 1]
+
+    def _forecast(self, dataset, intent, data):
+        title, unit, icon, source = SERIES_LABELS[dataset]
+        places = self._trend_places(intent, data)
+        if not places:
+            yield "Forecasts are made for states and for India as a whole; please specify a state."
+            return
+        series = self.trends[dataset]
+        targets = self._forecast_years(intent)
+        data.update(forecast={}, years=targets)
+        yield f"## {icon} {title} Forecast\n\n"
+        if intent.years and targets[0] not in intent.years:
+            yield (f"*Forecasts cover {self.last_year + 1}–{self.last_year + MAX_HORIZON}; "
+                   f"showing {targets[0]}.*\n\n")
+        header = " | Year | Linear trend | 95% range | Smoothed | 95% range |\n|---|---|---|---|---|---|\n"
+        if dataset != 'crop':
+            projections = series.forecasts([(state, None) for state in places], targets)
+            rows = []
+            for state, entry in zip(places, projections):
+                data['forecast'][state or 'India'] = entry
+                rows.extend(_forecast_rows(state or 'India', entry, unit))
+            yield "| State" + header + ''.join(rows) + "\n"
+        else:
+            keys = [(state, crop) for state in places for crop in self._trend_crops(state, intent)]
+            projections = dict(zip(keys, series.forecasts(keys, targets)))
+            for state in places:
+                label = state or 'India'
+                entries = data['forecast'][label] = {crop: projections[(s, crop)] for s, crop in keys if s == state}
+                if not intent.crops and not any(entries.values()):
+                    yield f"**{label}**: Not enough years of crop data\n\n"
+                    continue
+                rows = [row for crop, entry in entries.items() if entry or intent.crops
+                        for row in _forecast_rows(crop, entry, unit)]
+                yield f"### {label}\n| Crop" + header + ''.join(rows) + "\n"
+        yield (f"*Projected from yearly means up to {self.last_year}. Linear: least-squares line, 95% "
+               f"prediction interval. Smoothed: Holt's exponential smoothing (α={ALPHA}, β={BETA}), 95% "
+               f"interval from its one-step errors.*\n\n")
+        yield f"*Source: {self.records[dataset]} records from {source}*"
+
+    def rainfall_trend(self, intent, data):
+        yield from self._trend('rainfall', intent, data)
+
+    def temperature_trend(self, intent, data):
+        yield from self._trend('temperature', intent, data)
+
+    def crop_trend(self, intent, data):
+        yield from self._trend('crop', intent, data)
+
+    def rainfall_forecast(self, intent, data):
+        yield from self._forecast('rainfall', intent, data)
+
+    def temperature_forecast(self, intent, data):
+        yield from self._forecast('temperature', intent, data)
+
+    def crop_forecast(self, intent, data):
+        yield from self._forecast('crop', intent, data)
+
+    def _drought_years(self, state, years):
+        # (drought years, years observed) among `years` (None for all) for a
+        # state, or India with None, from the yearly means.
+        node = self.cubes['rainfall'].get(state, {}) if state else self.rollups['rainfall']['national']
+        means = {year: total / count for year, (total, count, _, _) in node.items() if count}
+        if not means:
+            return [], 0
+        normal = sum(means.values()) / len(means)
+        observed = sorted(year for year in means if years is None or year in years)
+        return [year for year in observed if means[year] < (1.0 - DROUGHT_SHORTFALL) * normal], len(observed)
+
+    def _distribution(self, dataset, intent, data):
+        title, unit, icon, source = SERIES_LABELS[dataset]
+        places = self._trend_places(intent, data)
+        if not places:
+            yield "Percentiles are computed for states and for India as a whole; please specify a state."
+            return
+        sketches = self.sketches[dataset]
+        if sketches is None:
+            data['error'] = 'no_sketches'
+            yield (f"Percentiles of {title.lower()} are not available: its sketches outgrew their share of the "
+                   f"memory budget the data was aggregated within.")
+            return
+        percentiles = intent.percentiles or DEFAULT_PERCENTILES
+        # The largest rank error any value shown may have, as a share of its
+        # rows.
+        worst = 0.0
+        data.update(distribution={}, percentiles=list(percentiles))
+        columns = ''.join(f" {_percentile_label(p)} |" for p in percentiles)
+        rule = "|---" * len(percentiles)
+        yield f"## {icon} {title} Distribution\n\n"
+        if dataset != 'crop':
+            drought = dataset == 'rainfall'
+            rows = []
+            for state in places:
+                label = state or 'India'
+                count, values, bound = sketches.quantiles([state] if state else self.all_states, percentiles,
+                                                          years=intent.years)
+                worst = max(worst, bound / count) if count else worst
+                entry = data['distribution'][label] = {
+                    'rows': count, 'percentiles': {f'p{p}': values.get(p) for p in percentiles},
+                    'rank_error_rows': bound}
+                cells = ''.join(f" {_value(values.get(p), unit)} |" for p in percentiles)
+                row = f"| {label} | {count} |{cells}"
+                if drought:
+                    years, observed = self._drought_years(state, intent.years)
+                    entry.update(drought_years=years, years_observed=observed)
+                    listed = f" ({', '.join(str(year) for year in years)})" if years else ""
+                    row += f" {len(years)} of {observed}{listed} |"
+                rows.append(row + "\n")
+            yield (f"| State | Rows |{columns}{' Drought years |' if drought else ''}\n"
+                   f"|---|---{rule}{'|---' if drought else ''}|\n" + ''.join(rows) + "\n")
+        else:
+            for state in places:
+                label = state or 'India'
+                states = [state] if state else self.all_states
+                entries = data['distribution'][label] = {}
+                rows = []
+                for crop in self._trend_crops(state, intent):
+                    count, values, bound = sketches.quantiles(states, percentiles, crop, intent.years)
+                    if not count and not intent.crops:
+                        continue
+                    worst = max(worst, bound / count) if count else worst
+                    entries[crop] = {'rows': count, 'percentiles': {f'p{p}': values.get(p) for p in percentiles},
+                                     'rank_error_rows': bound}
+                    rows.append(f"| {crop} | {count} |" + ''.join(f" {_value(values.get(p), unit)} |"
+                                                              for p in percentiles) + "\n")
+                if not rows:
+                    yield f"**{label}**: No crop data for the selected period\n\n"
+                    continue
+                yield f"### {label}\n| Crop | Rows |{columns}\n|---|---{rule}|\n" + ''.join(rows) + "\n"
+        accuracy = f"within {worst:.2%} of the one asked for" if worst else "exactly the one asked for"
+        yield (f"*Percentiles of the district-level rows, from quantile sketches of {POINTS} points per "
+               f"state{', crop' if dataset == 'crop' else ''} and year: each value's rank among the rows is "
+               f"{accuracy}.*\n\n")
+        if dataset == 'rainfall':
+            yield (f"*Drought year: mean rainfall more than {DROUGHT_SHORTFALL:.0%} below the state's mean over "
+                   f"all years.*\n\n")
+        yield f"*Source: {self.records[dataset]} records from {source}*"
+
+    def rainfall_distribution(self, intent, data):
+        yield from self._distribution('rainfall', intent, data)
+
+    def temperature_distribution(self, intent, data):
+        yield from self._distribution('temperature', intent, data)
+
+    def crop_distribution(self, intent, data):
+        yield from self._distribution('crop', intent, data)
+
+    def trend_dashboard(self, dataset, years=None):
+        # Every series of a dataset with its trend, for dashboards.
+        return self.trends[dataset].dashboard(years)
+
+def _signed(value, unit):
+    # Yearly changes can be small next to the values themselves (a few
+    # hundredths of a degree), so they get a third decimal.
+    return f"{value:+.3f}{unit}" if value is not None else "-"
+
+def _trend_row(label, stats, unit):
+    if stats is None:
+        return f"| {label} | - | - | - | - | not enough years |\n"
+    band = f"{_signed(stats['slope_low'], '')} to {_signed(stats['slope_high'], unit)}" \
+        if stats['slope_low'] is not None else "-"
+    change = f"{stats['first']:.2f} → {stats['last']:.2f}{unit}"
+    if stats['change_pct'] is not None:
+        change += f" ({stats['change_pct']:+.1f}%)"
+    return (f"| {label} | {stats['first_year']}–{stats['last_year']} ({stats['points']}) | "
+            f"{_signed(stats['slope'], unit)} | {band} | {change} | {stats['direction']} |\n")
+
+def _value(value, unit):
+    return f"{value:.2f}{unit}" if value is not None else "-"
+
+def _rank_heading(k, bottom):
+    # "Top 5 crops by production", or "Top crop by production" for one.
+    return f"{'Bottom' if bottom else 'Top'} {f'{k} crops' if k != 1 else 'crop'} by production"
+
+def _percentile_label(p):
+    return "Median" if p == 50 else f"P{p}"
+
+def _forecast_rows(label, entry, unit):
+    if entry is None:
+        return [f"| {label} | - | not enough years | - | - | - |\n"]
+    rows = []
+    for year, p in entry['projections'].items():
+        linear_band = f"{_value(p['linear_low'], '')}–{_value(p['linear_high'], unit)}"
+        smoothed_band = f"{_value(p['smoothed_low'], '')}–{_value(p['smoothed_high'], unit)}"
+        rows.append(f"| {label} | {year} | {_value(p['linear'], unit)} | {linear_band} | "
+                    f"{_value(p['smoothed'], unit)} | {smoothed_band} |\n")
+    return rows
+
+def json_ready(value):
+    # Measures are stored as float32; more than 7 significant digits is noise.
+    if isinstance(value, float):
+        return float(f'{value:.7g}')
+    if isinstance(value, dict):
+        return {key: json_ready(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [json_ready(item) for item in value]
+    return value
+
+_default_engine = None
+
+def get_engine():
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = QAEngine()
+    return _default_engine
+
+def answer(question):
+    return get_engine().answer(question)
+
+def answer_many(questions):
+    return get_engine().answer_many(questions)
+
+def answer_result(question):
+    return get_engine().answer_result(question)
+
+def stream(question):
+    return get_engine().stream(question)
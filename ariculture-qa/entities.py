@@ -0,0 +1,223 @@
+import re
+
+from fuzzy import TrigramIndex, compact, max_edits
+
+# Single-pass entity extraction. All state, district and crop names are
+# compiled into one case-insensitive alternation (longest names first, so
+# "West Bengal" wins over any shorter overlapping name), bounded by word
+# boundaries, together with the year patterns. A question is scanned once and
+# the parsed result is shared by every handler.
+#
+# Years come out as single years plus intervals: "2018-2021", "2018 to 2021",
+# "between 2018 and 2021" give (2018, 2021); "since 2019" gives (2019, None);
+# "before 2020" gives (None, 2019); "last 5 years" and "next 3 years" are kept
+# as counts because they are relative to the newest year in the data.
+#
+# "top 5" and "bottom 3" (also "highest"/"lowest", with or without a count)
+# are picked up in the same pass as the size and direction of a ranking, and
+# "median", "quartiles", "P90" or "10th percentile" as the percentiles asked
+# for.
+#
+# Words the exact pass leaves uncovered are then looked up in a trigram index
+# of the same names, longest run of adjacent words first, so "Karnatka",
+# "Tamilnadu" or "Utar Pradesh" still resolve; each such match is reported as
+# a correction. Districts are many and short ones sit within an edit of
+# ordinary words ("summer" and "Surmer"), so a fuzzy district match needs
+# DISTRICT_EXTRA_LETTERS more letters for each edit than a state or crop.
+
+YEAR_PATTERN = r'(?:19|20)\d{2}'
+_RANGE_SEPARATOR = r'\s*(?:-|–|to|until|till|through)\s*'
+
+YEAR_ALTERNATIVES = [
+    rf'between\s+(?P<between_start>{YEAR_PATTERN})\s+and\s+(?P<between_end>{YEAR_PATTERN})',
+    rf'(?:from\s+)?(?P<range_start>{YEAR_PATTERN}){_RANGE_SEPARATOR}(?P<range_end>{YEAR_PATTERN})',
+    rf'(?:since|from|after)\s+(?P<since>{YEAR_PATTERN})',
+    rf'(?P<until_word>before|until|till|up\s+to)\s+(?P<until>{YEAR_PATTERN})',
+    rf'(?:last|past|previous)\s+(?P<last>\d{{1,3}})\s+years?',
+    rf'(?P<next_word>next|coming)\s+(?:(?P<next>\d{{1,3}})\s+)?years?',
+    rf'(?P<year>{YEAR_PATTERN})',
+]
+
+RANK_ALTERNATIVE = r'(?P<rank_word>top|bottom|highest|lowest)(?:\s+(?P<rank>\d{1,2}))?'
+BOTTOM_WORDS = ('bottom', 'lowest')
+PERCENTILE_ALTERNATIVE = (r'(?P<median>median)|(?P<quartiles>quartiles?)|p(?P<p>\d{1,2})'
+                          r'|(?P<nth>\d{1,2})(?:st|nd|rd|th)?[\s-]+percentile')
+
+DISTRICT_EXTRA_LETTERS = 2
+
+WORD_PATTERN = re.compile(r"[^\W_]+")
+# Question vocabulary that never starts or ends a place or crop name (but may
+# sit inside one, as in "Jammu and Kashmir").
+COMMON_WORDS = frozenset("""
+    a about across affect affects against all an analyse analyze and any are as average be between both
+    by climate coming compare comparison correlation count crop crops data declining decreasing depend
+    depends did distribution district districts do does drought droughts during each effect everything
+    expected falling for forecast from give going how impact in increasing influence is last list me
+    median most next of on or over past patterns percentile percentiles predict previous production
+    projection quartile quartiles rain rainfall relationship rising show since spread state states tell
+    temperature temperatures than the to top trend trends until versus vs was were what when where which
+    will with year years yield
+""".split())
+
+class ParsedQuestion:
+    def __init__(self, text, states, crops, districts, years, spans, year_ranges=(), last_years=None,
+                 corrections=(), rank=None, next_years=None, percentiles=()):
+        self.text = text
+        self.lower = text.lower()
+        self.states = states
+        self.crops = crops
+        self.districts = districts
+        self.years = years
+        self.year_ranges = list(year_ranges)
+        self.last_years = last_years
+        self.next_years = next_years
+        self.spans = spans
+        self.corrections = list(corrections)
+        # (k, bottom) when the question asks for a ranking, else None
+        self.rank = rank
+        # percentiles asked for (50 for a median), in the order found
+        self.percentiles = list(percentiles)
+
+    def has_years(self):
+        return bool(self.years or self.year_ranges or self.last_years or self.next_years)
+
+    def __repr__(self):
+        return (f"ParsedQuestion(states={self.states}, crops={self.crops}, "
+                f"districts={self.districts}, years={self.years}, "
+                f"year_ranges={self.year_ranges}, last_years={self.last_years}, next_years={self.next_years}, "
+                f"corrections={self.corrections}, rank={self.rank}, percentiles={self.percentiles})")
+
+class EntityExtractor:
+    def __init__(self, states=(), crops=(), districts=()):
+        # lower-cased surface form -> [(kind, canonical name)]
+        self.lookup = {}
+        for kind, names in (('state', states), ('crop', crops), ('district', districts)):
+            for name in names:
+                self.lookup.setdefault(name.lower(), []).append((kind, name))
+        names = sorted(self.lookup, key=lambda name: (-len(name), name))
+        alternatives = [PERCENTILE_ALTERNATIVE, RANK_ALTERNATIVE] + YEAR_ALTERNATIVES
+        if names:
+            alternatives.append('(?P<name>' + '|'.join(re.escape(name) for name in names) + ')')
+        self.pattern = re.compile(r'(?<!\w)(?:' + '|'.join(alternatives) + r')(?!\w)', re.IGNORECASE)
+        self.fuzzy = TrigramIndex(entry for entries in self.lookup.values() for entry in entries)
+        # Longest run of adjacent words tried as one fuzzy name.
+        self.max_words = max((len(name.split()) for name in self.lookup), default=1)
+
+    def extract(self, question):
+        found = {'state': [], 'crop': [], 'district': []}
+        years = []
+        year_ranges = []
+        last_years = None
+        next_years = None
+        rank = None
+        percentiles = []
+        spans = []
+        for match in self.pattern.finditer(question):
+            groups = match.groupdict()
+            span = (match.start(), match.end())
+            if groups.get('name'):
+                for kind, name in self.lookup[groups['name'].lower()]:
+                    spans.append(span + (kind, name))
+                    if name not in found[kind]:
+                        found[kind].append(name)
+                continue
+            if groups['median'] or groups['quartiles'] or groups['p'] or groups['nth']:
+                if groups['median']:
+                    found_percentiles = [50]
+                elif groups['quartiles']:
+                    found_percentiles = [25, 50, 75]
+                else:
+                    found_percentiles = [int(groups['p'] or groups['nth'])]
+                for percentile in found_percentiles:
+                    if 0 < percentile < 100 and percentile not in percentiles:
+                        percentiles.append(percentile)
+                spans.append(span + ('percentiles', tuple(found_percentiles)))
+                continue
+            if groups['rank_word']:
+                k = max(int(groups['rank'] or 3), 1)
+                rank = (k, groups['rank_word'].lower() in BOTTOM_WORDS)
+                spans.append(span + ('rank', rank))
+                continue
+
+            if groups['year']:
+                year = int(groups['year'])
+                spans.append(span + ('year', year))
+                if year not in years:
+                    years.append(year)
+                continue
+            if groups['last']:
+                last_years = max(last_years or 0, int(groups['last']))
+                spans.append(span + ('last_years', last_years))
+                continue
+            if groups['next_word']:
+                next_years = max(next_years or 0, int(groups['next'] or 1))
+                spans.append(span + ('next_years', next_years))
+                continue
+
+            if groups['between_start']:
+                interval = (int(groups['between_start']), int(groups['between_end']))
+            elif groups['range_start']:
+                interval = (int(groups['range_start']), int(groups['range_end']))
+            elif groups['since']:
+                # "after 2019" excludes 2019; "since"/"from" include it.
+                start = int(groups['since'])
+                if match.group(0).lower().startswith('after'):
+                    start += 1
+                interval = (start, None)
+            else:
+                end = int(groups['until'])
+                if groups['until_word'].lower() == 'before':
+                    end -= 1
+                interval = (None, end)
+            if interval[0] is not None and interval[1] is not None and interval[0] > interval[1]:
+                interval = (interval[1], interval[0])
+            spans.append(span + ('year_range', interval))
+            if interval not in year_ranges:
+                year_ranges.append(interval)
+        corrections = self.correct(question, spans, found)
+        return ParsedQuestion(question, found['state'], found['crop'], found['district'], years, spans,
+                              year_ranges, last_years, corrections, rank, next_years, percentiles)
+
+    def correct(self, question, spans, found):
+        # Fuzzy pass over the words no exact match covered. Adds what it finds
+        # to `spans` and `found` and returns the corrections made; anything
+        # found here differs from the canonical name (the exact pass is
+        # case-insensitive), if only in spacing.
+        covered = [(start, end) for start, end, _, _ in spans]
+        words = [match for match in WORD_PATTERN.finditer(question)
+                 if not any(start < match.end() and match.start() < end for start, end in covered)]
+        corrections = []
+        i = 0
+        while i < len(words):
+            if words[i].group().lower() in COMMON_WORDS:
+                i += 1
+                continue
+            for size in range(min(self.max_words, len(words) - i), 0, -1):
+                run = words[i:i + size]
+                if run[-1].group().lower() in COMMON_WORDS:
+                    continue
+                # Only words separated by whitespace form one name.
+                if any(question[a.end():b.start()].strip() for a, b in zip(run, run[1:])):
+                    continue
+                text = question[run[0].start():run[-1].end()]
+                district_edits = max_edits(len(compact(text)) - DISTRICT_EXTRA_LETTERS)
+                matches = [match for match in self.fuzzy.lookup(text)
+                           if match.kind != 'district' or match.distance <= district_edits]
+                if not matches:
+                    continue
+                # Every name tied for the closest distance is taken, as the
+                # exact pass does for a name that is both a state and a district.
+                for correction in matches:
+                    if correction.distance != matches[0].distance:
+                        break
+                    spans.append((run[0].start(), run[-1].end(), correction.kind, correction.name))
+                    if correction.name not in found[correction.kind]:
+                        found[correction.kind].append(correction.name)
+                    corrections.append(correction)
+                i += size
+                break
+            else:
+                i += 1
+        if corrections:
+            spans.sort(key=lambda span: span[0])
+        return corrections
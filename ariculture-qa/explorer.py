@@ -0,0 +1,216 @@
+import tempfile
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from aggregates import cube_stats
+
+# Server-side explorer over the raw rows behind the answers.
+#
+# A selection is a dataset filtered by states, crops, years and districts,
+# the same filters a parsed question carries. States and years are pushed
+# down onto the SortedIndex: every (state, run of consecutive years) is a
+# pair of binary searches giving one contiguous span of the (state, year)
+# sorted table, so rows outside the filter are never looked at. Crops and
+# districts are then tested on the category codes inside those spans only.
+# No rows are copied until a page or an export chunk is taken, and then only
+# that page or chunk.
+#
+# The rows behind each aggregate (per state, and per crop for production)
+# come from the rollups, not the rows: they are the exact counts the answers
+# averaged over, available even when the raw rows are not kept (see
+# streaming.py).
+
+PAGE_ROWS = 50
+MAX_PAGE_ROWS = 1000
+EXPORT_CHUNK_ROWS = 50_000
+NOT_KEPT = "raw rows are not kept when the data is aggregated within a memory budget"
+
+def year_runs(years):
+    # Sorted years -> (first, last) of each run of consecutive years.
+    runs = []
+    for year in years:
+        if runs and year == runs[-1][1] + 1:
+            runs[-1][1] = year
+        else:
+            runs.append([year, year])
+    return [tuple(run) for run in runs]
+
+def _wanted_codes(df, column, names):
+    codes = df[column].cat.categories.get_indexer(list(names))
+    return codes[codes >= 0]
+
+class RowSelection:
+    def __init__(self, dataset, index, rollup, states=(), crops=(), years=None, districts=()):
+        # `index` is the dataset's SortedIndex, or None when the raw rows are
+        # not kept; `rollup` its rollup. Empty filters select everything; an
+        # empty `years` tuple selects nothing.
+        self.dataset = dataset
+        self.rollup = rollup
+        self.states = tuple(states) or tuple(sorted(rollup['state']))
+        self.crops = tuple(crops) if dataset == 'crop' else ()
+        self.years = years
+        self.districts = tuple(districts)
+        self.df = index.df if index is not None else None
+        self.spans = []
+        if index is None:
+            return
+        runs = [(None, None)] if years is None else year_runs(years)
+        tests = []
+        if self.crops:
+            tests.append((self.df['crop type'].array.codes, _wanted_codes(self.df, 'crop type', self.crops)))
+        if self.districts:
+            tests.append((self.df['district'].array.codes, _wanted_codes(self.df, 'district', self.districts)))
+        # (lo, hi, positions of the matching rows in [lo, hi), or None for
+        # all of them)
+        for state in self.states:
+            for start, end in runs:
+                lo, hi = index.bounds(state, start, end)
+                if hi <= lo:
+                    continue
+                if not tests:
+                    self.spans.append((lo, hi, None))
+                    continue
+                mask = np.ones(hi - lo, dtype=bool)
+                for codes, wanted in tests:
+                    mask &= np.isin(codes[lo:hi], wanted)
+                positions = np.flatnonzero(mask) + lo
+                if len(positions):
+                    self.spans.append((lo, hi, positions))
+
+    @property
+    def rows_kept(self):
+        return self.df is not None
+
+    @property
+    def total(self):
+        # Rows matching the filters.
+        if self.df is None:
+            return sum(group['rows'] for group in self.groups())
+        return sum(hi - lo if positions is None else len(positions) for lo, hi, positions in self.spans)
+
+    def groups(self):
+        # The rows behind each aggregate: one entry per state (per state and
+        # crop for production) with the number of rows and their mean over
+        # the selected years, as the answers compute it.
+        groups = []
+        for state in self.states:
+            if self.districts:
+                nodes = [self.rollup['district'].get(state, {}).get(district) for district in self.districts]
+                nodes = [node for node in nodes if node]
+            else:
+                nodes = [self.rollup['state'].get(state)] if state in self.rollup['state'] else []
+            if self.dataset == 'crop':
+                crops = self.crops or sorted({crop for node in nodes for crop in node})
+                for crop in crops:
+                    group = self._group(state, [node[crop] for node in nodes if crop in node])
+                    if group is not None:
+                        groups.append(dict(group, crop=crop))
+            else:
+                group = self._group(state, nodes)
+                if group is not None:
+                    groups.append(group)
+        return groups
+
+    def _group(self, state, year_nodes):
+        total = count = 0
+        for node in year_nodes:
+            node_total, node_count, _, _ = cube_stats(node, self.years)
+            total += node_total
+            count += node_count
+        if not count:
+            return None
+        return {'state': state, 'rows': int(count), 'mean': total / count}
+
+    def page(self, offset=0, limit=PAGE_ROWS):
+        # Rows [offset, offset + limit) of the selection, at most
+        # MAX_PAGE_ROWS. Only those rows are copied.
+        if self.df is None:
+            raise LookupError(NOT_KEPT)
+        offset = max(int(offset), 0)
+        limit = min(max(int(limit), 0), MAX_PAGE_ROWS)
+        parts = []
+        skip, wanted = offset, limit
+        for lo, hi, positions in self.spans:
+            if wanted <= 0:
+                break
+            size = hi - lo if positions is None else len(positions)
+            if skip >= size:
+                skip -= size
+                continue
+            take = min(size - skip, wanted)
+            if positions is None:
+                parts.append(np.arange(lo + skip, lo + skip + take))
+            else:
+                parts.append(positions[skip:skip + take])
+            skip = 0
+            wanted -= take
+        positions = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        return self.df.iloc[positions].reset_index(drop=True)
+
+    def chunks(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        # The whole selection, `chunk_rows` rows at a time.
+        if self.df is None:
+            raise LookupError(NOT_KEPT)
+        for lo, hi, positions in self.spans:
+            if positions is None:
+                for start in range(lo, hi, chunk_rows):
+                    yield self.df.iloc[start:min(start + chunk_rows, hi)]
+            else:
+                for start in range(0, len(positions), chunk_rows):
+                    yield self.df.iloc[positions[start:start + chunk_rows]]
+
+    def csv_chunks(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        # CSV text of the selection, header first, one piece per chunk.
+        if self.df is None:
+            raise LookupError(NOT_KEPT)
+        yield self.df.iloc[:0].to_csv(index=False)
+        for chunk in self.chunks(chunk_rows):
+            yield chunk.to_csv(index=False, header=False)
+
+    def csv_bytes(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        # The whole CSV encoded, for a download that needs it in one piece.
+        # The chunks are spooled to a temporary file and read back once, so
+        # the text pieces and the bytes are not held at the same time.
+        with tempfile.TemporaryFile() as f:
+            for piece in self.csv_chunks(chunk_rows):
+                f.write(piece.encode('utf-8'))
+            f.seek(0)
+            return f.read()
+
+    def arrow_chunks(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        # The selection as an Arrow IPC stream, one piece per record batch.
+        if pa is None:
+            raise LookupError("Arrow export needs pyarrow")
+        if self.df is None:
+            raise LookupError(NOT_KEPT)
+        sink = _Pieces()
+        schema = pa.Schema.from_pandas(self.df.iloc[:0], preserve_index=False)
+        writer = pa.ipc.new_stream(sink, schema)
+        for chunk in self.chunks(chunk_rows):
+            writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.take()
+        writer.close()
+        yield sink.take()
+
+class _Pieces:
+    # File-like sink handing out what was written since the last take().
+    def __init__(self):
+        self.pieces = []
+        self.closed = False
+
+    def write(self, data):
+        self.pieces.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.pieces)
+        self.pieces = []
+        return data
@@ -0,0 +1,141 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Typo-tolerant name lookup. Every vocabulary entry is reduced to a compact
+# key (lower-cased, spaces dropped, so "Tamilnadu" and "Tamil Nadu" meet) and
+# indexed by its padded character trigrams. A lookup counts shared trigrams
+# for every entry at once (one np.bincount over the query's postings lists)
+# and only runs the edit-distance check on entries that pass three vectorized
+# filters:
+#
+#   - length: strings within k edits differ in length by at most k;
+#   - q-gram count: one edit destroys at most 3 trigrams, so a string within
+#     k edits of the query shares at least len(query grams) - 3k of them;
+#   - bag distance: one edit adds and/or removes at most one character, so
+#     the letter counts of the two strings differ by at most k either way.
+#
+# The distance itself is optimal string alignment (Levenshtein plus adjacent
+# transpositions), banded to k and abandoned as soon as a row exceeds k.
+
+Correction = namedtuple('Correction', ['text', 'kind', 'name', 'distance'])
+
+PAD = '$$'
+# Letter histograms count a-z; everything else shares the last bucket.
+HISTOGRAM_SIZE = 27
+
+def compact(text):
+    return ''.join(text.lower().split())
+
+def trigrams(key):
+    padded = PAD + key + PAD
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def histograms(keys):
+    # One row of letter counts per key.
+    lengths = [len(key) for key in keys]
+    chars = np.frombuffer(''.join(keys).encode('utf-32-le'), dtype=np.uint32) - ord('a')
+    buckets = np.minimum(chars, HISTOGRAM_SIZE - 1)
+    counts = np.zeros((len(keys), HISTOGRAM_SIZE), dtype=np.int16)
+    np.add.at(counts, (np.repeat(np.arange(len(keys)), lengths), buckets), 1)
+    return counts
+
+def max_edits(length):
+    # Short names are too easy to hit by accident ("Pune", "Rice").
+    if length < 5:
+        return 0
+    return 1 if length < 9 else 2
+
+def bounded_distance(a, b, k):
+    # Edit distance between a and b if it is at most k, else None.
+    if abs(len(a) - len(b)) > k:
+        return None
+    if len(a) > len(b):
+        a, b = b, a
+    big = k + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [big] * (len(b) + 1)
+        current[0] = i
+        lo = max(1, i - k)
+        hi = min(len(b), i + k)
+        row_min = current[0] if lo == 1 else big
+        for j in range(lo, hi + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > k:
+            return None
+        previous2, previous = previous, current
+    distance = previous[len(b)]
+    return distance if distance <= k else None
+
+class TrigramIndex:
+    def __init__(self, entries=()):
+        # entries: (kind, name) pairs. Names sharing a compact key share one
+        # slot, like the exact matcher's lookup.
+        self.keys = []
+        self.entries = []
+        self.slots = {}
+        self.postings = {}
+        for kind, name in entries:
+            key = compact(name)
+            slot = self.slots.get(key)
+            if slot is None:
+                slot = self.slots[key] = len(self.keys)
+                self.keys.append(key)
+                self.entries.append([])
+                for gram in trigrams(key):
+                    self.postings.setdefault(gram, []).append(slot)
+            if (kind, name) not in self.entries[slot]:
+                self.entries[slot].append((kind, name))
+        self.postings = {gram: np.asarray(slots, dtype=np.int32) for gram, slots in self.postings.items()}
+        self.lengths = np.fromiter((len(key) for key in self.keys), dtype=np.int32, count=len(self.keys))
+        self.histograms = histograms(self.keys)
+        self.longest = int(self.lengths.max(initial=0))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, text, max_distance=None, limit=5):
+        # Ranked corrections for `text`: closest first, then most trigrams in
+        # common, then alphabetical.
+        key = compact(text)
+        if not key:
+            return []
+        if max_distance is None:
+            max_distance = max_edits(len(key))
+        if len(key) > self.longest + max_distance:
+            return []
+        slot = self.slots.get(key)
+        if max_distance == 0:
+            if slot is None:
+                return []
+            return [Correction(text, kind, name, 0) for kind, name in self.entries[slot]][:limit]
+
+        grams = trigrams(key)
+        postings = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not postings:
+            return []
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.keys))
+        needed = max(len(grams) - 3 * max_distance, 1)
+        candidates = np.flatnonzero((shared >= needed) & (np.abs(self.lengths - len(key)) <= max_distance))
+        difference = self.histograms[candidates] - histograms([key])[0]
+        surplus = np.maximum(difference, 0).sum(axis=1)
+        deficit = np.maximum(-difference, 0).sum(axis=1)
+        candidates = candidates[np.maximum(surplus, deficit) <= max_distance]
+        ranked = []
+        for candidate in candidates.tolist():
+            distance = bounded_distance(key, self.keys[candidate], max_distance)
+            if distance is not None:
+                ranked.append((distance, -int(shared[candidate]), self.keys[candidate], candidate))
+        ranked.sort()
+        corrections = []
+        for distance, _, _, candidate in ranked:
+            corrections.extend(Correction(text, kind, name, distance) for kind, name in self.entries[candidate])
+        return corrections[:limit]
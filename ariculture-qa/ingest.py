@@ -0,0 +1,156 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from columnar import narrow_numeric, normalise_columns, sort_rows
+from manifest import drop_dir
+from metrics import metrics
+
+# Incremental ingestion. New season data arrives as append-only CSV fragments
+# in the drop directory (incoming/ next to the source CSVs, see manifest.py),
+# each with the header of one of the three source files. Fragments are applied
+# in name order; a writer should create one under another name and rename it
+# to *.csv once it is complete.
+#
+# Only the new rows are validated and normalised: names are trimmed and
+# matched case-insensitively against the names already loaded and those first
+# seen earlier in the same batch, so "kerala " in one fragment and "Kerala" in
+# another are one new state. Rows with a missing name, a year outside
+# 1900-2099 or a measure that is not a finite number (or is negative, for
+# production and rainfall) are rejected. The rows are then merged into the
+# (state, year)-sorted tables by binary search, so the existing rows are
+# copied once and never re-sorted. The given tables are not modified; readers
+# of the old ones are unaffected.
+
+COLUMNS = {
+    'crop': ['state', 'district', 'year', 'crop type', 'production volume'],
+    'rainfall': ['state', 'district', 'year', 'rainfall mm'],
+    'temperature': ['state', 'district', 'year', 'avg temperature'],
+}
+NAME_COLUMNS = ('state', 'district', 'crop type')
+YEARS = (1900, 2099)
+NON_NEGATIVE = ('production volume', 'rainfall mm')
+
+def vocabularies(frames):
+    # name column -> names already loaded
+    return {column: [str(name) for name in df[column].cat.categories]
+            for df in frames.values() for column in NAME_COLUMNS if column in df}
+
+def canonical_names(known=None):
+    # name column -> {lower-cased name: name} for the names already loaded.
+    return {column: {name.lower(): name for name in names} for column, names in (known or {}).items()}
+
+def read_fragment(path, canonical=None):
+    # (dataset, valid rows, rejected row count). `canonical` is
+    # canonical_names() and gains the new names found here, spelt as first
+    # seen.
+    canonical = {} if canonical is None else canonical
+    df = normalise_columns(pd.read_csv(path, dtype=str, keep_default_na=False))
+    dataset = next((name for name, columns in COLUMNS.items() if set(columns) <= set(df.columns)), None)
+    if dataset is None:
+        raise ValueError(f"{os.path.basename(path)}: header matches no dataset: {', '.join(df.columns)}")
+    data = {}
+    valid = np.ones(len(df), dtype=bool)
+    for column in COLUMNS[dataset]:
+        if column in NAME_COLUMNS:
+            # Each distinct spelling is cleaned up once.
+            codes, spellings = pd.factorize(df[column])
+            names = canonical.setdefault(column, {})
+            names = [names.setdefault(name.lower(), name) if name else name
+                     for name in (' '.join(spelling.split()) for spelling in spellings)]
+            names = np.array(names or [''], dtype=object)
+            values = pd.Series(names[codes], dtype=str)
+            valid &= (values != '').to_numpy()
+        else:
+            values = pd.to_numeric(df[column], errors='coerce').astype('float64')
+            if column == 'year':
+                ok = values.between(*YEARS) & (values == values.round())
+            else:
+                ok = np.isfinite(values)
+                if column in NON_NEGATIVE:
+                    ok &= values >= 0
+            valid &= ok.to_numpy()
+        data[column] = values
+    rows = pd.DataFrame(data)[valid].reset_index(drop=True)
+    rows['year'] = rows['year'].astype(np.int64)
+    return dataset, rows, int((~valid).sum())
+
+def read_fragments(data_dir, names, known=None):
+    # dataset -> new rows (datasets without any are left out), and one report
+    # per fragment. A fragment that cannot be read at all is reported and
+    # skipped.
+    parts = {}
+    reports = []
+    canonical = canonical_names(known)
+    for name in names:
+        try:
+            dataset, rows, rejected = read_fragment(os.path.join(drop_dir(data_dir), name), canonical)
+        except (OSError, ValueError) as exc:
+            metrics.count('fragments_rejected')
+            reports.append({'fragment': name, 'dataset': None, 'rows': 0, 'rejected': 0, 'error': str(exc)})
+            continue
+        parts.setdefault(dataset, []).append(rows)
+        metrics.count('rows_ingested', len(rows))
+        metrics.count('rows_rejected', rejected)
+        reports.append({'fragment': name, 'dataset': dataset, 'rows': len(rows), 'rejected': rejected, 'error': None})
+    rows = {dataset: pd.concat(frames, ignore_index=True) for dataset, frames in parts.items()}
+    return {dataset: df for dataset, df in rows.items() if len(df)}, reports
+
+def _sort_keys(df):
+    return (df['state'].array.codes.astype(np.int64) << 16) | (df['year'].to_numpy().astype(np.int64) + 32768)
+
+def _merge_sorted(frame, rows):
+    # Both sorted by (state, year). New rows go after the existing rows with
+    # the same key, where a stable sort of the concatenation would put them.
+    positions = np.searchsorted(_sort_keys(frame), _sort_keys(rows), side='right') + np.arange(len(rows))
+    existing = np.ones(len(frame) + len(rows), dtype=bool)
+    existing[positions] = False
+    data = {}
+    for column in frame.columns:
+        old, new = frame[column], rows[column]
+        categorical = isinstance(old.dtype, pd.CategoricalDtype)
+        if categorical:
+            old_values, new_values = old.array.codes, new.array.codes
+        else:
+            old_values, new_values = old.to_numpy(), narrow_numeric(new)
+        values = np.empty(len(existing), dtype=np.result_type(old_values, new_values))
+        values[existing] = old_values
+        values[positions] = new_values
+        if categorical:
+            values = pd.Categorical.from_codes(values, old.cat.categories, validate=False)
+        data[column] = values
+    return pd.DataFrame(data, copy=False)
+
+def merge_tables(frames, rows):
+    # frames: dataset -> loaded table; rows: dataset -> rows from
+    # read_fragments. Returns the merged tables and the rows encoded like
+    # them. Name columns keep one sorted dictionary across all datasets, as
+    # share_categories() sets up; a new name extends it.
+    frames = dict(frames)
+    rows = dict(rows)
+    for column in NAME_COLUMNS:
+        names = [dataset for dataset, df in frames.items() if column in df]
+        categories = set().union(*(frames[dataset][column].cat.categories for dataset in names),
+                                 *(df[column] for df in rows.values() if column in df))
+        categories = sorted(str(name) for name in categories)
+        for dataset in names:
+            values = frames[dataset][column]
+            if list(values.cat.categories) != categories:
+                frames[dataset] = frames[dataset].assign(**{column: values.cat.set_categories(categories)})
+        for dataset, df in rows.items():
+            if column in df:
+                rows[dataset] = df.assign(**{column: pd.Categorical(df[column], categories)})
+    for dataset, df in rows.items():
+        df = sort_rows(df)
+        frames[dataset] = _merge_sorted(frames[dataset], df)
+        # Aggregated from the same (possibly narrowed) values as the tables.
+        rows[dataset] = df.astype(frames[dataset].dtypes.to_dict())
+    return frames, rows
+
+def apply_fragments(frames, data_dir, names):
+    # The tables with the named fragments merged in, and the fragment reports.
+    rows, reports = read_fragments(data_dir, names, vocabularies(frames))
+    if rows:
+        frames, _ = merge_tables(frames, rows)
+    return frames, reports
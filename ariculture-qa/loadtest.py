@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Load test for the JSON API. Opens `--concurrency` keep-alive connections
+# and sends a fixed mix of /answer and /rainfall, /crops requests for
+# `--duration` seconds, then prints throughput and latency percentiles as
+# JSON. With --spawn it starts a local `api.py` instance on --port first.
+#
+#   python loadtest.py --spawn --concurrency 32 --duration 10
+
+QUESTIONS = [
+    "Compare rainfall in Karnataka and Tamil Nadu",
+    "Show top crops in Maharashtra and Punjab",
+    "Analyze temperature in Uttar Pradesh and Bihar",
+    "Compare everything for Karnataka and West Bengal with Rice and Wheat",
+    "Crop production of Rice in West Bengal in 2020",
+]
+
+def request_mix():
+    requests = []
+    for question in QUESTIONS:
+        body = json.dumps({'question': question}).encode()
+        requests.append(('POST', '/answer', body))
+    requests.append(('GET', '/rainfall?states=Karnataka,Punjab&years=2019,2020', b''))
+    requests.append(('GET', '/crops?states=Bihar,Gujarat&crops=Rice', b''))
+    return requests
+
+async def _read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+async def _client(host, port, deadline, requests, offset, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = offset
+    try:
+        while time.perf_counter() < deadline:
+            method, path, body = requests[i % len(requests)]
+            i += 1
+            head = (f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+            start = time.perf_counter()
+            writer.write(head.encode() + body)
+            await writer.drain()
+            status = await _read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+async def run(host, port, concurrency, duration):
+    requests = request_mix()
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(
+        _client(host, port, deadline, requests, i, latencies, errors) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    values = np.asarray(latencies) * 1000.0
+    return {
+        'concurrency': concurrency,
+        'duration_s': elapsed,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max()),
+    }
+
+async def _wait_for_server(host, port, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Q&A JSON API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--spawn', action='store_true', help="start a local api.py instance first")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.spawn:
+        api_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api.py')
+        server = subprocess.Popen([sys.executable, api_path, '--host', args.host, '--port', str(args.port)])
+    try:
+        asyncio.run(_wait_for_server(args.host, args.port))
+        report = asyncio.run(run(args.host, args.port, args.concurrency, args.duration))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
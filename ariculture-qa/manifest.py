@@ -0,0 +1,118 @@
+import json
+import os
+
+# Small JSON summary of the datasets: vocabularies, year span and record
+# counts. It is written whenever the data is loaded and read by the apps at
+# startup, so the shell and sidebar render without importing pandas or
+# touching the data; the engine is only loaded when the first question needs
+# it. The manifest is only trusted while every source CSV still has the size
+# and mtime it was built from and the drop directory holds the same appended
+# fragments (see ingest.py).
+#
+# This module only uses the standard library; keep it that way.
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_VERSION = 1
+# Kept inside the columnar cache directory, so clearing the cache clears it.
+MANIFEST_PATH = os.path.join('.columnar', 'manifest.json')
+
+SOURCE_FILES = {
+    'crop': 'crop_production.csv',
+    'rainfall': 'rainfall_data.csv',
+    'temperature': 'temperature_data.csv',
+}
+
+# Appended CSV fragments are dropped here, next to the source files, unless
+# AGRI_QA_DROP_DIR names another directory.
+DROP_DIRNAME = 'incoming'
+
+def drop_dir(data_dir):
+    return os.environ.get('AGRI_QA_DROP_DIR') or os.path.join(data_dir, DROP_DIRNAME)
+
+def fragment_stamps(data_dir):
+    # name -> [size, mtime_ns] for every *.csv in the drop directory, in the
+    # order they are applied.
+    directory = drop_dir(data_dir)
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.csv'))
+    except OSError:
+        return {}
+    stamps = {}
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        stamps[name] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+def source_stamps(data_dir):
+    stamps = {}
+    for dataset, filename in SOURCE_FILES.items():
+        stat = os.stat(os.path.join(data_dir, filename))
+        stamps[dataset] = [stat.st_size, stat.st_mtime_ns]
+    stamps['fragments'] = fragment_stamps(data_dir)
+    return stamps
+
+def build_manifest(crop_df, rainfall_df, temp_df, sources=None):
+    # `sources` are the source_stamps() the frames were loaded from, or None
+    # when they did not come from local CSVs (a shared-memory snapshot).
+    frames = {'crop': crop_df, 'rainfall': rainfall_df, 'temperature': temp_df}
+    return make_manifest(crop_df['state'].cat.categories, crop_df['crop type'].cat.categories,
+                         crop_df['district'].cat.categories,
+                         [year for df in frames.values() for year in (df['year'].min(), df['year'].max())],
+                         {name: len(df) for name, df in frames.items()}, sources)
+
+def make_manifest(states, crops, districts, years, records, sources=None):
+    # From the vocabularies, the years present (or just the extremes) and
+    # dataset -> record count, for data that is not held as tables.
+    return {
+        'version': MANIFEST_VERSION,
+        'sources': sources,
+        'states': [str(state) for state in states],
+        'crops': [str(crop) for crop in crops],
+        'districts': [str(district) for district in districts],
+        'first_year': int(min(years)),
+        'last_year': int(max(years)),
+        'records': {name: int(count) for name, count in records.items()},
+    }
+
+def extend_manifest(manifest, rows, sources=None):
+    # The manifest with appended rows (dataset -> table of them) counted in.
+    names = {'states': 'state', 'crops': 'crop type', 'districts': 'district'}
+    found = {key: set(manifest[key]) for key in names}
+    years = [manifest['first_year'], manifest['last_year']]
+    records = dict(manifest['records'])
+    for dataset, df in rows.items():
+        for key, column in names.items():
+            if column in df:
+                found[key].update(str(name) for name in df[column].unique())
+        if len(df):
+            years += [df['year'].min(), df['year'].max()]
+        records[dataset] = records.get(dataset, 0) + len(df)
+    return make_manifest(sorted(found['states']), sorted(found['crops']), sorted(found['districts']), years,
+                         records, sources)
+
+def read_manifest(data_dir=DATA_DIR):
+    try:
+        with open(os.path.join(data_dir, MANIFEST_PATH)) as f:
+            manifest = json.load(f)
+        stamps = source_stamps(data_dir)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('sources') != stamps:
+        return None
+    return manifest
+
+def write_manifest(data_dir, manifest):
+    path = os.path.join(data_dir, MANIFEST_PATH)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        # Read-only deployments simply start without a manifest.
+        return False
+    return True
@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Hot-path instrumentation. Stages (load, extraction, routing, each handler,
+# rendering) record wall time into Prometheus-style histograms, and counters
+# track rows aggregated, cache hits/misses and answer sizes.
+#
+# Recording is off unless AGRI_QA_METRICS=1 (or `metrics.enabled = True`) or
+# the current thread is inside `metrics.trace()`, which is how the apps'
+# debug-timings panel collects one answer's breakdown. When off, `stage()`
+# returns a shared no-op context manager and `count()` returns immediately.
+#
+# AGRI_QA_METRICS_FILE names a file that `export()` rewrites in the
+# Prometheus text format (e.g. for node_exporter's textfile collector).
+
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+class Trace:
+    def __init__(self):
+        self.stages = []
+        self.counters = {}
+
+    def total(self):
+        return sum(seconds for _, seconds in self.stages)
+
+class Metrics:
+    def __init__(self, enabled=False, textfile=None):
+        self.enabled = enabled
+        self.textfile = textfile
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._histograms = {}
+        self._counters = {}
+
+    def _active(self):
+        return self.enabled or getattr(self._local, 'trace', None) is not None
+
+    def stage(self, name):
+        if not self._active():
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def observe(self, name, seconds):
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.stages.append((name, seconds))
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+                    break
+
+    def count(self, name, value=1):
+        if not self._active():
+            return
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.counters[name] = trace.counters.get(name, 0) + value
+        if self.enabled:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def trace(self, active=True):
+        if not active:
+            yield None
+            return
+        previous = getattr(self._local, 'trace', None)
+        self._local.trace = Trace()
+        try:
+            yield self._local.trace
+        finally:
+            self._local.trace = previous
+
+    def render(self):
+        with self._lock:
+            histograms = {name: dict(h, buckets=list(h['buckets'])) for name, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = [
+            '# HELP agri_qa_stage_seconds Wall time spent per pipeline stage.',
+            '# TYPE agri_qa_stage_seconds histogram',
+        ]
+        for name in sorted(histograms):
+            histogram = histograms[name]
+            cumulative = 0
+            for bound, hits in zip(BUCKETS, histogram['buckets']):
+                cumulative += hits
+                lines.append(f'agri_qa_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'agri_qa_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'agri_qa_stage_seconds_sum{{stage="{name}"}} {histogram["sum"]:.9f}')
+            lines.append(f'agri_qa_stage_seconds_count{{stage="{name}"}} {histogram["count"]}')
+        for name in sorted(counters):
+            lines.append(f'# TYPE agri_qa_{name}_total counter')
+            lines.append(f'agri_qa_{name}_total {counters[name]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def export(self):
+        if self.enabled and self.textfile:
+            self.write_textfile(self.textfile)
+
+metrics = Metrics(
+    enabled=os.environ.get('AGRI_QA_METRICS') == '1',
+    textfile=os.environ.get('AGRI_QA_METRICS_FILE'),
+)
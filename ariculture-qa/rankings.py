@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+# Precomputed crop rankings by mean production volume, for every state, every
+# (state, year), every year nationally and nationally over all years. They
+# are built in one pass: a single groupby of the crop table into (state,
+# year, crop) sums and counts, summed up to the coarser levels, then each
+# level ranked with one np.lexsort (group, then mean descending, then crop
+# name, matching rank_crops' tie order). A ranking is a list of (crop, mean)
+# pairs, highest first, so top k and bottom k are slices for any k.
+#
+# The (sum, count) totals behind every ranking are kept, so appended rows
+# are folded in by update() (or updated(), which leaves this instance alone),
+# re-sorting only the groups they touch.
+
+# Group keys: ('state', state), ('state-year', state, year),
+# ('national',) and ('national-year', year).
+def _group_keys(state, year):
+    return [('state', state), ('state-year', state, year), ('national',), ('national-year', year)]
+
+def _cells(crop_df):
+    values = crop_df['production volume'].astype('float64')
+    keys = [crop_df['state'], crop_df['year'], crop_df['crop type']]
+    return values.groupby(keys, observed=True).agg(['sum', 'count'])
+
+def _levels(cells):
+    # (frame indexed by group levels + crop, function building the group key)
+    return [
+        (cells.groupby(level=['state', 'crop type'], observed=True).sum(), lambda key: ('state', key[0])),
+        (cells, lambda key: ('state-year', key[0], int(key[1]))),
+        (cells.groupby(level=['crop type'], observed=True).sum(), lambda key: ('national',)),
+        (cells.groupby(level=['year', 'crop type'], observed=True).sum(),
+         lambda key: ('national-year', int(key[0]))),
+    ]
+
+def _rank(pairs):
+    # pairs: crop -> (sum, count)
+    means = [(crop, total / count) for crop, (total, count) in pairs.items() if count]
+    means.sort(key=lambda item: item[0])
+    means.sort(key=lambda item: -item[1])
+    return means
+
+class CropRankings:
+    def __init__(self, crop_df, cells=None):
+        # `cells` are (state, year, crop) sums and counts to build from
+        # instead of the crop table.
+        self.totals = {}
+        self.rankings = {}
+        for frame, group_key in _levels(_cells(crop_df) if cells is None else cells):
+            self._build_level(frame, group_key)
+
+    def _build_level(self, frame, group_key):
+        # Works on the index's level codes, so no key tuples are built for
+        # the rows; only one per group.
+        if frame.empty:
+            return
+        index = frame.index
+        if not isinstance(index, pd.MultiIndex):
+            index = pd.MultiIndex.from_arrays([index])
+        crop_level = index.names.index('crop type')
+        group_levels = [level for level in range(index.nlevels) if level != crop_level]
+        codes = index.codes[crop_level]
+        names = index.levels[crop_level].astype(str).to_numpy()
+        # Ties go to the alphabetically first crop; sort on name ranks rather
+        # than the strings themselves.
+        name_ranks = np.argsort(np.argsort(names))[codes]
+        if group_levels:
+            shape = [len(index.levels[level]) for level in group_levels]
+            group_codes = np.ravel_multi_index([index.codes[level] for level in group_levels], shape)
+        else:
+            group_codes = np.zeros(len(frame), dtype=np.int64)
+        sums = frame['sum'].to_numpy(dtype=np.float64)
+        counts = frame['count'].to_numpy(dtype=np.int64)
+        means = sums / counts
+        order = np.lexsort((name_ranks, -means, group_codes))
+        ends = np.append(np.flatnonzero(np.diff(group_codes[order])) + 1, len(order))
+        starts = np.insert(ends[:-1], 0, 0)
+        firsts = order[starts]
+        parts = zip(*[index.levels[level][index.codes[level][firsts]].tolist() for level in group_levels]) \
+            if group_levels else [()] * len(starts)
+        crops, means = names[codes[order]].tolist(), means[order].tolist()
+        sums, counts = sums[order].tolist(), counts[order].tolist()
+        for part, start, end in zip(parts, starts.tolist(), ends.tolist()):
+            key = group_key(part)
+            self.rankings[key] = list(zip(crops[start:end], means[start:end]))
+            self.totals[key] = dict(zip(crops[start:end], zip(sums[start:end], counts[start:end])))
+
+    def ranking(self, state=None, year=None):
+        if state is None:
+            key = ('national',) if year is None else ('national-year', year)
+        else:
+            key = ('state', state) if year is None else ('state-year', state, year)
+        return self.rankings.get(key, [])
+
+    def top(self, state=None, year=None, k=3):
+        return self.ranking(state, year)[:k]
+
+    def bottom(self, state=None, year=None, k=3):
+        # Lowest first.
+        return self.ranking(state, year)[::-1][:k]
+
+    def update(self, rows):
+        # Folds appended crop rows into the totals and re-ranks only the
+        # groups they belong to. Touched groups are replaced, never modified,
+        # so a copy made before the update keeps its rankings. Returns the
+        # group keys that changed.
+        groups = {}
+        cells = _cells(rows)
+        for (state, year, crop), total, count in zip(cells.index, cells['sum'], cells['count']):
+            state, year, crop = str(state), int(year), str(crop)
+            for key in _group_keys(state, year):
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = dict(self.totals.get(key, {}))
+                old_total, old_count = group.get(crop, (0.0, 0))
+                group[crop] = (old_total + float(total), old_count + int(count))
+        for key, group in groups.items():
+            self.totals[key] = group
+            self.rankings[key] = _rank(group)
+        return set(groups)
+
+    def updated(self, rows):
+        # A new CropRankings with `rows` folded in, sharing every group they
+        # do not touch; this one is left as it is.
+        rankings = CropRankings.__new__(CropRankings)
+        rankings.totals = dict(self.totals)
+        rankings.rankings = dict(self.rankings)
+        rankings.update(rows)
+        return rankings
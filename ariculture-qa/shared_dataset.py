@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from columnar import decode_frame
+from manifest import DATA_DIR, build_manifest, source_stamps, write_manifest
+
+# Dataset shared by every app process on a host. One loader process publishes
+# the normalised, category-shared columns of the three datasets as a snapshot
+# of .npy files under a shared directory (ideally on tmpfs, e.g.
+# /dev/shm/agri-qa, so the files are named shared memory), and points CURRENT
+# at it with an atomic os.replace. App processes attach read-only: every
+# column is memory-mapped, and categorical codes are stored in the dtype
+# pandas itself uses, so attaching copies nothing and the pages are shared
+# between all workers.
+#
+# Each attached process holds a shared flock on its snapshot's lock file; that
+# is the reference count, and it is dropped automatically if the process
+# dies. Publishing a new snapshot removes older ones that nobody holds any
+# more; ones still in use stay until their last reader re-attaches or exits.
+# Without fcntl (Windows) nothing is ever removed automatically.
+#
+# Appended fragments (see ingest.py) are merged in before publishing, so with
+# --watch a new fragment means a new snapshot, which attached engines pick up
+# on their next refresh().
+#
+#   python shared_dataset.py --shared-dir /dev/shm/agri-qa
+#   AGRI_QA_SHARED_DIR=/dev/shm/agri-qa streamlit run app.py
+
+DATASETS = ('crop', 'rainfall', 'temperature')
+FORMAT_VERSION = 1
+POINTER = 'CURRENT'
+LOCK_NAME = 'readers.lock'
+SNAPSHOT_PREFIX = 'snapshot-'
+ATTACH_RETRIES = 5
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def current_snapshot(shared_dir):
+    try:
+        with open(os.path.join(shared_dir, POINTER)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _encode_column(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # The codes keep pandas' own dtype so decoding can wrap them as-is.
+        column = {'kind': 'category', 'categories': [str(c) for c in values.cat.categories]}
+        return values.array.codes, column
+    return values.to_numpy(), {'kind': 'numeric'}
+
+def publish(frames, shared_dir):
+    # frames: dataset name -> DataFrame, as returned by engine.load_data.
+    os.makedirs(shared_dir, exist_ok=True)
+    name = f"{SNAPSHOT_PREFIX}{time.time_ns()}-{os.getpid()}"
+    tmp_dir = os.path.join(shared_dir, f".{name}.tmp")
+    os.makedirs(tmp_dir)
+
+    meta = {'version': FORMAT_VERSION, 'datasets': {}}
+    for dataset, df in frames.items():
+        columns = []
+        files = {}
+        for i, col in enumerate(df.columns):
+            values, column = _encode_column(df[col])
+            column['name'] = col
+            filename = f"{dataset}.{i}.npy"
+            np.save(os.path.join(tmp_dir, filename), np.ascontiguousarray(values))
+            columns.append(column)
+            files[col] = filename
+        meta['datasets'][dataset] = {'rows': len(df), 'columns': columns, 'files': files}
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    open(os.path.join(tmp_dir, LOCK_NAME), 'wb').close()
+
+    os.rename(tmp_dir, os.path.join(shared_dir, name))
+    _write_atomic(os.path.join(shared_dir, POINTER), name)
+    collect(shared_dir)
+    return name
+
+def collect(shared_dir):
+    # Removes snapshots other than CURRENT that no process has attached.
+    if fcntl is None:
+        return []
+    current = current_snapshot(shared_dir)
+    removed = []
+    for name in sorted(os.listdir(shared_dir)):
+        if not name.startswith(SNAPSHOT_PREFIX) or name == current:
+            continue
+        path = os.path.join(shared_dir, name)
+        try:
+            lock = open(os.path.join(path, LOCK_NAME), 'rb')
+        except OSError:
+            continue
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                continue
+            # Renamed first, so a reader that opened the lock file just before
+            # this sees the snapshot gone once it gets its lock, and retries.
+            trash = os.path.join(shared_dir, f".trash-{name}")
+            os.rename(path, trash)
+            shutil.rmtree(trash, ignore_errors=True)
+            removed.append(name)
+    return removed
+
+class SharedDataset:
+    def __init__(self, shared_dir):
+        self.shared_dir = shared_dir
+        for _ in range(ATTACH_RETRIES):
+            name = current_snapshot(shared_dir)
+            if name is None:
+                raise FileNotFoundError(f"no dataset has been published to {shared_dir}")
+            path = os.path.join(shared_dir, name)
+            try:
+                lock = open(os.path.join(path, LOCK_NAME), 'rb')
+            except FileNotFoundError:
+                continue
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_SH)
+            meta = _read_meta(path)
+            if meta is not None and meta.get('version') == FORMAT_VERSION:
+                break
+            lock.close()
+        else:
+            raise RuntimeError(f"could not attach to a snapshot in {shared_dir}")
+
+        self.name = name
+        self.path = path
+        self._lock = lock
+        self.frames = {}
+        for dataset, table in meta['datasets'].items():
+            arrays = {column['name']: np.load(os.path.join(path, table['files'][column['name']]), mmap_mode='r')
+                      for column in table['columns']}
+            # The codes were written by publish(); checking them would touch every page.
+            self.frames[dataset] = decode_frame(arrays, table['columns'], validate=False)
+
+    def is_current(self):
+        return current_snapshot(self.shared_dir) == self.name
+
+    def close(self):
+        # Drops this process's reference. Frames already handed out stay
+        # valid: the mappings outlive the files if the snapshot is removed.
+        self.frames = {}
+        self._lock.close()
+
+def main(argv=None):
+    from engine import load_data
+    from ingest import apply_fragments
+
+    parser = argparse.ArgumentParser(description="Publish the datasets to shared memory for the app processes.")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--shared-dir', default=os.environ.get('AGRI_QA_SHARED_DIR', '/dev/shm/agri-qa'))
+    parser.add_argument('--watch', type=float, default=None, metavar='SECONDS',
+                        help="keep running and republish whenever a source CSV or fragment changes")
+    args = parser.parse_args(argv)
+
+    stamp = None
+    while True:
+        current = source_stamps(args.data_dir)
+        if current != stamp:
+            start = time.perf_counter()
+            frames, _ = apply_fragments(dict(zip(DATASETS, load_data(args.data_dir))), args.data_dir,
+                                        current['fragments'])
+            name = publish(frames, args.shared_dir)
+            write_manifest(args.data_dir, build_manifest(*(frames[dataset] for dataset in DATASETS), current))
+            print(f"published {name} to {args.shared_dir} in {time.perf_counter() - start:.2f}s", flush=True)
+            stamp = current
+        if args.watch is None:
+            return
+        time.sleep(args.watch)
+        collect(args.shared_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+import numpy as np
+import pandas as pd
+
+# Mergeable quantile sketches behind the percentile answers.
+#
+# A sketch summarises a group of rows as at most POINTS weighted points: the
+# rows sorted by value and cut into POINTS buckets of (nearly) equal size,
+# each bucket kept as its median row weighted by the bucket's size. A group
+# with no more rows than that is kept exactly, every row with weight 1.
+#
+# Sketches are kept per (state, year) for rainfall and temperature and per
+# (state, crop, year) for production, plus one per state (per state and crop)
+# over all years, built from the rows themselves rather than merged from the
+# yearly ones. A quantile over any set of states and years is read from the
+# union of the few sketches covering them: their points sorted together and
+# walked by cumulative weight, nothing recompressed.
+#
+# Error bound: within one sketch, the row a quantile lands on is at most half
+# a bucket, ceil(n/POINTS)/2 rows, from the requested rank. In a union only
+# one bucket per sketch can straddle the answer, so the errors add up to at
+# most n/POINTS rows for n rows merged, however many sketches that takes.
+# With POINTS = 128 the answer's rank among the rows is within 0.8% of the
+# requested one (a median is somewhere between the 49.2nd and the 50.8th
+# percentile), and exact when every sketch merged is exact. Quantiles are
+# the lower empirical ones (numpy's 'inverted_cdf'). Each sketch carries its
+# bound in rows, and a quantile reports the sum over the sketches it read.
+#
+# Appended rows are sketched on their own and their points appended to the
+# sketches they belong to, which keeps the bound; a reload recompresses.
+#
+# Without the rows (loading within a memory budget, streaming.py) each chunk
+# is sketched as it is read and the chunk sketches are merged pairwise, 1+1,
+# 2+2, 4+4 chunks and so on, each merge compressed back to MERGE_POINTS
+# points per group, so a group holds a few compressed sketches however many
+# chunks are read. A compression adds at most half of one of its buckets to
+# the bound, which then grows with the merge levels a group's rows went
+# through instead of staying within n/POINTS; it is tracked all the same.
+
+POINTS = 128
+# Points per group kept by the merges of a chunked load, before the final
+# compression to POINTS.
+MERGE_POINTS = 2 * POINTS
+
+def _points(groups, values, by_value, points=POINTS):
+    # Rows (group id, value) -> sketch points (group id, value, weight),
+    # sorted by group, then value. `by_value` orders the rows by value; a
+    # stable sort of it by group (a radix sort while group ids fit 16 bits)
+    # is much quicker than sorting on both keys.
+    keys = groups[by_value]
+    if len(groups) and groups.max() < 1 << 16:
+        keys = keys.astype(np.uint16)
+    order = by_value[np.argsort(keys, kind='stable')]
+    groups, values = groups[order], values[order]
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    sizes = np.diff(np.r_[starts, len(groups)])
+    size = np.repeat(sizes, sizes)
+    rank = np.arange(len(groups)) - np.repeat(starts, sizes)
+    # Bucket of each row: rank * buckets // size, with as many buckets as
+    # rows for a group no larger than `points`.
+    bucket = rank * np.minimum(size, points) // size
+    first = np.flatnonzero(np.r_[True, (groups[1:] != groups[:-1]) | (bucket[1:] != bucket[:-1])])
+    weights = np.diff(np.r_[first, len(groups)]).astype(np.int32)
+    middle = first + (weights - 1) // 2
+    return groups[middle], values[middle], weights
+
+def _sketch_points(groups, values, by_value):
+    # _points() and each group's bound, indexed by group id: half of its
+    # largest bucket.
+    group_ids, points, weights = _points(groups, values, by_value)
+    bounds = np.zeros(int(group_ids.max()) + 1, dtype=np.int64)
+    np.maximum.at(bounds, group_ids, weights // 2)
+    return group_ids, points, weights, bounds
+
+def _compress(groups, values, weights, points):
+    # Weighted points (group id, value, weight), in any order -> at most
+    # `points` points per group, sorted by group, then value, and the bound
+    # the compression adds to each group, indexed by group id. Groups with
+    # no more points than that are kept as they are. The others are cut into
+    # buckets of equal weight, each kept as its weighted median point: less
+    # than half the bucket's weight lies before that point and at most half
+    # after it, which bounds the rank error inside the bucket. Sorted as in
+    # _points().
+    by_value = np.argsort(values)
+    keys = groups[by_value]
+    if groups.max() < 1 << 16:
+        keys = keys.astype(np.uint16)
+    order = by_value[np.argsort(keys, kind='stable')]
+    groups, values, weights = groups[order], values[order], weights[order].astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    sizes = np.diff(np.r_[starts, len(groups)])
+    cumulative = np.cumsum(weights)
+    within = cumulative - np.repeat(cumulative[starts] - weights[starts], sizes)
+    totals = np.repeat(within[np.r_[starts[1:], len(groups)] - 1], sizes)
+    rank = np.arange(len(groups)) - np.repeat(starts, sizes)
+    bucket = np.where(np.repeat(sizes, sizes) > points, (within - weights) * points // totals, rank)
+    first = np.flatnonzero(np.r_[True, (groups[1:] != groups[:-1]) | (bucket[1:] != bucket[:-1])])
+    counts = np.diff(np.r_[first, len(groups)])
+    bucket_weights = np.add.reduceat(weights, first)
+    in_bucket = within - np.repeat(within[first] - weights[first], counts)
+    below = 2 * in_bucket < np.repeat(bucket_weights, counts)
+    middle = first + np.add.reduceat(below.astype(np.int64), first)
+    added = np.maximum(in_bucket[middle] - weights[middle], bucket_weights - in_bucket[middle])
+    bounds = np.zeros(int(groups[-1]) + 1, dtype=np.int64)
+    np.maximum.at(bounds, groups[middle], added)
+    return groups[middle], values[middle], bucket_weights.astype(np.int32), bounds
+
+def _merged(parts, points):
+    # Parts (group ids, values, weights, bounds) -> one, compressed to
+    # `points` points per group. The parts' bounds add up, plus what the
+    # compression adds.
+    group_ids, values, weights, added = _compress(*(np.concatenate([part[i] for part in parts]) for i in range(3)),
+                                                  points)
+    bounds = np.zeros(max(len(added), *(len(part[3]) for part in parts)), dtype=np.int64)
+    bounds[:len(added)] += added
+    for part in parts:
+        bounds[:len(part[3])] += part[3]
+    return group_ids, values, weights, bounds
+
+def _split(keys, group_ids, points, weights, bounds):
+    # Points sorted by group -> {keys[group]: (values, weights, bound)}.
+    starts = np.flatnonzero(np.r_[True, group_ids[1:] != group_ids[:-1]])
+    ends = np.r_[starts[1:], len(group_ids)]
+    groups = group_ids[starts].tolist()
+    return {keys[group]: (points[start:end], weights[start:end], int(bounds[group]))
+            for group, start, end in zip(groups, starts.tolist(), ends.tolist())}
+
+def _sketches(keys, groups, values, by_value):
+    # {key: (values, weights, bound)} for rows grouped by `groups`, an index
+    # into `keys`.
+    if not len(values):
+        return {}
+    return _split(keys, *_sketch_points(groups, values, by_value))
+
+def _group_ids(columns):
+    # (keys, group id per row) for the distinct combinations of `columns`,
+    # categorical, string or integer Series of equal length without nulls.
+    # Codes are combined into one dense id and the ids present renumbered,
+    # all without a sort.
+    codes, names = [], []
+    for column in columns:
+        if hasattr(column, 'cat'):
+            codes.append(column.cat.codes.to_numpy().astype(np.int64))
+            names.append([str(name) for name in column.cat.categories])
+        elif column.dtype.kind not in 'biuf':
+            # Names as read from a CSV chunk or a fragment.
+            column_codes, column_names = pd.factorize(column)
+            codes.append(column_codes.astype(np.int64))
+            names.append([str(name) for name in column_names])
+        else:
+            values = column.to_numpy().astype(np.int64)
+            low = int(values.min()) if len(values) else 0
+            codes.append(values - low)
+            names.append(list(range(low, int(values.max()) + 1)) if len(values) else [])
+    flat = np.zeros(len(columns[0]), dtype=np.int64)
+    size = 1
+    for code, name in zip(codes, names):
+        flat = flat * len(name) + code
+        size *= len(name)
+    present = np.zeros(size, dtype=bool)
+    present[flat] = True
+    renumber = np.cumsum(present) - 1
+    if not size:
+        return [], renumber[flat]
+    key_codes = np.unravel_index(np.flatnonzero(present), [len(name) for name in names])
+    keys = list(zip(*(np.array(name, dtype=object)[code].tolist() for name, code in zip(names, key_codes))))
+    return keys, renumber[flat]
+
+def _keyed_rows(df, measure, by):
+    # (rows, their measure values) less the rows without a measure or a
+    # group key, so the keys can be coded as integers.
+    values = df[measure].to_numpy()
+    present = ~np.isnan(values)
+    for column in ['state', 'year', *by]:
+        present &= df[column].notna().to_numpy()
+    if not present.all():
+        df, values = df[present], values[present]
+    return df, values
+
+def quantiles(sketches, percentiles):
+    # (rows, {percentile: value}, bound) over the union of `sketches`; the
+    # bound is in rows.
+    sketches = [sketch for sketch in sketches if sketch is not None]
+    if not sketches:
+        return 0, {}, 0
+    values = np.concatenate([values for values, _, _ in sketches])
+    weights = np.concatenate([weights for _, weights, _ in sketches])
+    order = np.argsort(values, kind='stable')
+    values = values[order]
+    cumulative = np.cumsum(weights[order])
+    total = int(cumulative[-1])
+    # Lower empirical quantile: the first point whose cumulative weight
+    # reaches p% of the rows (at least one row).
+    targets = np.maximum(np.ceil(np.asarray(percentiles, dtype=np.float64) / 100.0 * total), 1)
+    positions = np.minimum(np.searchsorted(cumulative, targets, side='left'), len(values) - 1)
+    return (total, {p: float(values[i]) for p, i in zip(percentiles, positions)},
+            sum(bound for _, _, bound in sketches))
+
+class QuantileSketches:
+    # One dataset's sketches: `yearly` keyed by (state, year) or (state,
+    # crop, year), `history` by (state,) or (state, crop).
+    def __init__(self, yearly, history):
+        self.yearly = yearly
+        self.history = history
+
+    @classmethod
+    def from_rows(cls, df, measure, by=()):
+        df, values = _keyed_rows(df, measure, by)
+        key_columns = [df['state']] + [df[column] for column in by]
+        yearly_keys, yearly_groups = _group_ids(key_columns + [df['year']])
+        history_keys, history_groups = _group_ids(key_columns)
+        by_value = np.argsort(values)
+        return cls(_sketches(yearly_keys, yearly_groups, values, by_value),
+                   _sketches(history_keys, history_groups, values, by_value))
+
+    def updated(self, rows, measure, by=()):
+        # New sketches with `rows` appended; sketches they do not touch are
+        # shared, and this object is left as it is.
+        delta = QuantileSketches.from_rows(rows, measure, by)
+        return QuantileSketches(_appended(self.yearly, delta.yearly), _appended(self.history, delta.history))
+
+    def select(self, states, crop=None, years=None):
+        # The sketches covering `states` (and `crop`), over `years` (None for
+        # all of them).
+        prefix = (crop,) if crop is not None else ()
+        if years is None:
+            return [self.history.get((state,) + prefix) for state in states]
+        return [self.yearly.get((state,) + prefix + (year,)) for state in states for year in years]
+
+    def quantiles(self, states, percentiles, crop=None, years=None):
+        return quantiles(self.select(states, crop, years), percentiles)
+
+def _appended(sketches, delta):
+    merged = dict(sketches)
+    for key, (values, weights, bound) in delta.items():
+        if key in merged:
+            old_values, old_weights, old_bound = merged[key]
+            values, weights = np.concatenate([old_values, values]), np.concatenate([old_weights, weights])
+            bound += old_bound
+        merged[key] = (values, weights, bound)
+    return merged
+
+class ChunkedSketches:
+    # Yearly sketches of rows added chunk by chunk. `levels[i]`, when not
+    # None, holds the merged points of 2**i chunks as flat arrays (group id,
+    # value, weight) plus each group's bound; group ids index `ids`.
+    def __init__(self, measure, by=()):
+        self.measure = measure
+        self.by = list(by)
+        self.ids = {}
+        self.levels = []
+
+    def add(self, df):
+        df, values = _keyed_rows(df, self.measure, self.by)
+        if not len(values):
+            return
+        keys, groups = _group_ids([df['state']] + [df[column] for column in self.by] + [df['year']])
+        ids = np.array([self.ids.setdefault(key, len(self.ids)) for key in keys], dtype=np.int64)
+        group_ids, points, weights, bounds = _sketch_points(groups, values, np.argsort(values))
+        part_bounds = np.zeros(len(self.ids), dtype=np.int64)
+        part_bounds[ids[:len(bounds)]] = bounds
+        part = (ids[group_ids].astype(np.int32), points, weights, part_bounds)
+        level = 0
+        while level < len(self.levels) and self.levels[level] is not None:
+            part = _merged([self.levels[level], part], MERGE_POINTS)
+            self.levels[level] = None
+            level += 1
+        if level == len(self.levels):
+            self.levels.append(None)
+        self.levels[level] = part
+
+    def nbytes(self):
+        return sum(array.nbytes for part in self.levels if part is not None for array in part)
+
+    def result(self):
+        # QuantileSketches of all the rows added: the levels merged into
+        # POINTS points per year, and the history merged from those.
+        parts = [part for part in self.levels if part is not None]
+        if not parts:
+            return QuantileSketches({}, {})
+        keys = list(self.ids)
+        group_ids, points, weights, bounds = _merged(parts, POINTS)
+        history_ids = {}
+        history = np.array([history_ids.setdefault(key[:-1], len(history_ids)) for key in keys], dtype=np.int64)
+        history_bounds = np.bincount(history, weights=bounds, minlength=len(history_ids)).astype(np.int64)
+        merged = _merged([(history[group_ids], points, weights, history_bounds)], POINTS)
+        return QuantileSketches(_split(keys, group_ids, points, weights, bounds),
+                                _split(list(history_ids), *merged))
+
+def build_sketches(crop_df, rainfall_df, temp_df):
+    return {
+        'crop': QuantileSketches.from_rows(crop_df, 'production volume', by=['crop type']),
+        'rainfall': QuantileSketches.from_rows(rainfall_df, 'rainfall mm'),
+        'temperature': QuantileSketches.from_rows(temp_df, 'avg temperature'),
+    }
+
+def update_sketches(sketches, rows):
+    # dataset -> sketches with the appended rows (dataset -> table) added.
+    # Datasets without sketches (None) stay without.
+    updated = dict(sketches)
+    if 'crop' in rows and sketches['crop'] is not None:
+        updated['crop'] = sketches['crop'].updated(rows['crop'], 'production volume', by=['crop type'])
+    if 'rainfall' in rows and sketches['rainfall'] is not None:
+        updated['rainfall'] = sketches['rainfall'].updated(rows['rainfall'], 'rainfall mm')
+    if 'temperature' in rows and sketches['temperature'] is not None:
+        updated['temperature'] = sketches['temperature'].updated(rows['temperature'], 'avg temperature')
+    return updated
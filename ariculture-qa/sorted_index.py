@@ -0,0 +1,38 @@
+import numpy as np
+
+# Row index over a dataset that is physically sorted by (state, year), which
+# the columnar cache guarantees. A state, or a state and a year interval, is
+# then a pair of binary searches and the rows come back as one contiguous
+# iloc slice (a view) instead of a boolean-mask copy.
+
+class SortedIndex:
+    def __init__(self, df):
+        if 'state' not in df or 'year' not in df:
+            raise ValueError("SortedIndex needs 'state' and 'year' columns")
+        self.df = df
+        # The categorical's own codes array, not a copy of it.
+        self.codes = df['state'].array.codes
+        self.years = df['year'].to_numpy()
+        codes, years = self.codes, self.years
+        in_order = (codes[1:] > codes[:-1]) | ((codes[1:] == codes[:-1]) & (years[1:] >= years[:-1]))
+        if not in_order.all():
+            raise ValueError("dataset is not sorted by (state, year)")
+        self.state_codes = {name: code for code, name in enumerate(df['state'].cat.categories)}
+
+    def bounds(self, state, start=None, end=None):
+        code = self.state_codes.get(state)
+        if code is None:
+            return 0, 0
+        lo = int(np.searchsorted(self.codes, code, side='left'))
+        hi = int(np.searchsorted(self.codes, code, side='right'))
+        years = self.years[lo:hi]
+        if start is not None:
+            lo += int(np.searchsorted(years, start, side='left'))
+            years = self.years[lo:hi]
+        if end is not None:
+            hi = lo + int(np.searchsorted(years, end, side='right'))
+        return lo, hi
+
+    def rows(self, state, start=None, end=None):
+        lo, hi = self.bounds(state, start, end)
+        return self.df.iloc[lo:hi]
@@ -0,0 +1,307 @@
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from columnar import normalise_columns
+from ingest import read_fragments
+from manifest import DATA_DIR, SOURCE_FILES, make_manifest, source_stamps
+from metrics import metrics
+from sketches import ChunkedSketches
+
+# Out-of-core loading for extracts larger than memory. With a memory budget
+# (AGRI_QA_MEMORY_BUDGET, e.g. "512M", or QAEngine(memory_budget=...)) the
+# engine never holds the rows: each CSV is read in chunks, column names are
+# normalised per chunk, and every chunk is folded into district-level (sum,
+# count, min, max) aggregates, per crop for production, and into quantile
+# sketches, which are all the answer handlers need. The rollups, rankings,
+# trends and joined view are then built from those aggregates exactly as
+# from the tables, and the percentile answers from the sketches (see
+# sketches.py) as long as these fit in SKETCH_SHARE of the budget.
+#
+# Names are coded against vocabularies shared by the three datasets and the
+# cells are dense arrays indexed by those codes, so a chunk is one groupby of
+# its own cells added into the arrays in place; nothing is ever re-merged.
+# Chunk sizes are chosen so the chunk in flight plus the cells and sketches
+# held stay within the budget; the first chunk of each file is a small
+# sample that measures the bytes per row. The cells grow by doubling, or to
+# the exact size when a doubling would not fit in what the budget leaves;
+# when even that does not fit, the load stops with a MemoryError naming the
+# cells needed (the extract has too many district x crop x year cells for
+# the budget). The load report records what was
+# used: the largest chunk, the cells and sketches held, the peak tracked
+# total and the process' resident size.
+#
+# Raw rows are not available in this mode, and appended fragments are folded
+# into the aggregates rather than the tables.
+#
+#   python streaming.py --memory-budget 256M /data/extracts
+
+ENV_BUDGET = 'AGRI_QA_MEMORY_BUDGET'
+MEASURES = {'crop': 'production volume', 'rainfall': 'rainfall mm', 'temperature': 'avg temperature'}
+# Key columns in the order the district level of a rollup is grouped by.
+KEYS = {
+    'crop': ['state', 'district', 'crop type', 'year'],
+    'rainfall': ['state', 'district', 'year'],
+    'temperature': ['state', 'district', 'year'],
+}
+SAMPLE_ROWS = 10_000
+MIN_CHUNK_ROWS = 10_000
+# A parsed chunk needs several times its own size while it is grouped:
+# parser buffers, key codes and groupby temporaries.
+CHUNK_OVERHEAD = 4
+# Share of the budget the quantile sketches may take. Past it, the largest
+# dataset's sketches are dropped and its percentile questions go unanswered.
+SKETCH_SHARE = 0.25
+# Bytes per district cell: sum, count, min, max and a seen flag.
+CELL_BYTES = 8 + 8 + 8 + 8 + 1
+_UNITS = {'': 1, 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+
+def parse_size(text):
+    # "512M", "2g", "1.5G" or a plain number of bytes
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*', str(text).lower())
+    if not match:
+        raise ValueError(f"not a size: {text!r}")
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+def memory_budget():
+    value = os.environ.get(ENV_BUDGET)
+    return parse_size(value) if value else None
+
+def rss_bytes():
+    # Current resident set size, or None where /proc is not available.
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+class DistrictAggregate:
+    # One dataset's district-level (sum, count, min, max), per crop for
+    # production, folded chunk by chunk. The cells are dense arrays indexed
+    # by (state-district pair, crop, year) codes in order of first
+    # appearance; each chunk is grouped by its own cells and added in place,
+    # so memory is the cells themselves plus one chunk. `vocab` maps each
+    # name column to {name: code} and is shared with the other datasets.
+    # `sketches` are the quantile sketches of the rows added, None once
+    # dropped.
+    def __init__(self, dataset, vocab):
+        self.dataset = dataset
+        self.keys = KEYS[dataset]
+        self.measure = MEASURES[dataset]
+        self.vocab = vocab
+        self.pairs = {}
+        self.years = {}
+        self.records = 0
+        self.sums = np.zeros((0, 0, 0))
+        self.counts = np.zeros((0, 0, 0), dtype=np.int64)
+        self.lows = np.zeros((0, 0, 0))
+        self.highs = np.zeros((0, 0, 0))
+        self.seen = np.zeros((0, 0, 0), dtype=bool)
+        self.sketches = ChunkedSketches(self.measure, ['crop type'] if 'crop type' in self.keys else [])
+
+    def _codes(self, values, names_codes, convert=str):
+        # Each distinct value in the chunk is looked up once; -1 for missing.
+        codes, names = pd.factorize(values)
+        lookup = np.array([names_codes.setdefault(convert(name), len(names_codes)) for name in names] + [-1],
+                          dtype=np.int64)
+        return lookup[codes]
+
+    def add(self, chunk, room=None):
+        # `room`: the bytes the budget leaves for this aggregate's cells, or
+        # None for no limit.
+        chunk = normalise_columns(chunk)
+        state = self._codes(chunk['state'], self.vocab['state'])
+        district = self._codes(chunk['district'], self.vocab['district'])
+        years = pd.to_numeric(chunk['year'], errors='coerce').to_numpy(dtype=np.float64)
+        # Rows without a state or a year are not records, as in the columnar
+        # cache.
+        keyed = (state >= 0) & ~np.isnan(years)
+        self.records += int(keyed.sum())
+        valid = keyed & (district >= 0)
+        values = pd.to_numeric(chunk[self.measure], errors='coerce').to_numpy(dtype=np.float64)
+        if self.sketches is not None:
+            self._sketch(chunk, years, values)
+        if 'crop type' in self.keys:
+            crop = self._codes(chunk['crop type'], self.vocab['crop type'])
+            valid &= crop >= 0
+            crop = crop[valid]
+        else:
+            crop = np.zeros(int(valid.sum()), dtype=np.int64)
+        pair = self._codes((state[valid] << 32) | district[valid], self.pairs, int)
+        year = self._codes(years[valid].astype(np.int64), self.years, int)
+        values = values[valid]
+        self._reserve((len(self.pairs), len(self.vocab['crop type']) if 'crop type' in self.keys else 1,
+                       len(self.years)), room)
+        cell = np.ravel_multi_index((pair, crop, year), self.sums.shape)
+        part = pd.Series(values).groupby(cell).agg(['sum', 'count', 'min', 'max'])
+        cells = np.unravel_index(part.index.to_numpy(), self.sums.shape)
+        self.sums[cells] += part['sum'].to_numpy()
+        self.counts[cells] += part['count'].to_numpy()
+        self.lows[cells] = np.fmin(self.lows[cells], part['min'].to_numpy())
+        self.highs[cells] = np.fmax(self.highs[cells], part['max'].to_numpy())
+        self.seen[cells] = True
+
+    def _sketch(self, chunk, years, values):
+        # Rows without a district still count towards their state's
+        # percentiles, as they do when the tables are loaded.
+        rows = pd.DataFrame({'state': chunk['state'].to_numpy(), 'year': years, self.measure: values,
+                             **{column: chunk[column].to_numpy() for column in self.sketches.by}})
+        self.sketches.add(rows)
+
+    def _reserve(self, shape, room=None):
+        # Grows the cell arrays, doubling any dimension that is too small, or
+        # growing it only to `shape` if the doubled arrays and the old ones
+        # they are copied from would not fit in `room` bytes.
+        if all(size <= have for size, have in zip(shape, self.sums.shape)):
+            return
+        grown = tuple(have if size <= have else max(size, 2 * have) for size, have in zip(shape, self.sums.shape))
+        if room is not None and self.cell_bytes() + CELL_BYTES * int(np.prod(grown)) > room:
+            grown = tuple(max(size, have) for size, have in zip(shape, self.sums.shape))
+            needed = self.cell_bytes() + CELL_BYTES * int(np.prod(grown))
+            if needed > room:
+                raise MemoryError(
+                    f"{self.dataset}: {' x '.join(map(str, grown))} district cells need {needed:,} bytes while "
+                    f"they grow, more than the {max(int(room), 0):,} the memory budget leaves them; raise "
+                    f"{ENV_BUDGET}")
+        shape = grown
+        for name, fill in (('sums', 0), ('counts', 0), ('lows', np.nan), ('highs', np.nan), ('seen', False)):
+            old = getattr(self, name)
+            new = np.full(shape, fill, dtype=old.dtype)
+            new[tuple(slice(0, size) for size in old.shape)] = old
+            setattr(self, name, new)
+
+    def nbytes(self):
+        return self.cell_bytes() + self.sketch_bytes()
+
+    def cell_bytes(self):
+        return sum(array.nbytes for array in (self.sums, self.counts, self.lows, self.highs, self.seen))
+
+    def sketch_bytes(self):
+        return self.sketches.nbytes() if self.sketches is not None else 0
+
+    def result(self, categories):
+        # The aggregate indexed like aggregates.aggregate() would index it:
+        # name levels over `categories` (column -> sorted names), then the
+        # year, in sorted order. The index is built from codes directly.
+        pair, crop, year = np.nonzero(self.seen)
+        keys = np.fromiter(self.pairs, dtype=np.int64, count=len(self.pairs))
+        years = np.fromiter(self.years, dtype=np.int64, count=len(self.years))
+        codes = {'state': keys[pair] >> 32, 'district': keys[pair] & 0xFFFFFFFF, 'crop type': crop}
+        levels = []
+        level_codes = []
+        for key in self.keys:
+            if key == 'year':
+                level = np.unique(years)
+                levels.append(pd.Index(pd.to_numeric(level, downcast='integer')))
+                level_codes.append(np.searchsorted(level, years)[year])
+                continue
+            # Codes in order of appearance -> positions in the sorted names.
+            order = np.searchsorted(categories[key], list(self.vocab[key])) if self.vocab[key] else \
+                np.zeros(0, dtype=np.int64)
+            levels.append(pd.CategoricalIndex(categories[key], categories=categories[key]))
+            level_codes.append(order[codes[key]])
+        order = np.lexsort(level_codes[::-1])
+        cells = (pair[order], crop[order], year[order])
+        index = pd.MultiIndex(levels=levels, codes=[codes[order] for codes in level_codes], names=self.keys,
+                              verify_integrity=False)
+        return pd.DataFrame({'sum': self.sums[cells], 'count': self.counts[cells], 'min': self.lows[cells],
+                             'max': self.highs[cells]}, index=index)
+
+def stream_aggregates(data_dir=DATA_DIR, budget=None, fragments=()):
+    # Reads the three CSVs (and the named fragments) in chunks within
+    # `budget` bytes. Returns (dataset -> district-level aggregate, dataset
+    # -> quantile sketches or None, manifest without sources, fragment
+    # reports, load report).
+    budget = budget or memory_budget()
+    if not budget:
+        raise ValueError(f"a memory budget is needed; set {ENV_BUDGET}")
+    vocab = {'state': {}, 'district': {}, 'crop type': {}}
+    aggregates = {name: DistrictAggregate(name, vocab) for name in SOURCE_FILES}
+    report = {'budget_bytes': int(budget), 'chunks': 0, 'rows': 0, 'largest_chunk_rows': 0,
+              'peak_chunk_bytes': 0, 'peak_tracked_bytes': 0, 'sketches_dropped': [],
+              'rss_start_bytes': rss_bytes()}
+    peak_rss = report['rss_start_bytes']
+
+    def held():
+        return sum(aggregate.nbytes() for aggregate in aggregates.values())
+
+    for dataset, filename in SOURCE_FILES.items():
+        aggregate = aggregates[dataset]
+        rows = SAMPLE_ROWS
+        with pd.read_csv(os.path.join(data_dir, filename), iterator=True) as reader:
+            while True:
+                try:
+                    chunk = reader.get_chunk(rows)
+                except StopIteration:
+                    break
+                chunk_bytes = _frame_bytes(chunk) * CHUNK_OVERHEAD
+                with metrics.stage('stream_chunk'):
+                    aggregate.add(chunk, budget - chunk_bytes - held() + aggregate.cell_bytes())
+                while sum(other.sketch_bytes() for other in aggregates.values()) > budget * SKETCH_SHARE:
+                    largest = max(aggregates.values(), key=DistrictAggregate.sketch_bytes)
+                    largest.sketches = None
+                    report['sketches_dropped'].append(largest.dataset)
+                report['chunks'] += 1
+                report['rows'] += len(chunk)
+                report['largest_chunk_rows'] = max(report['largest_chunk_rows'], len(chunk))
+                report['peak_chunk_bytes'] = max(report['peak_chunk_bytes'], chunk_bytes)
+                report['peak_tracked_bytes'] = max(report['peak_tracked_bytes'], chunk_bytes + held())
+                rss = rss_bytes()
+                if rss is not None:
+                    peak_rss = max(peak_rss or 0, rss)
+                # The next chunk gets half of what the cells leave of the
+                # budget (the other half covers growing them and the parser's
+                # own buffers), at the bytes per row measured on this one.
+                row_bytes = max(chunk_bytes / max(len(chunk), 1), 1.0)
+                rows = max(int((budget - held()) / 2 / row_bytes), MIN_CHUNK_ROWS)
+                del chunk
+        metrics.count('rows_streamed', aggregate.records)
+
+    known = {column: list(names) for column, names in vocab.items()}
+    appended, reports = read_fragments(data_dir, fragments, known)
+    for dataset, rows in appended.items():
+        room = budget - _frame_bytes(rows) * CHUNK_OVERHEAD - held() + aggregates[dataset].cell_bytes()
+        aggregates[dataset].add(rows, room)
+        report['rows'] += len(rows)
+
+    categories = {column: sorted(str(name) for name in names) for column, names in vocab.items()}
+    districts = {name: aggregate.result(categories) for name, aggregate in aggregates.items()}
+    sketches = {name: aggregate.sketches.result() if aggregate.sketches is not None else None
+                for name, aggregate in aggregates.items()}
+    # The cells, the frames built from them and the sketches, in merge levels
+    # and merged, are all held at this point.
+    report['sketch_bytes'] = sum(aggregate.sketch_bytes() for aggregate in aggregates.values())
+    report['cell_bytes'] = held() - report['sketch_bytes']
+    report['aggregate_bytes'] = sum(_frame_bytes(frame) for frame in districts.values())
+    report['peak_tracked_bytes'] = max(report['peak_tracked_bytes'],
+                                       held() + report['sketch_bytes'] + report['aggregate_bytes'])
+    rss = rss_bytes()
+    report['peak_rss_bytes'] = max(peak_rss, rss) if rss is not None else peak_rss
+    report['within_budget'] = report['peak_tracked_bytes'] <= budget
+    years = set().union(*(aggregate.years for aggregate in aggregates.values()))
+    manifest = make_manifest(categories['state'], categories['crop type'], categories['district'], years,
+                             {name: aggregate.records for name, aggregate in aggregates.items()})
+    return districts, sketches, manifest, reports, report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate the CSVs in bounded memory and print the load report.")
+    parser.add_argument('data_dir', nargs='?', default=DATA_DIR)
+    parser.add_argument('--memory-budget', default=os.environ.get(ENV_BUDGET, '256M'),
+                        help=f"e.g. 256M or 2G (default: ${ENV_BUDGET}, else 256M)")
+    args = parser.parse_args(argv)
+    sources = source_stamps(args.data_dir)
+    _, _, manifest, reports, report = stream_aggregates(args.data_dir, parse_size(args.memory_budget),
+                                                        sources['fragments'])
+    report['records'] = manifest['records']
+    report['fragments'] = reports
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
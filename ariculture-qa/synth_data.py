@@ -0,0 +1,120 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Synthetic data generator for benchmarks. Writes crop_production.csv,
+# rainfall_data.csv and temperature_data.csv with the same schema as the
+# shipped files, at any size, with realistic cardinalities: every state and
+# union territory, several hundred districts that each belong to one state,
+# a few dozen crops and a multi-decade year span.
+
+STATES = [
+    'Andhra Pradesh', 'Arunachal Pradesh', 'Assam', 'Bihar', 'Chhattisgarh', 'Goa', 'Gujarat',
+    'Haryana', 'Himachal Pradesh', 'Jharkhand', 'Karnataka', 'Kerala', 'Madhya Pradesh',
+    'Maharashtra', 'Manipur', 'Meghalaya', 'Mizoram', 'Nagaland', 'Odisha', 'Punjab', 'Rajasthan',
+    'Sikkim', 'Tamil Nadu', 'Telangana', 'Tripura', 'Uttar Pradesh', 'Uttarakhand', 'West Bengal',
+    'Andaman and Nicobar Islands', 'Chandigarh', 'Dadra and Nagar Haveli and Daman and Diu',
+    'Delhi', 'Jammu and Kashmir', 'Ladakh', 'Lakshadweep', 'Puducherry',
+]
+
+CROPS = [
+    'Rice', 'Wheat', 'Maize', 'Jowar', 'Bajra', 'Ragi', 'Barley', 'Pulses', 'Gram', 'Tur',
+    'Moong', 'Urad', 'Masoor', 'Groundnut', 'Soybean', 'Mustard', 'Sunflower', 'Sesamum',
+    'Castor', 'Linseed', 'Cotton', 'Jute', 'Mesta', 'Sugarcane', 'Tobacco', 'Potato', 'Onion',
+    'Tomato', 'Banana', 'Mango', 'Coconut', 'Arecanut', 'Cashewnut', 'Tea', 'Coffee', 'Rubber',
+    'Turmeric', 'Ginger', 'Garlic', 'Chillies', 'Cardamom', 'Black Pepper',
+]
+
+_PREFIXES = ['Ram', 'Shiv', 'Hari', 'Chandra', 'Raj', 'Dev', 'Sur', 'Kris', 'Mad', 'Ban',
+             'Gop', 'Nag', 'Bel', 'Kol', 'Sit', 'Anan', 'Dhar', 'Vel', 'Tir', 'Pal']
+_SUFFIXES = ['pur', 'nagar', 'abad', 'garh', 'ganj', 'kot', 'wadi', 'palli', 'halli', 'gudi',
+             'puram', 'khed', 'sar', 'ner', 'gaon', 'mer', 'patnam', 'vali', 'dih', 'bagh']
+
+def make_districts(count):
+    # Two-part names give up to 400 distinct districts; beyond that a
+    # numbered suffix keeps names unique.
+    names = [prefix + suffix for prefix in _PREFIXES for suffix in _SUFFIXES]
+    districts = []
+    for i in range(count):
+        name = names[i % len(names)]
+        if i >= len(names):
+            name = f"{name} {i // len(names) + 1}"
+        districts.append(name)
+    return districts
+
+def _district_states(districts, rng):
+    # Every state gets at least one district; the rest are spread unevenly,
+    # like real states.
+    weights = rng.gamma(2.0, 1.0, len(STATES))
+    assigned = list(range(len(STATES)))
+    assigned += list(rng.choice(len(STATES), len(districts) - len(STATES), p=weights / weights.sum()))
+    return np.array(assigned[:len(districts)])
+
+def _base_frame(rows, districts, district_state, years, rng):
+    district_codes = rng.integers(0, len(districts), rows)
+    return {
+        'State': pd.Categorical.from_codes(district_state[district_codes], STATES),
+        'District': pd.Categorical.from_codes(district_codes, districts),
+        'Year': rng.integers(years[0], years[1] + 1, rows).astype(np.int16),
+    }, district_codes
+
+def _write(frame, path, header):
+    frame.to_csv(path, mode='w' if header else 'a', header=header, index=False, float_format='%.2f')
+
+def generate(out_dir, rows, districts=640, years=(1990, 2024), chunk_rows=1_000_000, seed=0):
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    district_names = make_districts(max(districts, len(STATES)))
+    district_state = _district_states(district_names, rng)
+    # Per-district climate baselines so rainfall and temperature are not
+    # pure noise across districts.
+    rain_base = rng.uniform(300, 3000, len(district_names))
+    temp_base = rng.uniform(18, 30, len(district_names))
+    crop_base = rng.lognormal(9.5, 1.0, len(CROPS))
+
+    paths = {
+        'crop': os.path.join(out_dir, 'crop_production.csv'),
+        'rainfall': os.path.join(out_dir, 'rainfall_data.csv'),
+        'temperature': os.path.join(out_dir, 'temperature_data.csv'),
+    }
+    written = 0
+    while written < rows:
+        n = min(chunk_rows, rows - written)
+        header = written == 0
+
+        data, codes = _base_frame(n, district_names, district_state, years, rng)
+        crop_codes = rng.integers(0, len(CROPS), n)
+        data['Crop_Type'] = pd.Categorical.from_codes(crop_codes, CROPS)
+        data['Production_Volume'] = crop_base[crop_codes] * rng.lognormal(0.0, 0.4, n)
+        _write(pd.DataFrame(data), paths['crop'], header)
+
+        data, codes = _base_frame(n, district_names, district_state, years, rng)
+        data['Rainfall_mm'] = np.maximum(rain_base[codes] + rng.normal(0, 250, n), 0)
+        _write(pd.DataFrame(data), paths['rainfall'], header)
+
+        data, codes = _base_frame(n, district_names, district_state, years, rng)
+        data['Avg_Temperature'] = temp_base[codes] + rng.normal(0, 1.5, n)
+        _write(pd.DataFrame(data), paths['temperature'], header)
+
+        written += n
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic agriculture/climate CSVs.")
+    parser.add_argument('out_dir')
+    parser.add_argument('--rows', type=int, default=10_000, help="rows per dataset")
+    parser.add_argument('--districts', type=int, default=640)
+    parser.add_argument('--first-year', type=int, default=1990)
+    parser.add_argument('--last-year', type=int, default=2024)
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    paths = generate(args.out_dir, args.rows, args.districts, (args.first_year, args.last_year),
+                     args.chunk_rows, args.seed)
+    for path in paths.values():
+        print(path)
+
+if __name__ == '__main__':
+    main()
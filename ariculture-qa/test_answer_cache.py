@@ -0,0 +1,60 @@
+import os
+
+import answer_cache
+from answer_cache import AnswerCache
+from engine import QAEngine
+from manifest import drop_dir
+from test_loading import copy_sources
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+def test_least_recently_used_is_evicted():
+    cache = AnswerCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'size': 2, 'maxsize': 2}
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(answer_cache.time, 'monotonic', clock)
+    cache = AnswerCache(ttl=10)
+    cache.put('a', 1)
+    clock.now += 9.5
+    assert cache.get('a') == 1
+    clock.now += 1
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0
+
+def test_zero_size_caches_nothing():
+    cache = AnswerCache(maxsize=0)
+    cache.put('a', 1)
+    assert cache.get('a') is None
+
+def test_same_intent_shares_an_answer(tmp_path):
+    engine = QAEngine(copy_sources(tmp_path), shared_dir=None, memory_budget=0)
+    first = engine.answer("Compare rainfall in Punjab and Karnataka")
+    assert engine.answer("compare the rainfall of karnataka and punjab") == first
+    assert engine.cache.stats()['hits'] == 1
+
+def test_new_generation_is_not_served_old_answers(tmp_path):
+    data_dir = copy_sources(tmp_path)
+    engine = QAEngine(data_dir, shared_dir=None, memory_budget=0)
+    question = "Compare rainfall in Punjab and Karnataka"
+    before = engine.answer(question)
+    generation = engine.generation
+    os.makedirs(drop_dir(data_dir))
+    with open(os.path.join(drop_dir(data_dir), 'a.csv'), 'w') as f:
+        f.write("State,District,Year,Rainfall_mm\nPunjab,Ludhiana,2024,99999.0\n")
+    engine.ingest()
+    assert engine.generation == generation + 1
+    assert engine.cache.stats()['size'] == 0
+    assert engine.answer(question) != before
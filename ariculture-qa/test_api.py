@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+import pytest
+
+from api import QAService, create_app, respond, start_server
+from engine import QAEngine
+from test_loading import copy_sources
+
+@pytest.fixture
+def service(tmp_path):
+    service = QAService(QAEngine(copy_sources(tmp_path), shared_dir=None, memory_budget=0), max_pending=2)
+    yield service
+    service.shutdown()
+
+def request(service, method, path, query='', body=b''):
+    status, _, payload = asyncio.run(respond(service, method, path, query, body))
+    return status, json.loads(payload)
+
+@pytest.mark.parametrize('method, path, query, body', [
+    ('POST', '/answer', '', b'not json'),
+    ('POST', '/answer', '', b'["a list"]'),
+    ('POST', '/answer', '', b'{"question": " "}'),
+    ('POST', '/answer_many', '', b'{"questions": "one"}'),
+    ('GET', '/rainfall', 'states=Atlantis', b''),
+    ('GET', '/crops', 'states=Punjab&k=0', b''),
+    ('GET', '/crops', 'states=Punjab&order=sideways', b''),
+    ('GET', '/distribution', 'measure=rainfall&states=Punjab&percentiles=0,50', b''),
+    ('GET', '/trends', 'measure=humidity', b''),
+    ('GET', '/rows', 'dataset=soil', b''),
+    ('GET', '/rows', 'dataset=crop&offset=-1', b''),
+])
+def test_bad_requests_are_400(service, method, path, query, body):
+    status, payload = request(service, method, path, query, body)
+    assert status == 400
+    assert payload['error']
+    assert service.pending == 0
+
+def test_unknown_paths_and_methods(service):
+    assert request(service, 'GET', '/nowhere')[0] == 404
+    assert request(service, 'GET', '/answer')[0] == 405
+    assert request(service, 'POST', '/rainfall')[0] == 405
+
+def test_requests_release_their_slot(service):
+    status, payload = request(service, 'POST', '/answer', body=b'{"question": "Rainfall in Punjab"}')
+    assert status == 200 and payload['markdown']
+    assert request(service, 'GET', '/rainfall', 'states=Punjab&years=2018-2020')[0] == 200
+    assert request(service, 'GET', '/rows', 'dataset=crop&limit=5')[0] == 200
+    assert service.pending == 0
+
+def test_busy_server_is_503(service):
+    service.pending = service.max_pending
+    status, payload = request(service, 'POST', '/answer', body=b'{"question": "Rainfall in Punjab"}')
+    assert (status, payload) == (503, {'error': 'server busy'})
+    assert request(service, 'GET', '/rows.csv', 'dataset=crop')[0] == 503
+    assert service.pending == service.max_pending
+    # Health checks never wait for the pool.
+    assert request(service, 'GET', '/health')[0] == 200
+
+def test_stream_holds_its_slot_until_closed(service):
+    status, _, stream = asyncio.run(respond(service, 'GET', '/rows.csv', 'dataset=crop', b''))
+    assert status == 200 and service.pending == 1
+
+    async def body():
+        return b''.join([piece async for piece in service.iterate(stream)])
+
+    text = asyncio.run(body()).decode()
+    assert text.splitlines()[0] == 'state,district,year,crop type,production volume'
+    assert service.pending == 1
+    stream.close()
+    stream.close()
+    assert service.pending == 0
+
+def call(app, path, query=b'', fail_on=None):
+    # Runs one GET through the ASGI app; the send whose type is `fail_on`
+    # raises, as a server does when the client has gone.
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        if message['type'] == fail_on:
+            raise ConnectionResetError
+        sent.append(message)
+
+    asyncio.run(app({'type': 'http', 'method': 'GET', 'path': path, 'query_string': query}, receive, send))
+    return sent
+
+@pytest.mark.parametrize('fail_on', ['http.response.start', 'http.response.body'])
+def test_failed_stream_releases_its_slot(service, fail_on):
+    app = create_app(service)
+    for _ in range(service.max_pending + 1):
+        with pytest.raises(ConnectionResetError):
+            call(app, '/rows.csv', b'dataset=crop', fail_on)
+    assert service.pending == 0
+    assert call(app, '/rows.csv', b'dataset=crop')[0]['status'] == 200
+
+def test_unexpected_error_is_500(service):
+    def fail(question):
+        raise RuntimeError(question)
+
+    service.engine.answer_result = fail
+    status, _, payload = asyncio.run(respond(service, 'POST', '/answer', '', b'{"question": "rain"}'))
+    assert status == 500
+    assert json.loads(payload) == {'error': 'internal error'}
+    assert service.pending == 0
+
+@pytest.mark.parametrize('length', ['-5', 'many'])
+def test_invalid_content_length_is_400(service, length):
+    async def exchange():
+        server = await start_server(port=0, service=service)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(f"POST /answer HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode())
+            status_line = await reader.readline()
+            writer.close()
+            return status_line
+
+    assert asyncio.run(exchange()).split()[1] == b'400'
@@ -0,0 +1,14 @@
+from entities import EntityExtractor
+
+def test_ordinary_words_are_not_corrected_to_districts():
+    extractor = EntityExtractor(states=['Punjab', 'Kerala'], crops=['Rice'], districts=['Surmer', 'Ludhiana'])
+    parsed = extractor.extract("summer rainfall in Punjab")
+    assert parsed.states == ['Punjab']
+    assert parsed.districts == []
+    assert parsed.corrections == []
+
+def test_misspelt_names_are_still_corrected():
+    extractor = EntityExtractor(states=['Punjab', 'Kerala'], crops=['Rice'], districts=['Surmer', 'Ludhiana'])
+    parsed = extractor.extract("rainfall in Ludhiyana and Kerla")
+    assert parsed.districts == ['Ludhiana']
+    assert parsed.states == ['Kerala']
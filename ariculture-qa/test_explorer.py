@@ -0,0 +1,83 @@
+import io
+
+import pandas as pd
+import pytest
+
+from engine import QAEngine
+from explorer import MAX_PAGE_ROWS
+from test_loading import copy_sources
+
+@pytest.fixture(scope='module')
+def engine(tmp_path_factory):
+    return QAEngine(copy_sources(tmp_path_factory.mktemp('data')), shared_dir=None, memory_budget=0)
+
+def expected(df, states=(), crops=(), years=None, districts=()):
+    # The same selection by boolean masks over the whole table.
+    mask = pd.Series(True, index=df.index)
+    for column, wanted in (('state', states), ('crop type', crops), ('district', districts)):
+        if wanted:
+            mask &= df[column].isin(wanted)
+    if years is not None:
+        mask &= df['year'].isin(years)
+    return df[mask].reset_index(drop=True)
+
+def assert_same_rows(rows, reference):
+    # The cached tables are memory-mapped, so only values and dtypes are
+    # compared, not the array classes.
+    assert rows.equals(reference), (rows, reference)
+
+def everything(selection, chunk_rows):
+    chunks = list(selection.chunks(chunk_rows))
+    return pd.concat(chunks, ignore_index=True) if chunks else selection.page(0, 0)
+
+FILTERS = [
+    {},
+    {'states': ['Karnataka', 'Punjab']},
+    {'states': ['Punjab'], 'years': (2015, 2016, 2019, 2020, 2021)},
+    {'crops': ['Rice', 'Wheat'], 'years': (2018,)},
+    {'states': ['Bihar'], 'districts': ['Patna', 'Gaya']},
+    {'years': ()},
+]
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_selection_matches_masks(engine, filters):
+    selection = engine.explore('crop', **filters)
+    reference = expected(engine.crop_df, **filters)
+    assert selection.total == len(reference)
+    assert_same_rows(everything(selection, 7), reference)
+    assert sum(group['rows'] for group in selection.groups()) == len(reference)
+
+def test_pages_cover_the_selection(engine):
+    selection = engine.explore('rainfall', ['Gujarat', 'Punjab', 'West Bengal'], years=(2016, 2017, 2020))
+    reference = expected(engine.rainfall_df, ['Gujarat', 'Punjab', 'West Bengal'], years=(2016, 2017, 2020))
+    pages = [selection.page(offset, 4) for offset in range(0, selection.total, 4)]
+    assert all(len(page) == 4 for page in pages[:-1])
+    assert_same_rows(pd.concat(pages, ignore_index=True), reference)
+    assert selection.page(selection.total, 4).empty
+    assert len(engine.explore('crop').page(0, MAX_PAGE_ROWS * 10)) <= MAX_PAGE_ROWS
+
+def test_csv_export(engine):
+    selection = engine.explore('temperature', ['Punjab'], years=(2018, 2019, 2020))
+    pieces = list(selection.csv_chunks(2))
+    assert pieces[0] == 'state,district,year,avg temperature\n'
+    assert len(pieces) == 1 + -(-selection.total // 2)
+    exported = pd.read_csv(io.BytesIO(selection.csv_bytes(2)))
+    reference = expected(engine.temp_df, ['Punjab'], years=(2018, 2019, 2020))
+    assert exported['year'].tolist() == reference['year'].tolist()
+    assert exported['avg temperature'].tolist() == pytest.approx(reference['avg temperature'].astype(float).tolist())
+    assert engine.explore('crop', years=()).csv_bytes() == b'state,district,year,crop type,production volume\n'
+
+def test_question_filters(engine):
+    selection = engine.explore_question("Rice production in Punjab 2018-2020", 'crop')
+    reference = expected(engine.crop_df, ['Punjab'], ['Rice'], (2018, 2019, 2020))
+    assert_same_rows(everything(selection, 50), reference)
+
+def test_rows_not_kept_within_a_budget(engine, tmp_path):
+    streamed = QAEngine(copy_sources(tmp_path), shared_dir=None, memory_budget=64 << 20)
+    selection = streamed.explore('crop', ['Punjab'])
+    assert not selection.rows_kept
+    assert selection.total == engine.explore('crop', ['Punjab']).total
+    with pytest.raises(LookupError):
+        selection.page()
+    with pytest.raises(LookupError):
+        selection.csv_bytes()
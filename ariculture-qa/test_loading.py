@@ -0,0 +1,97 @@
+import os
+import shutil
+
+import pytest
+
+from engine import QAEngine
+from manifest import SOURCE_FILES, drop_dir
+from streaming import CELL_BYTES, ENV_BUDGET, DistrictAggregate, stream_aggregates
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+QUESTIONS = [
+    "Compare rainfall in Punjab and Kerala",
+    "What is the crop production in Karnataka?",
+    "Analyze temperature trends in Tamil Nadu",
+]
+# One row without a year and one without a state per source file.
+BLANK_ROWS = {
+    'crop': ["Punjab,Ludhiana,,Wheat,1000.0", ",Ludhiana,2020,Wheat,1000.0"],
+    'rainfall': ["Punjab,Ludhiana,,900.0", ",Ludhiana,2020,900.0"],
+    'temperature': ["Punjab,Ludhiana,,25.0", ",Ludhiana,2020,25.0"],
+}
+
+def copy_sources(directory, blank_rows=False):
+    os.makedirs(directory, exist_ok=True)
+    for dataset, filename in SOURCE_FILES.items():
+        target = os.path.join(directory, filename)
+        shutil.copyfile(os.path.join(HERE, filename), target)
+        if blank_rows:
+            with open(target, 'a') as f:
+                f.write(''.join(f"{row}\n" for row in BLANK_ROWS[dataset]))
+    return str(directory)
+
+def test_rows_without_state_or_year_are_dropped(tmp_path):
+    clean = QAEngine(copy_sources(tmp_path / 'clean'), shared_dir=None, memory_budget=0)
+    blanks = QAEngine(copy_sources(tmp_path / 'blanks', blank_rows=True), shared_dir=None, memory_budget=0)
+    assert blanks.records == clean.records
+    assert blanks.crop_df['year'].dtype.kind == 'i'
+    for question in QUESTIONS:
+        assert blanks.answer(question) == clean.answer(question)
+
+def test_streaming_drops_the_same_rows(tmp_path):
+    tables = QAEngine(copy_sources(tmp_path / 'tables', blank_rows=True), shared_dir=None, memory_budget=0)
+    clean = QAEngine(copy_sources(tmp_path / 'clean'), shared_dir=None, memory_budget=64 << 20)
+    blanks = QAEngine(copy_sources(tmp_path / 'blanks', blank_rows=True), shared_dir=None,
+                      memory_budget=64 << 20)
+    assert blanks.records == tables.records
+    for question in QUESTIONS:
+        assert blanks.answer(question) == clean.answer(question)
+
+def test_streaming_answers_percentiles(tmp_path):
+    tables = QAEngine(copy_sources(tmp_path / 'tables'), shared_dir=None, memory_budget=0)
+    streamed = QAEngine(copy_sources(tmp_path / 'streamed'), shared_dir=None, memory_budget=64 << 20)
+    for question in ["What is the median rainfall in Punjab?", "Drought years in Kerala",
+                     "Quartiles of rice production in India", "90th percentile of temperature in Bihar"]:
+        assert streamed.answer(question) == tables.answer(question)
+
+def test_fragments_fold_spellings_of_a_new_name(tmp_path):
+    clean = QAEngine(copy_sources(tmp_path / 'clean'), shared_dir=None, memory_budget=0)
+    data_dir = copy_sources(tmp_path / 'fragments')
+    os.makedirs(drop_dir(data_dir))
+    for name, state in (('a.csv', 'kerala '), ('b.csv', 'Kerala')):
+        with open(os.path.join(drop_dir(data_dir), name), 'w') as f:
+            f.write(f"State,District,Year,Rainfall_mm\n{state},Ernakulam,2024,100.0\n")
+    for budget in (None, 64 << 20):
+        engine = QAEngine(data_dir, shared_dir=None, memory_budget=budget)
+        states = [state for state in engine.all_states if state.lower() == 'kerala']
+        assert len(states) == 1
+        assert engine.records['rainfall'] == clean.records['rainfall'] + 2
+
+def test_cells_grow_within_the_room_left():
+    aggregate = DistrictAggregate('crop', {'state': {}, 'district': {}, 'crop type': {}})
+    aggregate._reserve((3, 2, 2))
+    aggregate._reserve((4, 2, 2))
+    assert aggregate.sums.shape == (6, 2, 2)
+    # Doubling to (12, 2, 2) would not fit next to the old cells; (7, 2, 2)
+    # does.
+    aggregate._reserve((7, 2, 2), room=CELL_BYTES * (6 + 7) * 4)
+    assert aggregate.sums.shape == (7, 2, 2)
+    assert aggregate.cell_bytes() == CELL_BYTES * 7 * 4
+    with pytest.raises(MemoryError, match=ENV_BUDGET):
+        aggregate._reserve((8, 2, 2), room=CELL_BYTES * (7 + 7) * 4)
+    assert aggregate.sums.shape == (7, 2, 2)
+
+def test_streaming_refuses_cells_over_the_budget(tmp_path):
+    data_dir = copy_sources(tmp_path)
+    with pytest.raises(MemoryError, match='district cells'):
+        stream_aggregates(data_dir, 100 << 10)
+    assert stream_aggregates(data_dir, 1 << 20)[-1]['within_budget']
+
+def test_budget_read_when_the_engine_is_built(tmp_path, monkeypatch):
+    data_dir = copy_sources(tmp_path)
+    monkeypatch.setenv(ENV_BUDGET, '64M')
+    assert QAEngine(data_dir, shared_dir=None).memory_budget == 64 << 20
+    assert not QAEngine(data_dir, shared_dir=None).explore('crop').rows_kept
+    assert QAEngine(data_dir, shared_dir=None, memory_budget=0).explore('crop').rows_kept
+    monkeypatch.delenv(ENV_BUDGET)
+    assert QAEngine(data_dir, shared_dir=None).explore('crop').rows_kept
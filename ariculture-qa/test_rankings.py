@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from engine import QAEngine
+from rankings import CropRankings
+from test_loading import copy_sources
+
+def crop_rows(rows):
+    return pd.DataFrame(rows, columns=['state', 'year', 'crop type', 'production volume'])
+
+BASE = crop_rows([
+    ('Punjab', 2020, 'Wheat', 300.0), ('Punjab', 2020, 'Wheat', 100.0), ('Punjab', 2020, 'Rice', 150.0),
+    ('Punjab', 2021, 'Rice', 250.0), ('Punjab', 2021, 'Maize', 50.0),
+    ('Kerala', 2020, 'Rice', 400.0), ('Kerala', 2021, 'Coconut', 80.0), ('Kerala', 2021, 'Maize', 80.0),
+])
+APPENDED = crop_rows([
+    ('Punjab', 2021, 'Maize', 950.0), ('Kerala', 2022, 'Rice', 10.0), ('Bihar', 2022, 'Wheat', 120.0),
+])
+
+def assert_same(rankings, expected):
+    assert rankings.rankings.keys() == expected.rankings.keys()
+    for key, ranking in expected.rankings.items():
+        assert [crop for crop, _ in rankings.rankings[key]] == [crop for crop, _ in ranking], key
+        assert [mean for _, mean in rankings.rankings[key]] == pytest.approx([mean for _, mean in ranking])
+
+def test_rankings_by_mean():
+    rankings = CropRankings(BASE)
+    # Wheat and Rice tie on a mean of 200: the alphabetically first wins.
+    assert rankings.ranking('Punjab') == [('Rice', 200.0), ('Wheat', 200.0), ('Maize', 50.0)]
+    assert rankings.ranking('Punjab', 2020) == [('Wheat', 200.0), ('Rice', 150.0)]
+    assert rankings.ranking(None, 2021)[0] == ('Rice', 250.0)
+    assert rankings.ranking('Bihar') == []
+
+def test_top_and_bottom_k():
+    rankings = CropRankings(BASE)
+    assert rankings.top('Punjab', k=2) == [('Rice', 200.0), ('Wheat', 200.0)]
+    assert rankings.bottom('Punjab', k=2) == [('Maize', 50.0), ('Wheat', 200.0)]
+    assert rankings.top('Kerala', 2021, k=1) == [('Coconut', 80.0)]
+    assert rankings.bottom(None, k=1) == [('Maize', 65.0)]
+    assert rankings.top('Punjab', k=10) == rankings.ranking('Punjab')
+
+def test_updated_matches_a_rebuild():
+    rankings = CropRankings(BASE)
+    before = {key: list(ranking) for key, ranking in rankings.rankings.items()}
+    updated = rankings.updated(APPENDED)
+    assert_same(updated, CropRankings(pd.concat([BASE, APPENDED], ignore_index=True)))
+    assert rankings.rankings == before
+    assert updated.top('Punjab', k=1) == [('Maize', 500.0)]
+
+def test_ranking_headings(tmp_path):
+    engine = QAEngine(copy_sources(tmp_path), shared_dir=None, memory_budget=0)
+    assert "Top crop by production" in engine.answer("Top 1 crop in Punjab")
+    assert "Bottom 2 crops by production" in engine.answer("Bottom 2 crops in Punjab")
@@ -0,0 +1,27 @@
+import pytest
+
+from engine import QAEngine
+from test_loading import copy_sources
+
+@pytest.fixture(scope='module')
+def engine(tmp_path_factory):
+    # In the shipped crop data Ludhiana appears under Karnataka, Punjab and
+    # Uttar Pradesh.
+    return QAEngine(copy_sources(tmp_path_factory.mktemp('data')), shared_dir=None, memory_budget=0)
+
+@pytest.mark.parametrize('question, handler', [
+    ("Rainfall in Punjab", 'compare_rainfall'),
+    ("Rainfall in Ludhiana", 'district_rainfall'),
+    ("Rainfall in Ludhiana, Punjab", 'district_rainfall'),
+    ("Temperature in Ludhiana, Punjab", 'district_temperature'),
+    ("Crop production in Ludhiana, Punjab", 'district_crops'),
+])
+def test_districts_route_to_district_handlers(engine, question, handler):
+    assert engine.intent(engine.parse(question)).handler == handler
+
+def test_named_state_picks_the_district(engine):
+    answer = engine.answer("Crop production in Ludhiana, Punjab")
+    assert "**Ludhiana** (Punjab)" in answer
+    assert "(Karnataka)" not in answer
+    everywhere = engine.answer("Crop production in Ludhiana")
+    assert "**Ludhiana** (Karnataka)" in everywhere and "**Ludhiana** (Punjab)" in everywhere
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from trends import SeriesTrends, fit_lines, t95
+
+YEARS = np.arange(2015, 2025)
+LINE = 10.0 + 2.0 * (YEARS - 2015)
+NOISE = np.array([0.5, -0.5, 0.25, -0.25, 0.0, 0.5, -0.5, 0.25, -0.25, 0.0])
+
+def series(*rows):
+    return np.array(rows, dtype=np.float64)
+
+def test_exact_line():
+    trends = SeriesTrends('temperature', [('Punjab', None)], YEARS, series(LINE))
+    [stats] = trends.trends([('Punjab', None)])
+    assert stats['slope'] == pytest.approx(2.0)
+    assert stats['slope_low'] == pytest.approx(2.0)
+    assert stats['slope_high'] == pytest.approx(2.0)
+    assert stats['direction'] == 'increasing'
+    assert (stats['first_year'], stats['last_year'], stats['points']) == (2015, 2024, 10)
+    assert stats['change_pct'] == pytest.approx((28.0 - 10.0) / 10.0 * 100.0)
+    [forecast] = trends.forecasts([('Punjab', None)], [2026])
+    projection = forecast['projections'][2026]
+    for name in ('linear', 'linear_low', 'linear_high', 'smoothed', 'smoothed_low', 'smoothed_high'):
+        assert projection[name] == pytest.approx(32.0), name
+
+def test_noisy_line_intervals():
+    values = LINE + NOISE
+    lines = fit_lines(series(values), YEARS)
+    slope, intercept = np.polyfit(YEARS, values, 1)
+    assert lines['slope'][0] == pytest.approx(slope)
+    assert lines['intercept'][0] == pytest.approx(intercept)
+    residuals = values - (intercept + slope * YEARS)
+    sigma = np.sqrt((residuals ** 2).sum() / 8)
+    sxx = ((YEARS - YEARS.mean()) ** 2).sum()
+    assert lines['margin'][0] == pytest.approx(2.306 * sigma / np.sqrt(sxx))
+
+    trends = SeriesTrends('temperature', [('Punjab', None)], YEARS, series(values))
+    [forecast] = trends.forecasts([('Punjab', None)], [2025, 2030])
+    near, far = forecast['projections'][2025], forecast['projections'][2030]
+    expected = intercept + slope * 2025
+    margin = 2.306 * sigma * np.sqrt(1 + 1 / 10 + (2025 - YEARS.mean()) ** 2 / sxx)
+    assert near['linear'] == pytest.approx(expected)
+    assert near['linear_low'] == pytest.approx(expected - margin)
+    assert near['linear_high'] == pytest.approx(expected + margin)
+    # Intervals widen with the horizon.
+    assert far['linear_high'] - far['linear_low'] > near['linear_high'] - near['linear_low']
+    assert far['smoothed_high'] - far['smoothed_low'] > near['smoothed_high'] - near['smoothed_low']
+
+def test_missing_years_and_short_series():
+    gappy = LINE.copy()
+    gappy[[2, 5]] = np.nan
+    short = np.full(len(YEARS), np.nan)
+    short[:2] = [1.0, 2.0]
+    keys = [('Punjab', None), ('Kerala', None)]
+    trends = SeriesTrends('temperature', keys, YEARS, series(gappy, short))
+    gappy_stats, short_stats = trends.trends(keys)
+    assert gappy_stats['slope'] == pytest.approx(2.0)
+    assert gappy_stats['points'] == 8
+    assert short_stats is None
+    assert trends.trends([('Nowhere', None)]) == [None]
+    # Refitted to the years asked for.
+    [stats] = trends.trends([('Punjab', None)], years=[2021, 2022, 2023])
+    assert (stats['first_year'], stats['last_year'], stats['points']) == (2021, 2023, 3)
+
+def test_projections_clipped_at_zero():
+    falling = 20.0 - 2.0 * (YEARS - 2015)
+    trends = SeriesTrends('rainfall', [('Punjab', None)], YEARS, series(falling))
+    [stats] = trends.trends([('Punjab', None)])
+    assert stats['direction'] == 'decreasing'
+    [forecast] = trends.forecasts([('Punjab', None)], [2030])
+    assert forecast['projections'][2030]['linear'] == 0.0
+
+def test_t95():
+    assert t95([1, 8, 30]) == pytest.approx([12.706, 2.306, 2.042])
+    assert t95([120])[0] == pytest.approx(1.98, abs=0.005)
+    assert np.isnan(t95([0])[0])
@@ -0,0 +1,37 @@
+import pytest
+
+from engine import QAEngine
+from test_loading import copy_sources
+
+@pytest.fixture(scope='module')
+def engine(tmp_path_factory):
+    # The shipped data covers 2015-2024.
+    return QAEngine(copy_sources(tmp_path_factory.mktemp('data')), shared_dir=None, memory_budget=0)
+
+@pytest.mark.parametrize('question, ranges, years', [
+    ("Rainfall in Punjab 2018-2021", [(2018, 2021)], (2018, 2019, 2020, 2021)),
+    ("Rainfall in Punjab from 2021 to 2018", [(2018, 2021)], (2018, 2019, 2020, 2021)),
+    ("Rainfall in Punjab between 2016 and 2019", [(2016, 2019)], (2016, 2017, 2018, 2019)),
+    ("Rainfall in Punjab since 2022", [(2022, None)], (2022, 2023, 2024)),
+    ("Rainfall in Punjab after 2022", [(2023, None)], (2023, 2024)),
+    ("Rainfall in Punjab before 2017", [(None, 2016)], (2015, 2016)),
+    ("Rainfall in Punjab 2013-2016", [(2013, 2016)], (2015, 2016)),
+    ("Rainfall in Punjab 1950-1960", [(1950, 1960)], ()),
+])
+def test_year_ranges(engine, question, ranges, years):
+    parsed = engine.parse(question)
+    assert parsed.year_ranges == ranges
+    assert engine.resolve_years(parsed) == years
+
+def test_last_years(engine):
+    parsed = engine.parse("Rainfall in Punjab over the last 3 years")
+    assert parsed.last_years == 3
+    assert engine.resolve_years(parsed) == (2022, 2023, 2024)
+
+def test_no_years(engine):
+    assert engine.resolve_years(engine.parse("Rainfall in Punjab")) is None
+
+def test_span_years(engine):
+    assert engine.span_years([2015], [(2023, 2030)]) == (2015, 2023, 2024)
+    assert engine.span_years((), [(2023, 2030)], horizon=2) == (2023, 2024, 2025, 2026)
+    assert engine.span_years((), [(2030, 2040)]) == ()
@@ -0,0 +1,271 @@
+import numpy as np
+
+# Trends and forecasts for every yearly series at once. A series is the yearly
+# mean of one measure for one state (or nationally): rainfall and temperature
+# per state, production per (state, crop). Each dataset's series are laid out
+# as one (series × years) matrix of yearly means, read from the state and
+# national rollups, with NaN for years a series has no rows in.
+#
+# Every series is fitted in the same few array operations, never one at a
+# time:
+#
+# - a least-squares line through the yearly means (masked sums of x, y, x², xy
+#   per row), giving the yearly change with a 95% confidence range, the
+#   percent change from the first to the last year observed, and a projection
+#   with a 95% prediction interval;
+# - Holt's linear exponential smoothing (fixed ALPHA and BETA), stepped once
+#   per year column over all rows, giving a projection that follows recent
+#   years more than old ones, with an interval from its one-step errors.
+#
+# Projections of production and rainfall are clipped at zero.
+
+MIN_POINTS = 3
+ALPHA = 0.5
+BETA = 0.3
+# Forecasts reach at most this many years past the last year in the data.
+MAX_HORIZON = 10
+NON_NEGATIVE = ('crop', 'rainfall')
+
+# Two-sided 95% quantiles of Student's t for 1-30 degrees of freedom.
+_T95 = np.array([12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+                 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+                 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042])
+
+def t95(df):
+    # Beyond 30 degrees of freedom, 1.96 + 2.4/df is within 0.005 of the
+    # exact value.
+    df = np.asarray(df, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wide = 1.96 + 2.4 / df
+    small = _T95[np.clip(df, 1, len(_T95)).astype(np.int64) - 1]
+    return np.where(df < 1, np.nan, np.where(df <= len(_T95), small, wide))
+
+def fit_lines(values, years):
+    # Least-squares line per row of `values` (series × years, NaN where a
+    # year is missing). Returns dict of per-row arrays.
+    x = np.asarray(years, dtype=np.float64)
+    mask = ~np.isnan(values)
+    y = np.where(mask, values, 0.0)
+    xs = np.where(mask, x, 0.0)
+    n = mask.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = xs.sum(axis=1) / n
+        y_mean = y.sum(axis=1) / n
+        dx = np.where(mask, x - x_mean[:, None], 0.0)
+        sxx = (dx * dx).sum(axis=1)
+        slope = (dx * (y - y_mean[:, None])).sum(axis=1) / sxx
+        intercept = y_mean - slope * x_mean
+        residuals = np.where(mask, y - intercept[:, None] - slope[:, None] * x, 0.0)
+        sigma = np.sqrt((residuals * residuals).sum(axis=1) / (n - 2))
+        margin = t95(n - 2) * sigma / np.sqrt(sxx)
+    # First and last observed year of each row; a row with none points at
+    # the NaN column appended at the end.
+    columns = np.arange(len(x))
+    first = np.where(mask, columns, len(x)).min(axis=1, initial=len(x))
+    last = np.where(n > 0, np.where(mask, columns, -1).max(axis=1, initial=-1), len(x))
+    x = np.append(x, np.nan)
+    values = np.hstack([values, np.full((len(values), 1), np.nan)])
+    rows = np.arange(len(values))
+    return {
+        'n': n, 'usable': n >= MIN_POINTS, 'slope': slope, 'intercept': intercept, 'margin': margin,
+        'sigma': sigma, 'x_mean': x_mean, 'sxx': sxx,
+        'first_year': x[first], 'last_year': x[last], 'first': values[rows, first], 'last': values[rows, last],
+    }
+
+def smooth(values, years, alpha=ALPHA, beta=BETA):
+    # Holt's linear exponential smoothing of every row, one year column at a
+    # time. The level starts at the first observation and the trend at the
+    # step to the second; missing years are skipped over, with the forecast
+    # extended across the gap. Returns each row's level and trend as of its
+    # last observed year, and the RMS of its one-step forecast errors.
+    x = np.asarray(years, dtype=np.float64)
+    rows = len(values)
+    level = np.full(rows, np.nan)
+    trend = np.zeros(rows)
+    seen = np.zeros(rows, dtype=np.int64)
+    at = np.full(rows, np.nan)
+    squared = np.zeros(rows)
+    for year, column in zip(x, values.T):
+        observed = ~np.isnan(column)
+        gap = year - at
+        first = observed & (seen == 0)
+        second = observed & (seen == 1)
+        later = observed & (seen >= 2)
+        level[first] = column[first]
+        trend[second] = (column[second] - level[second]) / gap[second]
+        level[second] = column[second]
+        error = column[later] - (level[later] + gap[later] * trend[later])
+        squared[later] += error * error
+        level[later] += gap[later] * trend[later] + alpha * error
+        trend[later] += alpha * beta * error
+        at[observed] = year
+        seen += observed
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.sqrt(squared / (seen - 2))
+    return {'level': level, 'trend': trend, 'sigma': sigma, 'errors': seen - 2, 'at': at}
+
+def _number(value):
+    value = float(value)
+    return None if np.isnan(value) else value
+
+class SeriesTrends:
+    # One dataset's series. Keys are (state, crop): state None is the
+    # national series, crop None a rainfall or temperature series.
+    def __init__(self, dataset, keys, years, values):
+        self.dataset = dataset
+        self.keys = keys
+        self.pos = {key: i for i, key in enumerate(keys)}
+        self.years = np.asarray(years, dtype=np.int64)
+        self.values = values
+        self.lines = fit_lines(values, self.years)
+        self.smoothed = smooth(values, self.years)
+        self.floor = 0.0 if dataset in NON_NEGATIVE else -np.inf
+
+    def trends(self, keys, years=None):
+        # Trend stats for each key (None where there are too few years).
+        # With `years`, the lines are refitted to those years only, for all
+        # the keys together.
+        rows = np.array([self.pos.get(key, -1) for key in keys], dtype=np.int64)
+        known = rows >= 0
+        if years is None:
+            lines = {name: values[rows] for name, values in self.lines.items()}
+        else:
+            columns = np.isin(self.years, years)
+            lines = fit_lines(self.values[rows][:, columns], self.years[columns])
+        lines['usable'] = lines['usable'] & known
+        return [self._trend(lines, i) if lines['usable'][i] else None for i in range(len(keys))]
+
+    def _trend(self, lines, i):
+        slope, margin = float(lines['slope'][i]), _number(lines['margin'][i])
+        first, last = float(lines['first'][i]), float(lines['last'][i])
+        low = high = None
+        if margin is not None:
+            low, high = slope - margin, slope + margin
+        if low is not None and low > 0:
+            direction = 'increasing'
+        elif high is not None and high < 0:
+            direction = 'decreasing'
+        else:
+            direction = 'no clear trend'
+        return {
+            'points': int(lines['n'][i]),
+            'first_year': int(lines['first_year'][i]),
+            'last_year': int(lines['last_year'][i]),
+            'first': first,
+            'last': last,
+            'slope': slope,
+            'slope_low': low,
+            'slope_high': high,
+            'change_pct': (last - first) / abs(first) * 100.0 if first else None,
+            'direction': direction,
+        }
+
+    def forecasts(self, keys, targets):
+        # Projections of each key to the target years from its whole history
+        # (None where there are too few years).
+        rows = np.array([self.pos.get(key, -1) for key in keys], dtype=np.int64)
+        usable = (rows >= 0) & self.lines['usable'][rows]
+        rows = np.where(usable, rows, 0)
+        targets = np.asarray(targets, dtype=np.float64)
+        lines = self.lines
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Linear: prediction interval of a new yearly mean.
+            linear = lines['intercept'][rows, None] + lines['slope'][rows, None] * targets
+            spread = np.sqrt(1.0 + 1.0 / lines['n'][rows, None]
+                             + (targets - lines['x_mean'][rows, None]) ** 2 / lines['sxx'][rows, None])
+            linear_margin = (t95(lines['n'][rows] - 2) * lines['sigma'][rows])[:, None] * spread
+            # Holt: h-step variance sigma² (1 + Σ_{j<h} α² (1 + jβ)²).
+            smoothed = self.smoothed
+            steps = targets - smoothed['at'][rows, None]
+            projected = smoothed['level'][rows, None] + steps * smoothed['trend'][rows, None]
+            h = np.maximum(steps, 1.0)
+            j = h - 1.0
+            growth = ALPHA * ALPHA * (j + BETA * j * (j + 1.0) + BETA * BETA * j * (j + 1.0) * (2.0 * j + 1.0) / 6.0)
+            smoothed_margin = (t95(smoothed['errors'][rows]) * smoothed['sigma'][rows])[:, None] * np.sqrt(1.0 + growth)
+        results = []
+        for i, key in enumerate(keys):
+            if not usable[i]:
+                results.append(None)
+                continue
+            row = rows[i]
+            projections = {}
+            for t, year in enumerate(targets):
+                projections[int(year)] = {
+                    'linear': self._clip(linear[i, t]),
+                    'linear_low': self._clip(linear[i, t] - linear_margin[i, t]),
+                    'linear_high': self._clip(linear[i, t] + linear_margin[i, t]),
+                    'smoothed': self._clip(projected[i, t]),
+                    'smoothed_low': self._clip(projected[i, t] - smoothed_margin[i, t]),
+                    'smoothed_high': self._clip(projected[i, t] + smoothed_margin[i, t]),
+                }
+            results.append({
+                'points': int(lines['n'][row]),
+                'first_year': int(lines['first_year'][row]),
+                'last_year': int(lines['last_year'][row]),
+                'last': float(lines['last'][row]),
+                'projections': projections,
+            })
+        return results
+
+    def _clip(self, value):
+        value = float(value)
+        return None if np.isnan(value) else max(value, self.floor)
+
+    def dashboard(self, years=None):
+        # Every series' trend, keyed like the rollups: state -> stats for a
+        # measure, state -> crop -> stats for production; 'India' is the
+        # national series.
+        result = {}
+        for (state, crop), stats in zip(self.keys, self.trends(self.keys, years)):
+            if stats is None:
+                continue
+            label = state if state is not None else 'India'
+            if crop is None:
+                result[label] = stats
+            else:
+                result.setdefault(label, {})[crop] = stats
+        return result
+
+def _series_from_rollup(rollup, by_crop):
+    # (keys, {key: {year: mean}}) from the state and national levels
+    series = {}
+    for state, node in rollup['state'].items():
+        if by_crop:
+            for crop, years in node.items():
+                series[(state, crop)] = years
+        else:
+            series[(state, None)] = node
+    if by_crop:
+        for crop, years in rollup['national'].items():
+            series[(None, crop)] = years
+    else:
+        series[(None, None)] = rollup['national']
+    return series
+
+def series_matrix(series):
+    # (keys, years, matrix of yearly means) for {key: {year: (sum, count,
+    # min, max)}}. The cells are gathered into flat arrays and scattered into
+    # the matrix in one assignment.
+    keys = sorted(series, key=lambda key: (key[0] is None, key[0] or '', key[1] or ''))
+    years = sorted({year for cells in series.values() for year in cells})
+    year_pos = {year: j for j, year in enumerate(years)}
+    rows, columns, sums, counts = [], [], [], []
+    for i, key in enumerate(keys):
+        for year, (total, count, _, _) in series[key].items():
+            rows.append(i)
+            columns.append(year_pos[year])
+            sums.append(total)
+            counts.append(count)
+    values = np.full((len(keys), len(years)), np.nan)
+    counts = np.asarray(counts, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values[rows, columns] = np.where(counts > 0, np.asarray(sums, dtype=np.float64) / counts, np.nan)
+    return keys, years, values
+
+def build_trends(rollups):
+    # dataset -> SeriesTrends for all of its series
+    trends = {}
+    for dataset, rollup in rollups.items():
+        keys, years, values = series_matrix(_series_from_rollup(rollup, dataset == 'crop'))
+        trends[dataset] = SeriesTrends(dataset, keys, years, values)
+    return trends